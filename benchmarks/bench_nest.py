@@ -0,0 +1,53 @@
+# Copyright (c) 2018-2020 Patricio Cubillos.
+# bibmanager is open-source software under the MIT license (see LICENSE).
+
+"""
+Benchmark of utils.nest() against the former character-by-character
+implementation, on the entries of examples/sample.bib replicated up
+to a given number of entries (default: 100k).
+
+Usage:
+  python benchmarks/bench_nest.py [nentries]
+"""
+
+import sys
+import timeit
+
+import numpy as np
+
+import bibmanager.bib_manager as bm
+import bibmanager.utils as u
+
+
+def loop_nest(text):
+  """Former (pure-python loop) implementation of utils.nest()."""
+  counts = np.zeros(len(text), int)
+  for i,s in enumerate(text[:-1]):
+      if s == "{":
+          counts[i+1] = counts[i] + 1
+      elif s == "}":
+          counts[i+1] = counts[i] - 1
+      else:
+          counts[i+1] = counts[i]
+  return counts
+
+
+def main(nentries=100000):
+  sample = [bib.content for bib in bm.loadfile(u.ROOT+'examples/sample.bib')]
+  entries = (sample * (nentries//len(sample) + 1))[:nentries]
+  nchars = sum(len(entry) for entry in entries)
+  print(f"Benchmark nest() on {nentries} entries ({nchars} characters):")
+
+  for entry in sample:
+      np.testing.assert_array_equal(u.nest(entry), loop_nest(entry))
+
+  times = {}
+  for name, func in [('loop', loop_nest), ('vectorized', u.nest)]:
+      times[name] = timeit.timeit(
+          lambda: [func(entry) for entry in entries], number=1)
+      print(f"  {name:10}: {times[name]:8.3f} s")
+  print(f"  speedup   : {times['loop']/times['vectorized']:8.1f}x")
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:2]])
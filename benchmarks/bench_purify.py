@@ -0,0 +1,46 @@
+# Copyright (c) 2018-2020 Patricio Cubillos.
+# bibmanager is open-source software under the MIT license (see LICENSE).
+
+"""
+Microbenchmark of utils.purify() against the former multi-pass
+implementation, on the author names of examples/sample.bib replicated
+up to a given number of names (default: 100k).  The name caches are
+disabled, such that every call runs the transliteration.
+
+The former implementation is imported from the purify() tests
+(tests/test_utils.py), hence run the benchmark from the repository
+root.
+
+Usage:
+  PYTHONPATH=. python benchmarks/bench_purify.py [nnames]
+"""
+
+import sys
+import timeit
+
+import bibmanager.bib_manager as bm
+import bibmanager.utils as u
+from tests.test_utils import legacy_purify
+
+
+def main(nnames=100000):
+  bibs = bm.loadfile(u.ROOT+'examples/sample.bib')
+  sample = [author.last for bib in bibs for author in bib.authors]
+  sample += [author.first for bib in bibs for author in bib.authors]
+  names = (sample * (nnames//len(sample) + 1))[:nnames]
+  print(f"Benchmark purify() on {nnames} names:")
+
+  u.set_name_cache(0)
+  for german in [False, True]:
+      times = {}
+      for label, func in [('legacy', legacy_purify), ('compiled', u.purify)]:
+          times[label] = timeit.timeit(
+              lambda: [func(name, german) for name in names], number=1)
+          print(f"  {label:8} (german={german!s:5}): {times[label]:7.3f} s")
+      print(f"  speedup  (german={german!s:5}): "
+            f"{times['legacy']/times['compiled']:7.1f}x")
+  u.set_name_cache()
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,50 @@
+# Copyright (c) 2018-2020 Patricio Cubillos.
+# bibmanager is open-source software under the MIT license (see LICENSE).
+
+"""
+Benchmark of sorting Bib() objects with Bib.__lt__() comparisons
+(sorted(bibs)) against the key-based bib_manager.sort_bibs(), on the
+entries of examples/sample.bib replicated up to a given number of
+entries (default: 100k), with shuffled last names, initials, and years.
+
+Usage:
+  python benchmarks/bench_sort.py [nentries]
+"""
+
+import copy
+import random
+import sys
+import timeit
+
+import bibmanager.bib_manager as bm
+import bibmanager.bib_manager.bib_manager as bib_manager
+import bibmanager.utils as u
+
+
+def main(nentries=100000):
+  random.seed(314)
+  sample = bm.loadfile(u.ROOT+'examples/sample.bib')
+  lasts = [bib.sort_author.last for bib in sample]
+  firsts = [bib.sort_author.first for bib in sample] + ['a', 'ab', 'b']
+  bibs = []
+  for i in range(nentries):
+      bib = copy.copy(sample[i % len(sample)])
+      bib.sort_author = bib.sort_author._replace(
+          last=random.choice(lasts) + str(random.randrange(nentries//100)),
+          first=random.choice(firsts),
+          year=random.randrange(1900, 2021))
+      bib.sort_key = bib_manager.sort_key(bib.sort_author)
+      bibs.append(bib)
+  print(f"Benchmark sorting of {nentries} entries:")
+
+  times = {}
+  for label, func in [
+          ('__lt__', lambda: sorted(bibs)),
+          ('sort_key', lambda: bib_manager.sort_bibs(list(bibs)))]:
+      times[label] = timeit.timeit(func, number=1)
+      print(f"  {label:8}: {times[label]:7.3f} s")
+  print(f"  speedup : {times['__lt__']/times['sort_key']:7.1f}x")
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:2]])
@@ -3,6 +3,7 @@
 
 import os
 import re
+import json
 import argparse
 import textwrap
 from datetime import date
@@ -32,6 +33,9 @@ BibTeX Database Management:
   search      Search entries in the bibmanager database.
   export      Export the bibmanager database into a bib file.
   cleanup     Clean up a bibtex file of duplicates and outdated entries.
+  compact     Compact the bibmanager database.
+  dedup       Find (and resolve) duplicate entries in the bibmanager database.
+  resolve     Resolve the conflicts reported by an unattended merge.
   config      Manage the bibmanager configuration parameters.
 
 LaTeX Management:
@@ -90,8 +94,14 @@ def cli_merge(args):
         return
     if args.bibfile is not None:
         args.bibfile = os.path.realpath(args.bibfile)
-    bm.merge(bibfile=args.bibfile, take=args.take)
+    bm.merge(bibfile=args.bibfile, take=args.take, workers=args.jobs,
+        report=args.report)
     print(f"\nMerged BibTeX file '{args.bibfile}' into bibmanager database.")
+    if args.report is not None:
+        with open(args.report, 'r') as f:
+            nconflicts = len(json.load(f)['conflicts'])
+        print(f"Reported {nconflicts} unresolved "
+              f"conflict{'s' if nconflicts != 1 else ''} into '{args.report}'.")
 
 
 def cli_edit(args):
@@ -106,55 +116,67 @@ def cli_add(args):
 
 def cli_search(args):
     """Command-line interface for search call."""
-    bibs = bm.load()
-    completer = u.KeyWordCompleter(u.search_keywords, bibs)
-    suggester = u.AutoSuggestKeyCompleter()
-    validator = u.AlwaysPassValidator(bibs,
-        "(Press 'tab' for autocomplete)")
-
-    session = prompt_toolkit.PromptSession(
-        history=FileHistory(u.BM_HISTORY_SEARCH()))
-    inputs = session.prompt(
-        "(Press 'tab' for autocomplete)\n",
-        auto_suggest=suggester,
-        completer=completer,
-        complete_while_typing=False,
-        validator=validator,
-        validate_while_typing=True,
-        bottom_toolbar=validator.bottom_toolbar)
-
-    # Parse inputs:
-    authors  = re.findall(r'author:"([^"]+)', inputs)
-    title_kw = re.findall(r'title:"([^"]+)', inputs)
-    years    = re.search(r'year:[\s]*([^\s]+)', inputs)
-    key      = re.findall(r'key:[\s]*([^\s]+)', inputs)
-    bibcode  = re.findall(r'bibcode:[\s]*([^\s]+)', inputs)
-    if years is not None:
-        years = years.group(1)
-    if len(key) == 0:
-        key = None
-    if len(bibcode) == 0:
-        bibcode = None
-
-    # Cast year string to integer or list of integers:
-    if years is None:
-        pass
-    elif len(years) == 4 and years.isnumeric():
-        years = int(years)
-    elif len(years) == 5 and years.startswith('-') and years[1:].isnumeric():
-        years = [0, int(years[1:])]
-    elif len(years) == 5 and years.endswith('-') and years[0:4].isnumeric():
-        years = [int(years[0:4]), 9999]
-    elif len(years) == 9 and years[0:4].isnumeric() and years[5:].isnumeric():
-        years = [int(years[0:4]), int(years[5:9])]
+    if args.ranked:
+        session = prompt_toolkit.PromptSession(
+            history=FileHistory(u.BM_HISTORY_SEARCH()))
+        inputs = session.prompt(
+            "(Enter words to rank entries by relevance)\n")
+        if inputs.strip() == '':
+            return
+        matches = bm.ranked_search(inputs)
     else:
-        print(f"\nInvalid format for input year: {years}")
-        return
+        bibs = bm.load()
+        completer = u.KeyWordCompleter(u.search_keywords, bibs)
+        suggester = u.AutoSuggestKeyCompleter()
+        validator = u.AlwaysPassValidator(bibs,
+            "(Press 'tab' for autocomplete)")
 
-    if (len(authors) == 0 and len(title_kw) == 0
-        and years is None and key is None and bibcode is None):
-        return
-    matches = bm.search(authors, years, title_kw, key, bibcode)
+        session = prompt_toolkit.PromptSession(
+            history=FileHistory(u.BM_HISTORY_SEARCH()))
+        inputs = session.prompt(
+            "(Press 'tab' for autocomplete)\n",
+            auto_suggest=suggester,
+            completer=completer,
+            complete_while_typing=False,
+            validator=validator,
+            validate_while_typing=True,
+            bottom_toolbar=validator.bottom_toolbar)
+
+        # Parse inputs:
+        authors  = re.findall(r'author:"([^"]+)', inputs)
+        title_kw = re.findall(r'title:"([^"]+)', inputs)
+        years    = re.search(r'year:[\s]*([^\s]+)', inputs)
+        key      = re.findall(r'key:[\s]*([^\s]+)', inputs)
+        bibcode  = re.findall(r'bibcode:[\s]*([^\s]+)', inputs)
+        if years is not None:
+            years = years.group(1)
+        if len(key) == 0:
+            key = None
+        if len(bibcode) == 0:
+            bibcode = None
+
+        # Cast year string to integer or list of integers:
+        if years is None:
+            pass
+        elif len(years) == 4 and years.isnumeric():
+            years = int(years)
+        elif (len(years) == 5 and years.startswith('-')
+              and years[1:].isnumeric()):
+            years = [0, int(years[1:])]
+        elif (len(years) == 5 and years.endswith('-')
+              and years[0:4].isnumeric()):
+            years = [int(years[0:4]), 9999]
+        elif (len(years) == 9 and years[0:4].isnumeric()
+              and years[5:].isnumeric()):
+            years = [int(years[0:4]), int(years[5:9])]
+        else:
+            print(f"\nInvalid format for input year: {years}")
+            return
+
+        if (len(authors) == 0 and len(title_kw) == 0
+            and years is None and key is None and bibcode is None):
+            return
+        matches = bm.search(authors, years, title_kw, key, bibcode)
 
     # Display outputs depending on the verb level:
     if args.verb >= 3:
@@ -208,6 +230,50 @@ def cli_cleanup(args):
     bm.export(bibs, args.bibfile)
 
 
+def cli_compact(args):
+    """Command-line interface for compact call."""
+    bm.compact()
+    print("Compacted the bibmanager database.")
+
+
+def cli_dedup(args):
+    """Command-line interface for dedup call."""
+    clusters = bm.dedup(resolve=args.resolve, titles=args.titles)
+    if len(clusters) == 0:
+        print("No duplicate entries found in the bibmanager database.")
+        return
+
+    # Entries of unresolved clusters remain in the database:
+    keys = {bib.key for bib in bm.load()} if args.resolve else set()
+    nclusters = len(clusters)
+    print(f"Found {nclusters} cluster{'s' if nclusters != 1 else ''} "
+           "of duplicate entries:")
+    nremoved = 0
+    for i,cluster in enumerate(clusters):
+        print(f"\nCluster {i+1}:")
+        resolved = any(bib.key not in keys for bib in cluster[1:])
+        for j,bib in enumerate(cluster):
+            kept = "  (kept)" if args.resolve and resolved and j == 0 else ""
+            print(f"  {bib.key}{kept}")
+        if args.resolve and resolved:
+            nremoved += len(cluster) - 1
+        elif args.resolve:
+            print("  (unresolved, linked only through the titles)")
+    if args.resolve:
+        print(f"\nRemoved {nremoved} duplicate "
+              f"entr{'ies' if nremoved != 1 else 'y'}.")
+
+
+def cli_resolve(args):
+    """Command-line interface for resolve call."""
+    if not os.path.exists(args.report):
+        print(f"\nError: Input report file '{args.report}' does not exist.")
+        return
+    nresolved = bm.resolve(args.report)
+    print(f"\nResolved {nresolved} "
+          f"conflict{'s' if nresolved != 1 else ''} from '{args.report}'.")
+
+
 def cli_config(args):
     """Command-line interface for config call."""
     try:
@@ -515,7 +581,15 @@ Description
 
   Additionally, bibmanager considers two more cases (always asking):
   (1) new entry has duplicate key but different content, and
-  (2) new entry has duplicate title but different key."""
+  (2) new entry has duplicate title but different key.
+
+  For large BibTeX files, set the '--jobs' argument to parse the
+  entries in parallel with N processes.
+
+  Set the '--report' argument to merge without any prompt (e.g., for
+  scripted imports): every conflict is left unresolved (keeping the
+  database entry and ignoring the new one), and recorded into a JSON
+  report file, to be resolved later with 'bibm resolve'."""
     merge = sp.add_parser('merge', description=merge_description,
         formatter_class=argparse.RawDescriptionHelpFormatter)
     merge.add_argument("bibfile", action="store",
@@ -523,6 +597,12 @@ Description
     merge.add_argument("take", action="store", nargs='?', metavar='take',
         help="Decision protocol for duplicates (choose: {%(choices)s}, "
         "default: %(default)s)", choices=['old','new','ask'], default='old')
+    merge.add_argument('-j', '--jobs', action='store', type=int,
+        default=None, metavar='N',
+        help="Number of processes to parse the BibTeX file in parallel.")
+    merge.add_argument('-r', '--report', action='store', default=None,
+        metavar='FILE',
+        help="Merge without prompting, write the conflicts into FILE.")
     merge.set_defaults(func=cli_merge)
 
 
@@ -581,6 +661,10 @@ Description
   whereas multiple-key querries and multiple-bibcode querries act with OR
   logic (see examples below).
 
+  With the '-r' argument, the prompt takes free-text words instead, and
+  displays the entries most relevant to them (at most 20), ranked by
+  their BM25 score over the title, abstract, and keywords fields.
+
   There are four levels of verbosity (see examples below):
   - zero shows the title, year, first author, and key;
   - one adds the ADS and arXiv urls;
@@ -635,6 +719,10 @@ Examples
   bibm search
   bibcode:1917PASP...29..206C bibcode:1918ApJ....48..154S
 
+  # Rank entries by relevance to free-text words:
+  bibm search -r
+  exoplanet atmospheric circulation
+
   # Use '-v' argument to increase verbosity, for example:
   # Display title, year, first author, and all keys/urls:
   bibm search -v
@@ -647,10 +735,12 @@ Examples
   author:"Burbidge, E"
 """
     search = sp.add_parser('search', description=search_description,
-        usage="bibm search [-h] [-v]",
+        usage="bibm search [-h] [-v] [-r]",
         formatter_class=argparse.RawDescriptionHelpFormatter)
     search.add_argument('-v', '--verb', action='count', default=0,
         help='Set output verbosity.')
+    search.add_argument('-r', '--ranked', action='store_true', default=False,
+        help='Rank entries by relevance to free-text words.')
     search.set_defaults(func=cli_search)
 
 
@@ -693,6 +783,81 @@ Examples
     cleanup.set_defaults(func=cli_cleanup)
 
 
+    compact_description = f"""
+{u.BOLD}Compact the bibmanager database.{u.END}
+
+Description
+  Under the default 'pickle' storage, bibmanager records single-entry
+  changes (e.g., linking a PDF file, or merging a few new entries)
+  into a journal next to the database file, and folds them into the
+  database once the journal grows large.  This command folds the
+  journal into the database right away.
+
+  Under the 'sqlite' storage, this command rebuilds the database file
+  to reclaim any unused space."""
+    compact = sp.add_parser('compact', description=compact_description,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    compact.set_defaults(func=cli_compact)
+
+
+    dedup_description = f"""
+{u.BOLD}Find (and resolve) duplicate entries in the bibmanager database.{u.END}
+
+Description
+  This command finds clusters of duplicate entries in the bibmanager
+  database, i.e., entries sharing a DOI, ISBN, ADS bibcode, arXiv
+  eprint, or title (compared in lower case and ignoring punctuation),
+  either directly or through other entries of the cluster.
+
+  By default, the command only reports the clusters.  With the
+  '--resolve' argument, keep in each cluster the entry with the
+  highest published status (peer-reviewed over arXiv over non-ADS),
+  and remove the other entries from the database.  Clusters linked
+  only through their titles are left unresolved, since different
+  entries can share a generic title (e.g., 'Erratum'), unless the
+  '--titles' argument is set.
+
+Examples
+  # Report duplicate entries:
+  bibm dedup
+
+  # Remove duplicate entries:
+  bibm dedup --resolve
+
+  # Remove duplicate entries, including entries with a same title:
+  bibm dedup --resolve --titles"""
+    dedup = sp.add_parser('dedup', description=dedup_description,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    dedup.add_argument('-r', '--resolve', action='store_true', default=False,
+        help="Remove the duplicates, keeping one entry per cluster.")
+    dedup.add_argument('-t', '--titles', action='store_true', default=False,
+        help="Also resolve clusters linked only through their titles.")
+    dedup.set_defaults(func=cli_dedup)
+
+
+    resolve_description = f"""
+{u.BOLD}Resolve the conflicts reported by an unattended merge.{u.END}
+
+Description
+  This command takes a JSON report file written by 'bibm merge
+  --report' and asks the user (through the prompt, displaying the
+  alternatives) how to resolve each of the recorded conflicts, as a
+  regular merge would, then updates the bibmanager database.
+
+  Conflicts whose database entry is no longer in the database are
+  skipped.
+
+Examples
+  # Merge unattended, then resolve the conflicts:
+  bibm merge my_file.bib ask --report conflicts.json
+  bibm resolve conflicts.json"""
+    resolve = sp.add_parser('resolve', description=resolve_description,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    resolve.add_argument("report", action="store",
+        help="Path to an existing JSON report file.")
+    resolve.set_defaults(func=cli_resolve)
+
+
     config_description = f"""
 {u.BOLD}Manage the bibmanager configuration parameters.{u.END}
 
@@ -705,6 +870,7 @@ Description
   - ads_token   sets the token required for ADS requests.
   - ads_display sets the number of entries to show at once for ADS searches.
   - home        sets the Bibmanager home directory.
+  - storage     sets the storage backend of the database (pickle or sqlite).
 
   The number of arguments determines the action of this command (see
   examples below):
@@ -6,17 +6,25 @@ __all__ = [
     'display_bibs',
     'remove_duplicates',
     'filter_field',
+    'iter_bibfile',
+    'find_entries',
     'loadfile',
     'save',
     'load',
+    'upsert',
+    'compact',
+    'dedup',
+    'resolve',
     'find',
     'get_version',
     'export',
+    'update_bibfile',
     'merge',
     'init',
     'add_entries',
     'edit',
     'search',
+    'ranked_search',
     'prompt_search',
 ]
 
@@ -25,9 +33,21 @@ import sys
 import shutil
 import datetime
 import re
+import math
+import heapq
+import itertools
 import pickle
+import struct
+import hashlib
+import json
+import sqlite3
 import urllib
+import zlib
 import subprocess
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, contextmanager
+from collections import namedtuple, Counter
 
 import numpy as np
 import prompt_toolkit
@@ -49,6 +69,114 @@ lexer = prompt_toolkit.lexers.PygmentsLexer(BibTeXLexer)
 months  = {"jan":1, "feb":2, "mar":3, "apr": 4, "may": 5, "jun":6,
            "jul":7, "aug":8, "sep":9, "oct":10, "nov":11, "dec":12}
 
+# Header of pickle database files: magic, file-format version,
+# number of entries, SHA-256 of the payload, and length of the
+# bibmanager version string (which follows the header):
+db_magic  = b'BIBMDB\x00\x00'
+db_format = 1
+db_header = struct.Struct('<8sHQ32sB')
+Db_header = namedtuple('Db_header', 'format version nentries hash')
+
+# Minimum number of entries to parse BibTeX files in parallel:
+parallel_min_entries = 1000
+
+# Fields identifying duplicate entries in the database:
+dedup_fields = ['doi', 'isbn', 'bibcode', 'eprint', 'title']
+
+# MinHash signature size, number of LSH bands, and minimum (estimated)
+# Jaccard similarity of near-duplicate titles:
+minhash_size = 64
+lsh_bands = 16
+near_duplicate_threshold = 0.6
+minhash_prime = 2**31 - 1
+minhash_coeffs = np.random.RandomState(2**16+1).randint(
+    1, minhash_prime, (2, minhash_size)).astype(np.uint64)
+
+# Maximum number of new entries to merge by sorted insertion (rather
+# than by sorting the whole database):
+insort_max_entries = 64
+
+# Location, hash, meta info, and identifiers of an entry in a .bib file:
+Entry_offset = namedtuple('Entry_offset',
+    'start end hash pdf freeze key bibcode doi eprint isbn')
+# Maximum number of .bib files with a persisted entry-offset index:
+offsets_max_files = 16
+
+# Maximum number of parsed entries in the persistent parse cache,
+# minimum number of entries of a load to use it (smaller loads are
+# parsed directly), and format of its Bib() objects (to be increased
+# whenever Bib() parses entries differently, which invalidates it):
+parse_cache_size = 65536
+parse_cache_min_entries = 100
+parse_cache_format = 1
+# Number of entries read (and parsed) at a time when loading a file:
+parse_chunk_entries = 4096
+
+# Append-only journal of changes to a pickle database, compacted
+# into the database file once it grows beyond journal_min_size bytes
+# and beyond journal_ratio times the size of the database file:
+journal_min_size = 1048576
+journal_ratio = 0.5
+
+# First bytes of any SQLite database file:
+sqlite_magic = b'SQLite format 3\x00'
+# Indexed identifier columns of the SQLite storage:
+sqlite_fields = ['key', 'bibcode', 'doi', 'eprint', 'isbn', 'year']
+# Maximum number of keys to select from the SQLite storage at once:
+sqlite_max_keys = 900
+
+# Maximum number of candidate entries of a search to check directly
+# against the remaining filters (rather than through their indices):
+search_check_max = 64
+# Maximum number of matches of a search to take from the exported
+# database bibfile (rather than by loading the pickle database):
+search_exported_max = 256
+
+# Fields scored by ranked searches, BM25 parameters (term-frequency
+# saturation and length normalization), and default number of results:
+ranked_fields = ['title', 'abstract', 'keywords']
+bm25_k1 = 1.5
+bm25_b = 0.75
+ranked_results = 20
+
+# Persisted database indices already read in this session, by name:
+loaded_indices = {}
+
+# Spans of the chunks of the exported database bibfile by digest, as
+# read in this session from the index of the last export:
+exported_chunks = {}
+
+
+def sort_key(sort_author):
+  """
+  Sorting key of a Sort_author: last name, first initial, initials,
+  von, jr, year, and month (see sort_bibs()).
+  """
+  return (sort_author.last, sort_author.first[0:1], sort_author.first,
+          sort_author.von, sort_author.jr, sort_author.year, sort_author.month)
+
+
+def author_name(author):
+  """
+  Purified last name, initials, von, and jr parts of an Author
+  (as compared by Bib.__contains__()).
+  """
+  return (u.purify(author.last), u.initials(author.first),
+          u.purify(author.von), u.purify(author.jr))
+
+
+def author_match(query, name):
+  """
+  Check whether a purified author name (see author_name()) matches a
+  purified query name: same last name, and same initials, von, and jr
+  parts where these are given in the query.
+  """
+  last, first, von, jr = query
+  return (name[0] == last
+      and (len(jr) == 0 or name[3] == jr)
+      and (len(von) == 0 or name[2] == von)
+      and name[1][0:len(first)] == first)
+
 
 class Bib(object):
   """
@@ -102,6 +230,7 @@ class Bib(object):
       self.pdf      = pdf
       self.freeze   = freeze
 
+      first_author = None
       fields = u.get_fields(self.content)
       self.key = next(fields)
 
@@ -111,11 +240,16 @@ class Bib(object):
               self.title = " ".join(re.sub("({|})", "", value).split())
 
           elif key == "author":
-              # Parse authors finding all non-brace-nested 'and' instances:
-              authors, nests = u.cond_split(value.replace("\n"," "), " and ",
-                                  nested=nested, ret_nests=True)
-              self.authors = [u.parse_name(author, nested)
-                              for author,nested in zip(authors,nests)]
+              # Parse only the first author (up to the first
+              # non-brace-nested 'and'), the full author list is parsed
+              # on first access:
+              names = value.replace("\n"," ")
+              end = len(names)
+              for m in re.finditer(" and ", names):
+                  if nested[m.start(0)] == nested[0]:
+                      end = m.start(0)
+                      break
+              first_author = u.parse_name(names[:end], nested[:end])
 
           elif key == "year":
               r = re.search('[0-9]{4}', value)
@@ -149,19 +283,58 @@ class Bib(object):
           elif key == "isbn":
               self.isbn = value.lower().strip()
 
-      for attr in ['authors', 'title', 'year']:
-          if not hasattr(self, attr):
-              raise ValueError(f"Bibtex entry '{self.key}' is missing author, "
-                                "title, or year.")
+      if first_author is None or 'title' not in self.__dict__ \
+              or 'year' not in self.__dict__:
+          raise ValueError(f"Bibtex entry '{self.key}' is missing author, "
+                            "title, or year.")
       # First-author fields used for sorting:
       # Note this differs from Author[0], since fields are 'purified',
       # and 'first' goes only by initials().
-      self.sort_author = u.Sort_author(u.purify(self.authors[0].last),
-                                       u.initials(self.authors[0].first),
-                                       u.purify(self.authors[0].von),
-                                       u.purify(self.authors[0].jr),
+      self.sort_author = u.Sort_author(u.purify(first_author.last),
+                                       u.initials(first_author.first),
+                                       u.purify(first_author.von),
+                                       u.purify(first_author.jr),
                                        self.year,
                                        self.month)
+      self.sort_key = sort_key(self.sort_author)
+
+  def __getattr__(self, attr):
+      """
+      Parse the list of authors from the content on first access (and
+      get the sort key of entries pickled without it).  Attributes are
+      read from the instance's __dict__, such that this also works on
+      partially initialized (e.g., unpickling) objects.
+      """
+      state = self.__dict__
+      if attr == 'sort_key' and 'sort_author' in state:
+          state['sort_key'] = sort_key(state['sort_author'])
+          return state['sort_key']
+      if attr != 'authors' or 'content' not in state:
+          raise AttributeError(
+              f"'{type(self).__name__}' object has no attribute '{attr}'")
+      authors = []
+      fields = u.get_fields(state['content'])
+      next(fields)
+      for key, value, nested in fields:
+          if key == "author":
+              names, nests = u.cond_split(value.replace("\n"," "), " and ",
+                                 nested=nested, ret_nests=True)
+              authors = [u.parse_name(author, nested)
+                         for author,nested in zip(names,nests)]
+      state['authors'] = authors
+      return authors
+
+  def __getstate__(self):
+      """
+      Pickle without the (lazily parsed) list of authors.  Hence, the
+      authors of loaded entries are parsed again on first access: scans
+      over the authors of the whole database re-parse every entry,
+      whereas author searches use the persisted index of purified names
+      (see author_index()).
+      """
+      state = dict(self.__dict__)
+      state.pop('authors', None)
+      return state
 
   def update_content(self, other):
       """Update the bibtex content of self with that of other."""
@@ -170,6 +343,12 @@ class Bib(object):
       for key,val in other.__dict__.items():
           if key in self.__dict__ and not (key in non_bibtex and val is None):
               setattr(self, key, val)
+      # Drop authors parsed from the old content:
+      if 'authors' not in other.__dict__:
+          self.__dict__.pop('authors', None)
+      else:
+          self.authors = other.authors
+      self.sort_key = sort_key(self.sort_author)
 
   def update_key(self, new_key):
       """Update key with new_key, making sure to also update content."""
@@ -232,22 +411,9 @@ class Bib(object):
       else:
           authors = self.authors
       # Parse and purify input author name:
-      author = u.parse_name(author)
-      first  = u.initials(author.first)
-      von    = u.purify(author.von)
-      last   = u.purify(author.last)
-      jr     = u.purify(author.jr)
-      # Remove non-matching authors by each non-empty field:
-      if len(jr) > 0:
-          authors = [author for author in authors if jr  == u.purify(author.jr)]
-      if len(von) > 0:
-          authors = [author for author in authors
-                     if von == u.purify(author.von)]
-      if len(first) > 0:
-          authors = [author for author in authors
-                     if first == u.initials(author.first)[0:len(first)]]
-      authors = [author for author in authors if last == u.purify(author.last)]
-      return len(authors) >= 1
+      query = author_name(u.parse_name(author))
+      return any(author_match(query, author_name(author))
+                 for author in authors)
 
   # https://docs.python.org/3.6/library/stdtypes.html
   def __lt__(self, other):
@@ -315,6 +481,103 @@ class Bib(object):
       return u.get_authors(self.authors, format)
 
 
+def sort_bibs(bibs):
+  """
+  Sort a list of Bib() objects in place by their precomputed sort
+  keys, reproducing the order of Bib.__lt__() without calling it.
+
+  Bib.__lt__() compares only the first initial (and then von, jr,
+  year, and month) when one of the entries has a single initial, but
+  all the initials otherwise.  Thus, in each group of entries sharing
+  the last name and first initial with a single-initial entry, the
+  entries with more initials are sorted by their initials, the
+  single-initial entries by von, jr, year, and month, and these two
+  sequences are merged by von, jr, year, and month (see
+  merge_initials()).  The other entries are sorted by their keys.
+
+  Parameters
+  ----------
+  bibs: List of Bib() objects
+      Entries to sort.
+
+  Returns
+  -------
+  bibs: List of Bib() objects
+      The input list, sorted.
+  """
+  bibs.sort(key=lambda bib: bib.sort_key)
+  single = {bib.sort_key[0:2] for bib in bibs if len(bib.sort_key[2]) == 1}
+  if len(single) == 0:
+      return bibs
+  merged = []
+  for group, entries in itertools.groupby(
+          bibs, key=lambda bib: bib.sort_key[0:2]):
+      entries = list(entries)
+      merged += merge_initials(entries) if group in single else entries
+  bibs[:] = merged
+  return bibs
+
+
+def merge_initials(group):
+  """
+  Order a group of entries sharing the last name and first initial
+  (sorted by their keys) as Bib.__lt__() does: merge the entries with
+  several initials (in their order) with the single-initial entries
+  (sorted by von, jr, year, and month), comparing by von, jr, year,
+  and month.
+  """
+  singles = sorted((bib for bib in group if len(bib.sort_key[2]) == 1),
+                   key=lambda bib: bib.sort_key[3:])
+  merged = []
+  i = 0
+  for bib in group:
+      if len(bib.sort_key[2]) == 1:
+          continue
+      while i < len(singles) and singles[i].sort_key[3:] < bib.sort_key[3:]:
+          merged.append(singles[i])
+          i += 1
+      merged.append(bib)
+  return merged + singles[i:]
+
+
+def insort_bibs(bibs, new):
+  """
+  Insert entries into a sorted list of Bib() objects (in place), by
+  bisection on the sort keys.  Each new entry re-sorts only the group
+  of entries sharing its last name and first initial (see sort_bibs()).
+
+  Parameters
+  ----------
+  bibs: List of Bib() objects
+      Entries sorted as by sort_bibs().
+  new: List of Bib() objects
+      Entries to insert.
+
+  Returns
+  -------
+  bibs: List of Bib() objects
+      The input list, with the new entries.
+  """
+  for bib in new:
+      group = bib.sort_key[0:2]
+      lo, hi = 0, len(bibs)
+      while lo < hi:
+          mid = (lo+hi) // 2
+          if bibs[mid].sort_key[0:2] < group:
+              lo = mid + 1
+          else:
+              hi = mid
+      start, hi = lo, len(bibs)
+      while lo < hi:
+          mid = (lo+hi) // 2
+          if bibs[mid].sort_key[0:2] <= group:
+              lo = mid + 1
+          else:
+              hi = mid
+      bibs[start:lo] = sort_bibs(bibs[start:lo] + [bib])
+  return bibs
+
+
 def display_bibs(labels, bibs, meta=False):
   r"""
   Display a list of bib entries on screen with flying colors.
@@ -358,281 +621,1957 @@ def display_bibs(labels, bibs, meta=False):
          year   = {2001},
        }
   """
-  style = prompt_toolkit.styles.style_from_pygments_cls(
-              pygments.styles.get_style_by_name(cm.get('style')))
-  if labels is None:
-      labels = ["" for _ in bibs]
-  tokens = [(Token.Comment, u.BANNER)]
-  for label,bib in zip(labels, bibs):
-      tokens += [(Token.Text, label)]
-      if meta:
-          tokens += [(Token.Comment, bib.meta())]
-      tokens += list(pygments.lex(bib.content, lexer=BibTeXLexer()))
-      tokens += [(Token.Text, "\n")]
-  print_formatted_text(PygmentsTokens(tokens), end="", style=style,
-      output=create_output(sys.stdout))
+  style = prompt_toolkit.styles.style_from_pygments_cls(
+              pygments.styles.get_style_by_name(cm.get('style')))
+  if labels is None:
+      labels = ["" for _ in bibs]
+  tokens = [(Token.Comment, u.BANNER)]
+  for label,bib in zip(labels, bibs):
+      tokens += [(Token.Text, label)]
+      if meta:
+          tokens += [(Token.Comment, bib.meta())]
+      tokens += list(pygments.lex(bib.content, lexer=BibTeXLexer()))
+      tokens += [(Token.Text, "\n")]
+  print_formatted_text(PygmentsTokens(tokens), end="", style=style,
+      output=create_output(sys.stdout))
+
+
+def record_conflict(conflicts, kind, database, new, field=None):
+  """
+  Record an unresolved merge conflict (see merge() and resolve()).
+
+  Parameters
+  ----------
+  conflicts: List of dictionaries
+      Recorded conflicts, this function appends to it.
+  kind: String
+      Type of conflict: 'duplicates' (within the new entries), 'field'
+      (same field value but different key), 'key' (same key but
+      different content), 'title', or 'similar title'.
+  database: Bib() object
+      Database entry in conflict (None for 'duplicates').
+  new: List of Bib() objects
+      New entries in conflict.
+  field: String
+      The conflicting field (for 'duplicates' and 'field' conflicts).
+  """
+  conflicts.append({
+      'kind': kind,
+      'field': field,
+      'key': None if database is None else database.key,
+      'database': None if database is None
+                  else database.meta() + database.content,
+      'new': [bib.meta() + bib.content for bib in new],
+      })
+
+
+def query_conflict(kind, database, new, field=None):
+  """
+  Display a merge conflict and query the user to resolve it (see
+  merge() and resolve()).  When the user takes the new entry over the
+  database entry, update the database entry (in place).
+
+  Parameters
+  ----------
+  kind: String
+      Type of conflict (see record_conflict()).
+  database: Bib() object
+      Database entry in conflict (None for 'duplicates').
+  new: List of Bib() objects
+      New entries in conflict.
+  field: String
+      The conflicting field (for 'duplicates' and 'field' conflicts).
+
+  Returns
+  -------
+  answer: String
+      The user's answer: for 'duplicates', the position of the entry
+      to keep ('' for the first); for 'key', '', 'n', or the new key
+      of the new entry; for 'title' and 'similar title', '', 'r', or
+      'a' (add the new entry).
+  """
+  if kind == 'duplicates':
+      nbibs = len(new)
+      labels = [idx + " ENTRY:\n" for idx in u.ordinal(np.arange(nbibs)+1)]
+      display_bibs(labels, new)
+      return u.req_input(f"Duplicate {field} field, []keep first, "
+           "[2]second, [3]third, etc.: ",
+           options=[""]+list(np.arange(nbibs)+1))
+
+  display_bibs(["DATABASE:\n", "NEW:\n"], [database, new[0]])
+  if kind == 'field':
+      s = u.req_input(f"Duplicate {field} field but different keys, []keep "
+                       "database or take [n]ew: ", options=["", "n"])
+  elif kind == 'key':
+      s = input("Duplicate key but content differ, []ignore new, "
+                "take [n]ew, or\nrename key of new entry: ")
+  else:
+      match = "same" if kind == 'title' else "similar"
+      s = u.req_input(f"Possible duplicate, {match} title but keys differ, "
+                      "[]ignore new, [r]eplace database with new, "
+                      "or [a]dd new: ", options=["", "r", "a"])
+  if s == ("r" if kind in ['title', 'similar title'] else "n"):
+      database.update_content(new[0])
+  return s
+
+
+def field_value(bib, field):
+  """
+  Value of a Bib() field to identify duplicates (titles are compared
+  in lower case, and only by their letters and digits).
+  """
+  value = getattr(bib, field)
+  if field == 'title' and value is not None:
+      value = " ".join(re.sub(r"\W|_", " ", value.lower()).split())
+  if value == "":
+      return None
+  return value
+
+
+def duplicate_groups(bibs, fields):
+  """
+  Find groups of entries sharing the value of any of the given fields,
+  with a union-find over the field values (such that entries connected
+  through different fields end up in a same group).
+
+  Parameters
+  ----------
+  bibs: List of Bib() objects
+      Entries to group.
+  fields: List of strings
+      Fields to compare (e.g., 'doi', 'isbn', 'bibcode', 'eprint',
+      or 'title').
+
+  Returns
+  -------
+  groups: List of lists of integers
+      Indices of the entries in each group of two or more entries
+      (ordered by their first index).
+  """
+  parents = list(range(len(bibs)))
+  def root(i):
+      while parents[i] != i:
+          parents[i] = parents[parents[i]]
+          i = parents[i]
+      return i
+
+  for field in fields:
+      firsts = {}
+      for i,bib in enumerate(bibs):
+          value = field_value(bib, field)
+          if value is not None:
+              parents[root(i)] = root(firsts.setdefault(value, i))
+
+  groups = {}
+  for i in range(len(bibs)):
+      groups.setdefault(root(i), []).append(i)
+  return [group for group in groups.values() if len(group) > 1]
+
+
+def shared_fields(bibs, fields):
+  """Fields whose (non-empty) value is shared by two or more entries."""
+  shared = []
+  for field in fields:
+      values = [field_value(bib, field) for bib in bibs]
+      values = [value for value in values if value is not None]
+      if len(set(values)) < len(values):
+          shared.append(field)
+  return shared
+
+
+def title_shingles(bib):
+  """
+  Character 3-grams of the normalized title of an entry, plus the
+  (purified) last name of its first author.
+  """
+  title = field_value(bib, 'title') or ""
+  shingles = {title[i:i+3] for i in range(max(len(title)-2, 1))}
+  shingles.add(f'author:{bib.sort_author.last}')
+  return shingles
+
+
+def minhash(shingles):
+  """MinHash signature of a set of strings."""
+  hashes = np.array([zlib.crc32(shingle.encode()) for shingle in shingles],
+                    np.uint64) % minhash_prime
+  a, b = minhash_coeffs
+  return ((np.outer(hashes, a) + b) % minhash_prime).min(axis=0).astype(
+      np.uint32)
+
+
+def lsh_update(index, bibs=[], remove=[]):
+  """
+  Update a locality-sensitive-hashing index of titles (in place),
+  adding or replacing the given entries and removing the entries of
+  the given keys.  The index holds the MinHash signature of each entry
+  (by key) and the keys of the entries in each bucket (band of rows of
+  the signatures).
+  """
+  rows = minhash_size // lsh_bands
+  for key in list(remove) + [bib.key for bib in bibs]:
+      signature = index['signatures'].pop(key, None)
+      if signature is None:
+          continue
+      for band in range(lsh_bands):
+          bucket = band, signature[band*rows:(band+1)*rows].tobytes()
+          index['buckets'][bucket].discard(key)
+          if len(index['buckets'][bucket]) == 0:
+              del index['buckets'][bucket]
+  for bib in bibs:
+      signature = minhash(title_shingles(bib))
+      index['signatures'][bib.key] = signature
+      for band in range(lsh_bands):
+          bucket = band, signature[band*rows:(band+1)*rows].tobytes()
+          index['buckets'].setdefault(bucket, set()).add(bib.key)
+  return index
+
+
+def lsh_index(bibs):
+  """Create a locality-sensitive-hashing index of titles of entries."""
+  return lsh_update({'signatures':{}, 'buckets':{}}, bibs)
+
+
+def near_duplicates(index, bib, threshold=None):
+  """
+  Find the entries of an LSH index with titles similar to that of bib
+  (comparing only the entries that share a bucket with it).
+
+  Parameters
+  ----------
+  index: Dictionary
+      An LSH index (see lsh_index()).
+  bib: A Bib() object
+      Entry to match.
+  threshold: Float
+      Minimum estimated Jaccard similarity (default:
+      near_duplicate_threshold).
+
+  Returns
+  -------
+  keys: List of strings
+      Keys of the similar entries, from the most to the least similar.
+  """
+  if threshold is None:
+      threshold = near_duplicate_threshold
+  rows = minhash_size // lsh_bands
+  signature = minhash(title_shingles(bib))
+  candidates = set()
+  for band in range(lsh_bands):
+      bucket = band, signature[band*rows:(band+1)*rows].tobytes()
+      candidates.update(index['buckets'].get(bucket, ()))
+  similarity = {
+      key: np.mean(index['signatures'][key] == signature)
+      for key in candidates if key != bib.key}
+  return sorted(
+      (key for key in similarity if similarity[key] >= threshold),
+      key=lambda key: -similarity[key])
+
+
+def remove_duplicates(bibs, fields, conflicts=None):
+  """
+  Look for duplicates (within a same list of entries) by field and
+  remove them (in place).  Entries sharing the value of any of the
+  fields are grouped together in a single pass (such that duplicates
+  connected through different fields end up in a same group).
+
+  Parameters
+  ----------
+  bibs: List of Bib() objects
+      Entries to filter.
+  fields: String or list of strings
+      Field(s) to use for filtering ('doi', 'isbn', 'bibcode', or 'eprint').
+  conflicts: List of dictionaries
+      If not None, do not query the user, but keep the first of the
+      duplicates and record the conflict into this list.
+
+  Examples
+  --------
+  >>> import bibmanager.bib_manager as bm
+  >>> import os
+  >>> bibfile = os.path.expanduser("~") + "/.bibmanager/examples/sample.bib"
+  >>> bibs = list(bm.iter_bibfile(bibfile))
+  >>> bm.remove_duplicates(bibs, ['doi', 'isbn', 'bibcode', 'eprint'])
+  """
+  if isinstance(fields, str):
+      fields = [fields]
+
+  removes = []
+  for all_indices in duplicate_groups(bibs, fields):
+      # Remove identical entries (keep first, sort by content):
+      contents = {}
+      for idx in all_indices:
+          contents.setdefault(bibs[idx].content, idx)
+      indices = [contents[content] for content in sorted(contents)]
+      removes += [idx for idx in all_indices if idx not in indices]
+      nbibs = len(indices)
+      if nbibs == 1:
+          continue
+
+      # Pick peer-reviewed over ArXiv over non-ADS:
+      pubs = [bibs[i].published() for i in indices]
+      pubmax = max(pubs)
+      removes += [idx for idx,pub in zip(indices,pubs) if pub <  pubmax]
+      indices  = [idx for idx,pub in zip(indices,pubs) if pub == pubmax]
+      nbibs = len(indices)
+      if nbibs == 1:
+          continue
+
+      # Querry the user:
+      shared = shared_fields([bibs[i] for i in indices], fields)
+      if len(shared) == 0:
+          # Connected through already-removed entries:
+          shared = fields
+      if conflicts is not None:
+          record_conflict(conflicts, 'duplicates', None,
+              [bibs[i] for i in indices], '/'.join(shared))
+          removes += indices[1:]
+          continue
+      s = query_conflict('duplicates', None, [bibs[i] for i in indices],
+                         '/'.join(shared))
+      if s == "":
+          indices.pop(0)
+      else:
+          indices.pop(int(s)-1)
+      removes += indices
+
+  removes = set(removes)
+  bibs[:] = [bib for i,bib in enumerate(bibs) if i not in removes]
+
+
+def filter_field(bibs, new, field, take, conflicts=None):
+  """
+  Filter duplicate entries by field between new and bibs.
+  This routine modifies new removing the duplicates, and may modify
+  bibs (depending on take argument).
+
+  Parameters
+  ----------
+  bibs: List of Bib() objects
+      Database entries.
+  new: List of Bib() objects
+      New entries to add.
+  field: String
+      Field to use for filtering.
+  take: String
+      Decision-making protocol to resolve conflicts when there are
+      duplicated entries:
+      'old': Take the database entry over new.
+      'new': Take the new entry over the database.
+      'ask': Ask user to decide (interactively).
+  conflicts: List of dictionaries
+      If not None, do not query the user (when take='ask'), but keep
+      the database entry and record the conflict into this list.
+  """
+  # Index of first database entry for each field value:
+  fields = {}
+  for i,bib in enumerate(bibs):
+      if getattr(bib,field) is not None:
+          fields.setdefault(getattr(bib,field), i)
+  removes = []
+  for i,bib in enumerate(new):
+      if getattr(bib,field) not in fields:
+          continue
+      idx = fields[getattr(bib,field)]
+      # Replace if duplicated and new has newer bibcode:
+      if bib.published() > bibs[idx].published() or take == 'new':
+          bibs[idx].update_content(bib)
+      # Look for different-key conflict:
+      if bib.key != bibs[idx].key and take == "ask" and conflicts is not None:
+          record_conflict(conflicts, 'field', bibs[idx], [bib], field)
+      elif bib.key != bibs[idx].key and take == "ask":
+          query_conflict('field', bibs[idx], [bib], field)
+      removes.append(i)
+  removes = set(removes)
+  new[:] = [bib for i,bib in enumerate(new) if i not in removes]
+
+
+def new_bib(entry, meta):
+    """Create a Bib() object from an entry text and its meta info."""
+    return Bib(entry, **meta)
+
+
+def iter_entries(bibfile=None, text=None):
+    """
+    Generator of the raw BibTeX entries (and their meta information)
+    from a BibTeX file, reading one line at a time.
+
+    Parameters
+    ----------
+    bibfile: String
+        Path to an existing .bib file.
+    text: String or iterable of strings
+        Content of a .bib file, or an iterable over its lines (e.g., a
+        file object).  Ignored if bibfile is not None.
+
+    Yields
+    ------
+    Two-element tuples with the text of an entry and a dictionary
+    of its meta information (pdf and freeze values).
+    """
+    entry   = []  # Store lines in the bibtex
+    parcount = 0  # Braces count (+1 for each '{', -1 for each '}')
+
+    # Load a bib file:
+    if bibfile is not None:
+        f = open(bibfile, 'r')
+    elif isinstance(text, str):
+        f = text.splitlines()
+    elif text is not None:
+        f = text
+    else:
+        raise TypeError("Missing input arguments for loadfile(), at least "
+                        "bibfile or text must be provided.")
+
+    try:
+        meta = {'pdf':None, 'freeze':None}
+        for i,line in enumerate(f):
+            # Meta info:
+            if parcount == 0:
+                if line.lower().startswith('pdf'):
+                    meta['pdf'] = line.split()[-1]
+                if line.lower().strip() == 'freeze':
+                    meta['freeze'] = True
+
+            # New entry:
+            if line.startswith("@") and parcount != 0:
+                raise ValueError(
+                    f"Mismatched braces in line {i}:\n'{line.rstrip()}'")
+
+            parcount += u.count(line)
+            if parcount == 0 and entry == []:
+                continue
+
+            if parcount < 0:
+                raise ValueError(
+                    f"Mismatched braces in line {i}:\n'{line.rstrip()}'")
+
+            entry.append(line.rstrip())
+
+            if parcount == 0 and entry != []:
+                yield "\n".join(entry), meta
+                entry = []
+                meta = {'pdf':None, 'freeze':None}
+    finally:
+        if bibfile is not None:
+            f.close()
+
+    if parcount != 0:
+        raise ValueError("Invalid input, mistmatched braces at end of file.")
+
+
+def iter_bibfile(bibfile=None, text=None):
+    """
+    Generator of Bib() objects from a BibTeX file, reading and parsing
+    one entry at a time (such that memory usage does not grow with the
+    file size).  Unlike loadfile(), the entries are neither filtered
+    for duplicates nor sorted.
+
+    Parameters
+    ----------
+    bibfile: String
+        Path to an existing .bib file.
+    text: String or iterable of strings
+        Content of a .bib file, or an iterable over its lines (e.g., a
+        file object).  Ignored if bibfile is not None.
+
+    Yields
+    ------
+    Bib() objects of the BibTeX entries, in the same order as in
+    the file.
+
+    Examples
+    --------
+    >>> import bibmanager.bib_manager as bm
+    >>> import os
+    >>> bibfile = os.path.expanduser("~") + "/.bibmanager/examples/sample.bib"
+    >>> for bib in bm.iter_bibfile(bibfile):
+    >>>     print(bib.key)
+    """
+    for entry, meta in iter_entries(bibfile, text):
+        yield Bib(entry, **meta)
+
+
+def scan_bibfile(data):
+    """
+    Locate the entries (and their meta information) in the content of
+    a .bib file, following the same rules as iter_entries(), but
+    counting the braces of the whole file at once.
+
+    Parameters
+    ----------
+    data: Bytes-like object
+        Content of a .bib file (e.g., a memory-mapped file).
+
+    Returns
+    -------
+    entries: List of three-element tuples
+        Start and end byte offsets, and meta-info dictionary of each
+        entry.  Return None if the file has mismatched braces (or
+        line breaks other than '\\n' or '\\r\\n').
+    """
+    chars = np.frombuffer(data, np.uint8)
+    if len(chars) == 0:
+        return []
+    returns = np.flatnonzero(chars == ord("\r"))
+    if np.any(chars[np.clip(returns+1, 0, len(chars)-1)] != ord("\n")):
+        return None
+
+    line_starts = np.append(0, np.flatnonzero(chars == ord("\n")) + 1)
+    if line_starts[-1] == len(chars):
+        line_starts = line_starts[:-1]
+    line_ends = np.append(line_starts[1:], len(chars))
+
+    # Braces level before and after each line:
+    braces = np.flatnonzero((chars == ord("{")) | (chars == ord("}")))
+    levels = np.append(0, np.cumsum(np.where(chars[braces]==ord("{"), 1, -1)))
+    after  = levels[np.searchsorted(braces, line_ends)]
+    before = np.append(0, after[:-1])
+
+    if np.any(after < 0) or after[-1] != 0 or \
+            np.any((chars[line_starts] == ord("@")) & (before != 0)):
+        return None
+
+    in_entry = (before != 0) | (after != 0)
+    first = np.flatnonzero(in_entry & (before == 0))
+    last  = np.flatnonzero(in_entry & (after == 0))
+
+    # Meta info, from lines at level zero (pdf or freeze lines):
+    metas = [{'pdf':None, 'freeze':None} for _ in first]
+    candidates = np.flatnonzero(
+        (before == 0) & np.isin(chars[line_starts], list(b"pPfF \t\v\f")))
+    for i in candidates:
+        ientry = np.searchsorted(first, i)
+        if ientry == len(first):
+            break
+        line = bytes(data[line_starts[i]:line_ends[i]]).decode()
+        if line.lower().startswith('pdf'):
+            metas[ientry]['pdf'] = line.split()[-1]
+        if line.lower().strip() == 'freeze':
+            metas[ientry]['freeze'] = True
+    return list(zip(line_starts[first].tolist(), line_ends[last].tolist(), metas))
+
+
+def entry_text(data, start, end):
+    """Text of an entry in a .bib file (lines with trailing blanks removed)."""
+    lines = bytes(data[start:end]).decode().split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def offset_bib(data, offset):
+    """Create a Bib() object from the entry at an Entry_offset."""
+    return Bib(entry_text(data, offset.start, offset.end),
+               pdf=offset.pdf, freeze=offset.freeze)
+
+
+def offset_ids(offset, bib):
+    """Set the identifiers of an Entry_offset from its Bib() object."""
+    return offset._replace(key=bib.key, bibcode=bib.bibcode, doi=bib.doi,
+                           eprint=bib.eprint, isbn=bib.isbn)
+
+
+@contextmanager
+def map_bibfile(bibfile):
+    """
+    Context manager that memory-maps a .bib file (read only), or reads
+    it if it is empty.  The map is closed on exit.
+    """
+    with open(bibfile, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def read_offsets():
+    """Read the persisted entry-offset indices of .bib files."""
+    try:
+        with open(u.BM_OFFSETS(), 'rb') as handle:
+            return pickle.load(handle)
+    except:
+        return {}
+
+
+def bibfile_offsets(bibfile, data):
+    """
+    Get the entry-offset index of a .bib file.  Take the persisted
+    index if the file did not change, otherwise scan the file, keeping
+    the identifiers of the entries whose content did not change (the
+    identifiers of new or modified entries are None).  A file whose
+    modification time changed but not its content keeps the persisted
+    index (and is scanned again on the next call).
+
+    Parameters
+    ----------
+    bibfile: String
+        Path to an existing .bib file.
+    data: Bytes-like object
+        Content of bibfile.
+
+    Returns
+    -------
+    offsets: List of Entry_offset namedtuples
+        The entries' location, hash, meta info, and identifiers.
+        None if the file cannot be scanned (e.g., mismatched braces).
+    updated: Bool
+        Whether offsets differ from the persisted index.
+    """
+    stat = os.stat(bibfile)
+    index = read_offsets().get(os.path.realpath(bibfile))
+    if index is not None and index[0:2] == (stat.st_size, stat.st_mtime_ns):
+        return index[2], False
+
+    entries = scan_bibfile(data)
+    if entries is None:
+        return None, False
+    known = {} if index is None else {entry.hash: entry for entry in index[2]}
+    offsets = []
+    for start, end, meta in entries:
+        digest = hashlib.blake2b(data[start:end], digest_size=16).digest()
+        ids = known[digest][5:] if digest in known else (None,)*5
+        offsets.append(
+            Entry_offset(start, end, digest, meta['pdf'], meta['freeze'], *ids))
+    return offsets, index is None or offsets != index[2]
+
+
+def save_offsets(bibfile, offsets):
+    """
+    Persist the entry-offset index of a .bib file (keeping only the
+    offsets_max_files most recently indexed files).
+    """
+    stat = os.stat(bibfile)
+    indices = read_offsets()
+    path = os.path.realpath(bibfile)
+    indices.pop(path, None)
+    indices[path] = stat.st_size, stat.st_mtime_ns, offsets
+    for old_path in list(indices)[:-offsets_max_files]:
+        indices.pop(old_path)
+    with u.ignored(OSError), open(u.BM_OFFSETS(), 'wb') as handle:
+        pickle.dump(indices, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def find_entries(bibfile, keys=None, bibcodes=None):
+    """
+    Load selected entries from a BibTeX file.  The file is memory-mapped
+    and its entries located through a persisted index of their byte
+    offsets and identifiers, such that only the requested entries (and
+    the entries not indexed before) are parsed.
+
+    Parameters
+    ----------
+    bibfile: String
+        Path to an existing .bib file.
+    keys: List of strings
+        Keys of the entries to load.
+    bibcodes: List of strings
+        ADS bibcodes of the entries to load.
+
+    Returns
+    -------
+    bibs: List of Bib() objects
+        The matching entries, in the same order as in bibfile (neither
+        filtered for duplicates nor sorted).
+
+    Examples
+    --------
+    >>> import bibmanager.bib_manager as bm
+    >>> import os
+    >>> bibfile = os.path.expanduser("~") + "/.bibmanager/examples/sample.bib"
+    >>> bibs = bm.find_entries(bibfile, keys=['AASteamHendrickson2018aastex62'])
+    >>> print(bibs[0].title)
+    AASTeX v6.2 Author Guide
+    """
+    keys = set([] if keys is None else keys)
+    bibcodes = set([] if bibcodes is None else bibcodes)
+    with map_bibfile(bibfile) as data:
+        offsets, updated = bibfile_offsets(bibfile, data)
+        if offsets is None:
+            # Not scannable, use the line reader (which raises on
+            # mismatched braces):
+            return [bib for bib in iter_bibfile(bibfile)
+                    if bib.key in keys or bib.bibcode in bibcodes]
+
+        # Index the entries not seen before:
+        parsed = {}
+        for i,offset in enumerate(offsets):
+            if offset.key is None:
+                parsed[i] = offset_bib(data, offset)
+                offsets[i] = offset_ids(offset, parsed[i])
+        if updated:
+            save_offsets(bibfile, offsets)
+
+        return [
+            parsed[i] if i in parsed else offset_bib(data, offset)
+            for i,offset in enumerate(offsets)
+            if offset.key in keys or offset.bibcode in bibcodes]
+
+
+def read_parse_cache():
+    """
+    Read the persistent parse cache (a dictionary of pickled Bib()
+    objects indexed by the hash of their entry text).  Discard caches
+    of a different parse_cache_format (the cache is kept across
+    bibmanager versions that parse entries the same way).
+    """
+    try:
+        with open(u.BM_PARSE_CACHE(), 'rb') as handle:
+            cache_format, cache = pickle.load(handle)
+    except:
+        return {}
+    if cache_format != parse_cache_format:
+        return {}
+    return cache
+
+
+def write_parse_cache(cache):
+    """
+    Persist the parse cache, keeping only the parse_cache_size most
+    recently used entries.
+    """
+    for digest in list(cache)[:-parse_cache_size]:
+        cache.pop(digest)
+    with u.ignored(OSError), open(u.BM_PARSE_CACHE(), 'wb') as handle:
+        pickle.dump((parse_cache_format, cache), handle,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def parse_chunk(chunk, cache, use_cache, pool=None, workers=None):
+    """
+    Create the Bib() objects of a chunk of entries for parse_entries(),
+    taking the cached entries from cache (and adding the new ones to
+    it if use_cache).  Parse with pool (a pool of workers processes,
+    if not None) when there are enough entries to parse.  Return the
+    Bib() objects and whether any entry was parsed.
+    """
+    digests = [
+        hashlib.blake2b(entry.encode(), digest_size=16).digest()
+        if use_cache else None
+        for entry,meta in chunk]
+    cached = [digest in cache for digest in digests]
+    missing = [entry for entry,hit in zip(chunk,cached) if not hit]
+
+    if pool is None or len(missing) == 0 \
+            or len(missing) < parallel_min_entries:
+        parsed = iter([new_bib(entry, meta) for entry,meta in missing])
+    else:
+        # Keep a few chunks per worker to balance the load:
+        chunksize = -(-len(missing) // (4*workers))
+        parsed = pool.map(new_bib, *zip(*missing), chunksize=chunksize)
+        parsed = iter(list(parsed))
+
+    bibs = []
+    for (entry,meta), digest, hit in zip(chunk, digests, cached):
+        if hit:
+            bib = pickle.loads(cache[digest])
+            bib.pdf, bib.freeze = meta['pdf'], meta['freeze']
+            # Move to the end (most recently used entries):
+            cache[digest] = cache.pop(digest)
+        else:
+            bib = next(parsed)
+            if use_cache:
+                cache[digest] = pickle.dumps(
+                    bib, protocol=pickle.HIGHEST_PROTOCOL)
+        bibs.append(bib)
+    return bibs, len(missing) > 0
+
+
+def parse_entries(entries, workers=None):
+    """
+    Create Bib() objects from entry texts, parsing only the entries not
+    found in the persistent parse cache (unchanged entries are taken
+    from the cache).  Loads of less than parse_cache_min_entries
+    entries (e.g., single-entry additions) neither read nor update the
+    cache, since reading and rewriting it costs more than parsing them.
+    The entries are consumed in chunks of parse_chunk_entries, such
+    that only the texts of one chunk are held in memory at a time.
+
+    Parameters
+    ----------
+    entries: Iterable of two-element tuples
+        Text and meta-info dictionary of each entry (see iter_entries()).
+    workers: Integer
+        Number of processes to parse the entries in parallel.  If None
+        (or for less than parallel_min_entries entries), parse serially.
+
+    Returns
+    -------
+    bibs: List of Bib() objects
+        The entries, in the same order as the input.
+    """
+    entries = iter(entries)
+    chunk = list(itertools.islice(entries, parse_cache_min_entries))
+    use_cache = len(chunk) >= parse_cache_min_entries
+    cache = read_parse_cache() if use_cache else {}
+    chunk_size = max(parse_chunk_entries, parallel_min_entries)
+
+    bibs = []
+    updated = False
+    pool = None
+    try:
+        while len(chunk) > 0:
+            chunk += itertools.islice(entries, max(chunk_size-len(chunk), 0))
+            if pool is None and workers is not None and workers > 1 \
+                    and len(chunk) >= parallel_min_entries:
+                pool = ProcessPoolExecutor(workers)
+            chunk_bibs, parsed = parse_chunk(
+                chunk, cache, use_cache, pool, workers)
+            bibs += chunk_bibs
+            updated |= parsed
+            chunk = list(itertools.islice(entries, chunk_size))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if use_cache and updated:
+        write_parse_cache(cache)
+    return bibs
+
+
+def loadfile(bibfile=None, text=None, workers=None, conflicts=None):
+    """
+    Create a list of Bib() objects from a BibTeX file (.bib file).
+
+    Parameters
+    ----------
+    bibfile: String
+        Path to an existing .bib file.
+    text: String or iterable of strings
+        Content of a .bib file, or an iterable over its lines (ignored
+        if bibfile is not None).
+    workers: Integer
+        Number of processes to parse the entries in parallel.  If None
+        (or for less than parallel_min_entries entries), parse serially.
+    conflicts: List of dictionaries
+        If not None, record duplicate entries into this list rather
+        than querying the user (see remove_duplicates()).
+
+    Returns
+    -------
+    bibs: List of Bib() objects
+        List of Bib() objects of BibTeX entries in bibfile, sorted by
+        Sort_author() fields.
+
+    Examples
+    --------
+    >>> import bibmanager.bib_manager as bm
+    >>> import os
+    >>> bibfile = os.path.expanduser("~") + "/.bibmanager/examples/sample.bib"
+    >>> bibs = bm.loadfile(bibfile)
+    """
+    offsets = None
+    if bibfile is None:
+        bibs = parse_entries(iter_entries(bibfile, text), workers)
+    else:
+        # Locate the entries through the (persisted) offset index:
+        with map_bibfile(bibfile) as data:
+            offsets, updated = bibfile_offsets(bibfile, data)
+            if offsets is not None:
+                bibs = parse_entries(
+                    ((entry_text(data, offset.start, offset.end),
+                      {'pdf':offset.pdf, 'freeze':offset.freeze})
+                     for offset in offsets),
+                    workers)
+        if offsets is None:
+            # Not scannable, use the line reader (which raises on
+            # mismatched braces):
+            bibs = parse_entries(iter_entries(bibfile), workers)
+
+    if offsets is not None and \
+            (updated or any(offset.key is None for offset in offsets)):
+        save_offsets(bibfile, list(map(offset_ids, offsets, bibs)))
+
+    remove_duplicates(bibs, ["doi", "isbn", "bibcode", "eprint"], conflicts)
+
+    # Check pathed-pdf meta values:
+    for i,bib in enumerate(bibs):
+        if bib.pdf is not None and os.path.dirname(bib.pdf) != '':
+            filename = os.path.expanduser(bib.pdf)
+            if not os.path.isfile(filename):
+                bibs[i].pdf = None
+            else:
+                shutil.move(os.path.expanduser(filename),
+                    f"{u.BM_PDF()}{os.path.basename(filename)}")
+                bibs[i].pdf = os.path.basename(filename)
+    return sort_bibs(bibs)
+
+
+def is_sqlite(bm_database):
+  """Check whether a database file is a SQLite (rather than a pickle) file."""
+  with open(bm_database, 'rb') as handle:
+      return handle.read(len(sqlite_magic)) == sqlite_magic
+
+
+def is_sqlite_storage():
+  """Check whether the bibmanager database exists with SQLite storage."""
+  bm_database = u.BM_DATABASE()
+  return bm_database.endswith('.sqlite') and os.path.exists(bm_database)
+
+
+def sort_group(bib):
+  """
+  Last name and first initial of the sort key of an entry (see
+  sort_bibs()), as a text that sorts (in SQLite) as the sort keys do.
+  """
+  return "\x00".join(bib.sort_key[0:2])
+
+
+def sqlite_connect(bm_database):
+  """
+  Open a connection to a SQLite bibmanager database, creating the
+  entries and meta tables (and the indices) if needed.  Each row of
+  the entries table stores a pickled Bib() object, its (sparse)
+  position in the sorted database, its sort group (see sort_group()),
+  and the identifier columns.
+  """
+  conn = sqlite3.connect(bm_database)
+  conn.execute(
+      "CREATE TABLE IF NOT EXISTS entries (pos REAL, sort_group TEXT, "
+      + ", ".join(f"{field} {'INTEGER' if field=='year' else 'TEXT'}"
+                  for field in sqlite_fields)
+      + ", bib BLOB)")
+  # Tables created before the sort_group column:
+  columns = [row[1] for row in conn.execute("PRAGMA table_info(entries)")]
+  if 'sort_group' not in columns:
+      conn.execute("ALTER TABLE entries ADD COLUMN sort_group TEXT")
+      rows = conn.execute("SELECT rowid, bib FROM entries").fetchall()
+      conn.executemany("UPDATE entries SET sort_group=? WHERE rowid=?",
+          [(sort_group(pickle.loads(bib)), rowid) for rowid,bib in rows])
+  for field in ['pos', 'sort_group'] + sqlite_fields:
+      conn.execute(f"CREATE INDEX IF NOT EXISTS entries_{field} "
+                   f"ON entries ({field})")
+  conn.execute(
+      "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+  conn.commit()
+  return conn
+
+
+def sqlite_row(bib, pos):
+  """Values of an entries-table row for a Bib() object."""
+  return (pos, sort_group(bib),
+          *[getattr(bib, field) for field in sqlite_fields],
+          pickle.dumps(bib, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def sqlite_insert(conn, rows):
+  """Insert rows (see sqlite_row()) into the entries table."""
+  columns = ['pos', 'sort_group'] + sqlite_fields + ['bib']
+  conn.executemany(
+      f"INSERT INTO entries ({', '.join(columns)}) "
+      f"VALUES ({', '.join('?'*len(columns))})", rows)
+
+
+def sqlite_insort(conn, bib):
+  """
+  Insert an entry into the (sorted) entries table of a SQLite
+  database, re-sorting only the entries of its sort group (as
+  insort_bibs() does).  The entries of the group take evenly spaced
+  positions between those of the neighboring groups.  All rows are
+  renumbered only when the positions between these groups run out.
+  """
+  group = sort_group(bib)
+  rows = conn.execute("SELECT rowid, bib FROM entries WHERE sort_group=? "
+                      "ORDER BY pos", (group,)).fetchall()
+  bibs = sort_bibs([pickle.loads(row[1]) for row in rows] + [bib])
+  lo = conn.execute("SELECT MAX(pos) FROM entries WHERE sort_group<?",
+                    (group,)).fetchone()[0]
+  hi = conn.execute("SELECT MIN(pos) FROM entries WHERE sort_group>?",
+                    (group,)).fetchone()[0]
+  nbibs = len(bibs)
+  if lo is None:
+      lo = (nbibs if hi is None else hi) - nbibs - 1.0
+  if hi is None:
+      hi = lo + nbibs + 1.0
+  positions = [lo + (hi-lo)*(i+1)/(nbibs+1) for i in range(nbibs)]
+  if not all(a < b for a,b in zip([lo]+positions, positions+[hi])):
+      rowids = conn.execute("SELECT rowid FROM entries ORDER BY pos").fetchall()
+      conn.executemany("UPDATE entries SET pos=? WHERE rowid=?",
+          [(pos, rowid) for pos,(rowid,) in enumerate(rowids)])
+      return sqlite_insort(conn, bib)
+  conn.executemany(
+      "DELETE FROM entries WHERE rowid=?", [(row[0],) for row in rows])
+  sqlite_insert(conn, [sqlite_row(entry, pos)
+                       for entry,pos in zip(bibs, positions)])
+
+
+def sqlite_select(where="", params=(), bm_database=None):
+  """
+  Get the Bib() objects of a SQLite database matching a WHERE clause
+  (sorted as in the database).
+  """
+  if bm_database is None:
+      bm_database = u.BM_DATABASE()
+  with closing(sqlite_connect(bm_database)) as conn:
+      rows = conn.execute(
+          f"SELECT bib FROM entries {where} ORDER BY pos", params).fetchall()
+  return [pickle.loads(row[0]) for row in rows]
+
+
+def read_header(handle):
+  """
+  Read the header of a pickle database file.
+
+  Parameters
+  ----------
+  handle: File object
+      A database file opened in binary mode (at the beginning).
+
+  Returns
+  -------
+  header: A Db_header namedtuple
+      The file-format version, bibmanager version, number of entries,
+      and payload's SHA-256 hash.  Return None (and rewind the file)
+      if the file has the old (header-less) layout.
+  """
+  data = handle.read(db_header.size)
+  if len(data) < db_header.size or not data.startswith(db_magic):
+      handle.seek(0)
+      return None
+  magic, fmt, nentries, digest, length = db_header.unpack(data)
+  return Db_header(fmt, handle.read(length).decode(), nentries, digest)
+
+
+def write_database(bm_database, entries, version=__version__):
+  """
+  Write a list of Bib() entries into a pickle database file: a
+  header (with the bibmanager version) followed by the pickled entries.
+  The file is replaced atomically.
+  """
+  version = version.encode()
+  if len(version) > 255:
+      raise ValueError(f"Invalid bibmanager version '{version.decode()}', "
+                        "it must be at most 255 bytes long.")
+  payload = pickle.dumps(entries, protocol=pickle.HIGHEST_PROTOCOL)
+  header = db_header.pack(db_magic, db_format, len(entries),
+      hashlib.sha256(payload).digest(), len(version))
+  with open(f'{bm_database}.tmp', 'wb') as handle:
+      handle.write(header + version)
+      handle.write(payload)
+  os.replace(f'{bm_database}.tmp', bm_database)
+
+
+def database_hash(bm_database):
+  """
+  Get the payload hash from the header of a pickle database file.
+  Return None if the file does not exist or has the old layout.
+  """
+  with u.ignored(OSError), open(bm_database, 'rb') as handle:
+      header = read_header(handle)
+      if header is not None:
+          return header.hash
+  return None
+
+
+def read_journal():
+  """
+  Read the records of the database journal.  The first record
+  holds the payload hash of the database that the journal applies to,
+  each following record is either a ('upsert', Bib()) or a
+  ('delete', key) tuple.  A truncated last record (e.g., from an
+  interrupted write) is ignored.
+  """
+  records = []
+  with u.ignored(OSError), open(u.BM_JOURNAL(), 'rb') as handle:
+      while True:
+          try:
+              records.append(pickle.load(handle))
+          except Exception:
+              break
+  return records
+
+
+def journal_base():
+  """
+  Payload hash of the database that the database journal applies to,
+  read from the first journal record only.  Return None if there is no
+  (readable) journal.
+  """
+  with u.ignored(Exception), open(u.BM_JOURNAL(), 'rb') as handle:
+      action, base_hash = pickle.load(handle)
+      return base_hash
+  return None
+
+
+def append_journal(records, base_hash):
+  """
+  Append records to the database journal, starting a new journal
+  if the current one does not apply to the database with payload hash
+  base_hash.
+  """
+  mode = 'ab' if journal_base() == base_hash else 'wb'
+  with open(u.BM_JOURNAL(), mode) as handle:
+      if mode == 'wb':
+          pickle.dump(('base', base_hash), handle)
+      for record in records:
+          pickle.dump(record, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def replay_journal(bibs, base_hash):
+  """
+  Apply the database-journal records onto the entries of a database
+  with payload hash base_hash.
+  """
+  journal = read_journal()
+  if len(journal) <= 1 or journal[0] != ('base', base_hash):
+      return bibs
+
+  bibs = list(bibs)
+  index = {}
+  for i,bib in enumerate(bibs):
+      index.setdefault(bib.key, i)
+  for action, value in journal[1:]:
+      if action == 'upsert':
+          if value.key in index:
+              bibs[index[value.key]] = value
+          else:
+              index[value.key] = len(bibs)
+              bibs.append(value)
+      elif action == 'delete' and value in index:
+          bibs[index.pop(value)] = None
+  return sort_bibs([bib for bib in bibs if bib is not None])
+
+
+def save(entries):
+  """
+  Save list of Bib() entries into bibmanager database (either a
+  pickle or a SQLite file, according to the 'storage' config parameter).
+
+  Parameters
+  ----------
+  entries: List of Bib() objects
+      bib files to store.
+
+  Examples
+  --------
+  >>> import bibmanager.bib_manager as bm
+  >>> # TBD: Load some entries
+  >>> bm.save(entries)
+  """
+  bm_database = u.BM_DATABASE()
+  if bm_database.endswith('.sqlite'):
+      with closing(sqlite_connect(bm_database)) as conn, conn:
+          conn.execute("DELETE FROM entries")
+          sqlite_insert(
+              conn, [sqlite_row(bib, pos) for pos,bib in enumerate(entries)])
+          conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+              (__version__,))
+  else:
+      write_database(bm_database, entries)
+
+  # The database now contains all journaled changes:
+  with u.ignored(OSError):
+      os.remove(u.BM_JOURNAL())
+
+
+def load(bm_database=None):
+  """
+  Load a Bibmanager database of BibTeX entries.  For the system's
+  pickle database, apply the changes recorded in its journal.
+
+  Parameters
+  ----------
+  bm_database: String
+      A Bibmanager pickle or SQLite database file.  If None, default's
+      the database in system.
+
+  Returns
+  -------
+  bibs: List Bib() instances
+      Return an empty list if there is no database file.
+
+  Examples
+  --------
+  >>> import bibmanager.bib_manager as bm
+  >>> bibs = bm.load()
+  """
+  if bm_database is None:
+      bm_database = u.BM_DATABASE()
+
+  try:
+      if is_sqlite(bm_database):
+          return sqlite_select(bm_database=bm_database)
+      with open(bm_database, 'rb') as handle:
+          header = read_header(handle)
+          payload = handle.read()
+  except:
+      return []
+
+  if header is not None and header.hash != hashlib.sha256(payload).digest():
+      raise ValueError(f"Corrupted bibmanager database file '{bm_database}'.")
+  # (Old-layout files have a trailing pickled version, which is ignored)
+  try:
+      bibs = pickle.loads(payload)
+  except:
+      return []
+  if header is not None and bm_database == u.BM_DATABASE():
+      bibs = replay_journal(bibs, header.hash)
+  return bibs
+
+
+def upsert(entries, remove=None):
+  """
+  Update entries in the bibmanager database (matching them by key),
+  or insert them if they are not in the database.  Under the pickle
+  storage, the changes are appended to the database journal (which is
+  compacted into the database once it grows too large).  Under the
+  SQLite storage, updates that keep the sort key of an entry only
+  rewrite that entry's row, and other updates or insertions only
+  rewrite the rows of the entry's sort group (see sqlite_insort()).
+
+  Parameters
+  ----------
+  entries: List of Bib() objects
+      Entries to update or insert.
+  remove: List of strings
+      Keys of entries to remove from the database.
+
+  Examples
+  --------
+  >>> import bibmanager.bib_manager as bm
+  >>> bib = bm.find(key='AASteamHendrickson2018aastex62')
+  >>> bib.pdf = 'AASteam2018.pdf'
+  >>> bm.upsert([bib])
+  """
+  if remove is None:
+      remove = []
+  bm_database = u.BM_DATABASE()
+  sqlite = is_sqlite_storage()
+  base_hash = None if sqlite else database_hash(bm_database)
+  if sqlite:
+      with closing(sqlite_connect(bm_database)) as conn, conn:
+          conn.executemany(
+              "DELETE FROM entries WHERE key=?", [(key,) for key in remove])
+          for bib in entries:
+              row = conn.execute("SELECT rowid, pos, bib FROM entries "
+                  "WHERE key=? ORDER BY pos LIMIT 1", (bib.key,)).fetchone()
+              if row is None or \
+                      pickle.loads(row[2]).sort_key != bib.sort_key:
+                  if row is not None:
+                      conn.execute("DELETE FROM entries WHERE rowid=?",
+                                   (row[0],))
+                  sqlite_insort(conn, bib)
+                  continue
+              conn.execute(
+                  "UPDATE entries SET " + ", ".join(
+                      f"{field}=?" for field in
+                      ['pos', 'sort_group']+sqlite_fields+['bib'])
+                  + " WHERE rowid=?", sqlite_row(bib, row[1]) + (row[0],))
+      return
+
+  if base_hash is not None:
+      records = [('delete', key) for key in remove]
+      records += [('upsert', bib) for bib in entries]
+      append_journal(records, base_hash)
+      journal_size = os.path.getsize(u.BM_JOURNAL())
+      if journal_size > max(journal_min_size,
+                            journal_ratio*os.path.getsize(bm_database)):
+          compact()
+      return
+
+  # Re-sort and store the entire database:
+  bibs = [bib for bib in load() if bib.key not in remove]
+  keys = {}
+  for i,bib in enumerate(bibs):
+      keys.setdefault(bib.key, i)
+  for bib in entries:
+      if bib.key in keys:
+          bibs[keys[bib.key]] = bib
+      else:
+          keys[bib.key] = len(bibs)
+          bibs.append(bib)
+  save(sort_bibs(bibs))
+
+
+def compact():
+  """
+  Compact the bibmanager database.  Under the pickle storage, rewrite
+  the database with the changes recorded in its journal (and remove the
+  journal).  Under the SQLite storage, rebuild the database file to
+  reclaim unused space.
+
+  Examples
+  --------
+  >>> import bibmanager.bib_manager as bm
+  >>> bm.compact()
+  """
+  if is_sqlite_storage():
+      with closing(sqlite3.connect(u.BM_DATABASE())) as conn:
+          conn.execute("VACUUM")
+  elif os.path.exists(u.BM_JOURNAL()):
+      save(load())
+
+
+def database_signature():
+  """
+  Signature of the current state of the bibmanager database files:
+  path, size, modification time, and content hash of the database
+  and journal.  The content hash is the payload hash from the header
+  of a pickle database, the file change counter of a SQLite database,
+  or the hash of the journal, such that a same-size rewrite within the
+  modification-time resolution of the file system changes it too.
+  """
+  signature = []
+  for path in [u.BM_DATABASE(), u.BM_JOURNAL()]:
+      with u.ignored(OSError):
+          stat = os.stat(path)
+          if path == u.BM_JOURNAL():
+              with open(path, 'rb') as handle:
+                  digest = hashlib.blake2b(
+                      handle.read(), digest_size=16).digest()
+          elif path.endswith('.sqlite'):
+              with open(path, 'rb') as handle:
+                  digest = handle.read(28)[24:]
+          else:
+              digest = database_hash(path)
+          signature.append((path, stat.st_size, stat.st_mtime_ns, digest))
+  return tuple(signature)
+
+
+def read_index(name):
+  """
+  Read a persisted index of the bibmanager database.  Return None if
+  there is no such index, or if the database changed since it was
+  written.  Each index is pickled into its own file, such that reading
+  one does not read the others.
+  """
+  signature = database_signature()
+  if name in loaded_indices and loaded_indices[name][0] == signature:
+      return loaded_indices[name][1]
+  try:
+      with open(f'{u.BM_INDICES()}{name}.pickle', 'rb') as handle:
+          index_signature, data = pickle.load(handle)
+      if index_signature != signature:
+          return None
+      loaded_indices[name] = signature, pickle.loads(data)
+  except:
+      return None
+  return loaded_indices[name][1]
 
 
-def remove_duplicates(bibs, field):
+def write_index(name, index):
   """
-  Look for duplicates (within a same list of entries) by field and
-  remove them (in place).
+  Persist an index of the (current) bibmanager database (rewriting
+  only the file of this index).
+  """
+  signature = database_signature()
+  loaded_indices[name] = signature, index
+  data = pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL)
+  with u.ignored(OSError):
+      os.makedirs(u.BM_INDICES(), exist_ok=True)
+      with open(f'{u.BM_INDICES()}{name}.pickle', 'wb') as handle:
+          pickle.dump((signature, data), handle,
+                      protocol=pickle.HIGHEST_PROTOCOL)
+  return index
+
+
+def database_index(name, build, bibs=None):
+  """
+  Get a persisted index of the bibmanager database, or build it (and
+  persist it) if it does not exist or is outdated.
 
   Parameters
   ----------
+  name: String
+      Name of the index.
+  build: Callable
+      Function that creates the index from a list of Bib() objects.
   bibs: List of Bib() objects
-      Entries to filter.
-  field: String
-      Field to use for filtering ('doi', 'isbn', 'bibcode', or 'eprint').
+      The entries of the database (load them if None).
   """
-  fieldlist = [getattr(bib,field) if getattr(bib,field) is not None else ""
-               for bib in bibs]
-  # No entries:
-  if len(fieldlist) == 0:
-      return
+  index = read_index(name)
+  if index is None:
+      index = write_index(name, build(load() if bibs is None else bibs))
+  return index
 
-  ubib, uinv, counts = np.unique(fieldlist, return_inverse=True,
-                                 return_counts=True)
-  multis = np.where((counts > 1) & (ubib != ""))[0]
 
-  # No duplicates:
-  if len(multis) == 0:
-      return
+def entry_digest(bib):
+  """
+  Digest of the text (meta info and content) of an entry, as exported
+  into the database bibfile (see export()).
+  """
+  return hashlib.blake2b(
+      f"{bib.meta()}{bib.content}\n\n".encode(), digest_size=16).digest()
 
-  removes = []
-  for m in multis:
-      all_indices = np.where(uinv == m)[0]
-      entries = [bibs[i].content for i in all_indices]
 
-      # Remove identical entries:
-      uentries, uidx = np.unique(entries, return_index=True)
-      indices = list(all_indices[uidx])
-      removes += [idx for idx in all_indices if idx not in indices]
-      nbibs = len(uentries)
-      if nbibs == 1:
+def entry_ids_update(index, bibs=[], remove=[]):
+  """
+  Update an index of entry identifiers (in place), adding or replacing
+  the given entries and removing the entries of the given keys.  The
+  index holds the digest (see entry_digest()) and bibcode of each
+  entry by key, and the keys of the entries of each bibcode (in
+  database order, for the entries indexed at once).
+  """
+  for key in list(remove) + [bib.key for bib in bibs]:
+      if key in index['keys']:
+          digest, bibcode = index['keys'].pop(key)
+          if key in index['bibcodes'].get(bibcode, ()):
+              index['bibcodes'][bibcode].remove(key)
+              if len(index['bibcodes'][bibcode]) == 0:
+                  del index['bibcodes'][bibcode]
+  for bib in bibs:
+      if bib.key in index['keys']:
           continue
+      index['keys'][bib.key] = entry_digest(bib), bib.bibcode
+      if bib.bibcode is not None:
+          index['bibcodes'].setdefault(bib.bibcode, []).append(bib.key)
+  return index
 
-      # Pick peer-reviewed over ArXiv over non-ADS:
-      pubs = [bibs[i].published() for i in indices]
-      pubmax = np.amax(pubs)
-      removes += [idx for idx,pub in zip(indices,pubs) if pub <  pubmax]
-      indices  = [idx for idx,pub in zip(indices,pubs) if pub == pubmax]
-      nbibs = len(indices)
-      if nbibs == 1:
-          continue
 
-      # Querry the user:
-      labels = [idx + " ENTRY:\n" for idx in u.ordinal(np.arange(nbibs)+1)]
-      display_bibs(labels, [bibs[i] for i in indices])
-      s = u.req_input(f"Duplicate {field} field, []keep first, [2]second, "
-           "[3]third, etc.: ", options=[""]+list(np.arange(nbibs)+1))
-      if s == "":
-          indices.pop(0)
-      else:
-          indices.pop(int(s)-1)
-      removes += indices
+def entry_ids(bibs):
+  """Create an index of the identifiers of entries."""
+  return entry_ids_update({'keys':{}, 'bibcodes':{}}, bibs)
+
+
+def exported_entry(ids, key):
+  """
+  Get an entry (by key) from the exported database bibfile, located
+  by its digest (see entry_ids()) through the index of the last export
+  (see export()).  The chunk spans are kept in memory within a session
+  (and read again from the export index if they no longer match the
+  bibfile).  Return None if the bibfile does not hold the entry as in
+  the database, or if the parsed entry differs from it (e.g., for PDF
+  file names with spaces).
+  """
+  bibfile = u.BM_BIBFILE()
+  digest = ids['keys'][key][0]
+  stat = os.stat(u.BM_BIBFILE_INDEX())
+  signature = stat.st_size, stat.st_mtime_ns
+  for reread in [False, True]:
+      if reread or exported_chunks.get('signature') != signature:
+          index = read_export_index(bibfile)
+          if index is None:
+              return None
+          offsets = index['offsets']
+          exported_chunks['signature'] = signature
+          exported_chunks['spans'] = {
+              digest: (offsets[i], offsets[i+1])
+              for i,digest in enumerate(index['hashes'])}
+          reread = True
+      if digest in exported_chunks['spans']:
+          start, end = exported_chunks['spans'][digest]
+          with open(bibfile, 'rb') as f:
+              f.seek(start)
+              chunk = f.read(end-start)
+          if hashlib.blake2b(chunk, digest_size=16).digest() == digest:
+              bib = next(iter_bibfile(text=chunk.decode()), None)
+              # The meta info must survive the parsing (e.g., pdf names):
+              if bib is not None and bib.key == key \
+                      and entry_digest(bib) == digest:
+                  return bib
+      if reread:
+          return None
+
+
+def exported_entries(keys):
+  """
+  Get entries (by key) from the exported database bibfile (see
+  exported_entry()), in database order.  Keys not in the database are
+  skipped.  Return None if the index of entry identifiers is outdated
+  or if the bibfile does not hold all of the entries as in the
+  database.
+  """
+  ids = read_index('ids')
+  if ids is None:
+      return None
+  bibs = []
+  with u.ignored(OSError, ValueError):
+      for key in keys:
+          if key not in ids['keys']:
+              continue
+          bib = exported_entry(ids, key)
+          if bib is None:
+              return None
+          bibs.append(bib)
+      # The bibfile holds the entries in database order:
+      spans = exported_chunks['spans']
+      return sorted(bibs, key=lambda bib: spans[ids['keys'][bib.key][0]])
+  return None
+
+
+def key_positions(bibs):
+  """Position of the entries in the database, by key."""
+  positions = {}
+  for i,bib in enumerate(bibs):
+      positions.setdefault(bib.key, i)
+  return positions
+
+
+def select_keys(bibs, keys):
+  """
+  Get the entries of the database with the given keys (in database
+  order), through the index of key positions.
+  """
+  positions = database_index('keys', key_positions, bibs)
+  selected = sorted(
+      (positions[key], key) for key in keys if key in positions)
+  if any(i >= len(bibs) or bibs[i].key != key for i,key in selected):
+      # Outdated index, scan the database:
+      return [bib for bib in bibs if bib.key in keys]
+  return [bibs[i] for i,key in selected]
+
 
-  for idx in reversed(sorted(removes)):
-      bibs.pop(idx)
+def year_range(year):
+  """Minimum and maximum (including) years of a year search."""
+  if isinstance(year, (tuple, list, np.ndarray)):
+      return year[0], year[1]
+  return year, year
 
 
-def filter_field(bibs, new, field, take):
+def year_match(bib, year):
+  """Check whether an entry matches a year search."""
+  from_year, to_year = year_range(year)
+  return from_year <= bib.year <= to_year
+
+
+def year_index(bibs):
   """
-  Filter duplicate entries by field between new and bibs.
-  This routine modifies new removing the duplicates, and may modify
-  bibs (depending on take argument).
+  Create a column of the years and months of entries, sorted by year
+  and month, with the keys of the entries in the same order.
+  """
+  years = np.array([bib.year for bib in bibs], int)
+  months = np.array([bib.month for bib in bibs], int)
+  order = np.lexsort((months, years))
+  keys = np.array([bib.key for bib in bibs], object)
+  return {'years':years[order], 'months':months[order], 'keys':keys[order]}
 
-  Parameters
-  ----------
-  bibs: List of Bib() objects
-      Database entries.
-  new: List of Bib() objects
-      New entries to add.
-  field: String
-      Field to use for filtering.
-  take: String
-      Decision-making protocol to resolve conflicts when there are
-      duplicated entries:
-      'old': Take the database entry over new.
-      'new': Take the new entry over the database.
-      'ask': Ask user to decide (interactively).
+
+def year_bounds(index, year):
   """
-  fields = [getattr(bib,field) for bib in bibs]
-  removes = []
-  for i,bib in enumerate(new):
-      if getattr(bib,field) is None or getattr(bib,field) not in fields:
-          continue
-      idx = fields.index(getattr(bib,field))
-      # Replace if duplicated and new has newer bibcode:
-      if bib.published() > bibs[idx].published() or take == 'new':
-          bibs[idx].update_content(bib)
-      # Look for different-key conflict:
-      if bib.key != bibs[idx].key and take == "ask":
-          display_bibs(["DATABASE:\n", "NEW:\n"], [bibs[idx], bib])
-          s = u.req_input(f"Duplicate {field} field but different keys, []keep "
-                           "database or take [n]ew: ", options=["", "n"])
-          if s == "n":
-              bibs[idx].update_content(bib)
-      removes.append(i)
-  for idx in reversed(sorted(removes)):
-      new.pop(idx)
+  Find the range of positions in a year column (see year_index())
+  of the entries matching a year search (by bisection).
+  """
+  from_year, to_year = year_range(year)
+  return (np.searchsorted(index['years'], from_year, side='left'),
+          np.searchsorted(index['years'], to_year, side='right'))
 
 
-def loadfile(bibfile=None, text=None):
-    """
-    Create a list of Bib() objects from a BibTeX file (.bib file).
+def author_index_update(index, bibs=[], remove=[]):
+  """
+  Update an index of author names (in place), adding or replacing the
+  given entries and removing the entries of the given keys.  For each
+  purified last name, the index holds the purified names (see
+  author_name()) of the authors of each entry with that last name,
+  for all authors ('authors') and for first authors ('first_authors');
+  plus the last names of each entry.
+  """
+  for key in list(remove) + [bib.key for bib in bibs]:
+      for last in index['entries'].pop(key, ()):
+          for names in [index['authors'], index['first_authors']]:
+              if key in names.get(last, {}):
+                  del names[last][key]
+                  if len(names[last]) == 0:
+                      del names[last]
+  for bib in bibs:
+      names = [author_name(author) for author in bib.authors]
+      index['entries'][bib.key] = {name[0] for name in names}
+      for name in names:
+          index['authors'].setdefault(name[0], {}).setdefault(
+              bib.key, []).append(name)
+      index['first_authors'].setdefault(names[0][0], {})[bib.key] = names[0:1]
+  return index
+
+
+def author_index(bibs):
+  """Create an index of the author names of entries."""
+  return author_index_update(
+      {'authors':{}, 'first_authors':{}, 'entries':{}}, bibs)
+
+
+def author_candidates(index, authors):
+  """
+  Find the keys of the entries matching all given authors (with the
+  same semantics as Bib.__contains__()), by looking up their last
+  names in an index of author names.
 
-    Parameters
-    ----------
-    bibfile: String
-        Path to an existing .bib file.
-    text: String
-        Content of a .bib file (ignored if bibfile is not None).
+  Parameters
+  ----------
+  index: Dictionary
+      An index of author names (see author_index()).
+  authors: Iterable of strings
+      Author names in BibTeX format, a leading '^' character matches
+      only against first authors.
 
-    Returns
-    -------
-    bibs: List of Bib() objects
-        List of Bib() objects of BibTeX entries in bibfile, sorted by
-        Sort_author() fields.
+  Returns
+  -------
+  keys: Set of strings
+      Keys of the matching entries.
+  """
+  keys = None
+  for author in authors:
+      if author[0:1] == '^':
+          author = author[1:]
+          names = index['first_authors']
+      else:
+          names = index['authors']
+      query = author_name(u.parse_name(author))
+      matches = {
+          key for key, entry_names in names.get(query[0], {}).items()
+          if any(author_match(query, name) for name in entry_names)}
+      keys = matches if keys is None else keys & matches
+  return keys
 
-    Examples
-    --------
-    >>> import bibmanager.bib_manager as bm
-    >>> import os
-    >>> bibfile = os.path.expanduser("~") + "/.bibmanager/examples/sample.bib"
-    >>> bibs = bm.loadfile(bibfile)
-    """
-    entries = []  # Store Lists of bibtex entries
-    entry   = []  # Store lines in the bibtex
-    meta_info = []  # Meta information for each entry
-    parcount = 0  # Braces count (+1 for each '{', -1 for each '}')
 
-    # Load a bib file:
-    if bibfile is not None:
-        f = open(bibfile, 'r')
-    elif text is not None:
-        f = text.splitlines()
-    else:
-        raise TypeError("Missing input arguments for loadfile(), at least "
-                        "bibfile or text must be provided.")
+def author_estimate(index, authors):
+  """
+  Estimate the number of entries matching all given authors: the
+  least number of entries with an author of the same last name.
+  """
+  estimates = []
+  for author in authors:
+      names = index['authors']
+      if author[0:1] == '^':
+          author = author[1:]
+          names = index['first_authors']
+      last = u.purify(u.parse_name(author).last)
+      estimates.append(len(names.get(last, ())))
+  return min(estimates)
 
-    meta = {'pdf':None, 'freeze':None}
-    for i,line in enumerate(f):
-        # Meta info:
-        if parcount == 0:
-            if line.lower().startswith('pdf'):
-                meta['pdf'] = line.split()[-1]
-            if line.lower().strip() == 'freeze':
-                meta['freeze'] = True
 
-        # New entry:
-        if line.startswith("@") and parcount != 0:
-            raise ValueError(
-                f"Mismatched braces in line {i}:\n'{line.rstrip()}'")
+def title_words(title):
+  """Words (lower-case alphanumeric runs) of a title."""
+  return frozenset(re.findall(r'\w+', title.lower()))
 
-        parcount += u.count(line)
-        if parcount == 0 and entry == []:
-            continue
 
-        if parcount < 0:
-            raise ValueError(
-                f"Mismatched braces in line {i}:\n'{line.rstrip()}'")
+def title_index_update(index, bibs=[], remove=[]):
+  """
+  Update an inverted index of title words (in place), adding or
+  replacing the given entries and removing the entries of the given
+  keys.  The index holds the keys of the entries with each word in
+  their titles (posting lists), and the title words of each entry.
+  """
+  for key in list(remove) + [bib.key for bib in bibs]:
+      for word in index['titles'].pop(key, ()):
+          index['words'][word].discard(key)
+          if len(index['words'][word]) == 0:
+              del index['words'][word]
+  for bib in bibs:
+      words = index['titles'][bib.key] = title_words(bib.title)
+      for word in words:
+          index['words'].setdefault(word, set()).add(bib.key)
+  index['vocabulary'] = None
+  return index
 
-        entry.append(line.rstrip())
 
-        if parcount == 0 and entry != []:
-            entries.append("\n".join(entry))
-            entry = []
-            meta_info.append(meta)
-            meta = {'pdf':None, 'freeze':None}
+def title_index(bibs):
+  """Create an inverted index of the title words of entries."""
+  return title_index_update({'words':{}, 'titles':{}}, bibs)
 
-    if bibfile is not None:
-        f.close()
 
-    if parcount != 0:
-        raise ValueError("Invalid input, mistmatched braces at end of file.")
+def title_candidates(index, keywords):
+  """
+  Find the keys of the entries whose titles may contain all keywords,
+  by intersecting the posting lists of the words of the keywords.
+  A word enclosed by non-alphanumeric characters within a keyword
+  must be a title word, the words at the ends of a keyword must be
+  part of a title word.
 
-    bibs = [Bib(entry, **meta) for entry,meta in zip(entries,meta_info)]
+  Parameters
+  ----------
+  index: Dictionary
+      An inverted index of title words (see title_index()).
+  keywords: Iterable of strings
+      Keywords to match (ignoring case).
 
-    remove_duplicates(bibs, "doi")
-    remove_duplicates(bibs, "isbn")
-    remove_duplicates(bibs, "bibcode")
-    remove_duplicates(bibs, "eprint")
+  Returns
+  -------
+  keys: Set of strings
+      Keys of the candidate entries (a superset of the entries whose
+      titles contain all keywords), or None if the keywords have no
+      words to match.
+  """
+  postings = []
+  for keyword in keywords:
+      keyword = keyword.lower()
+      for match in re.finditer(r'\w+', keyword):
+          word = match.group()
+          if match.start() > 0 and match.end() < len(keyword):
+              postings.append(index['words'].get(word, set()))
+              continue
+          # Search word within the (newline-separated) vocabulary:
+          if index['vocabulary'] is None:
+              index['vocabulary'] = "\n".join(index['words'])
+          vocabulary = index['vocabulary']
+          keys = set()
+          pos = vocabulary.find(word)
+          while pos >= 0:
+              start = vocabulary.rfind('\n', 0, pos) + 1
+              end = vocabulary.find('\n', pos)
+              if end < 0:
+                  end = len(vocabulary)
+              keys.update(index['words'][vocabulary[start:end]])
+              pos = vocabulary.find(word, end)
+          postings.append(keys)
+  if len(postings) == 0:
+      return None
+  postings.sort(key=len)
+  return postings[0].intersection(*postings[1:])
+
+
+def entry_terms(bib):
+  """
+  Terms (lower-case alphanumeric runs) of the ranked-search fields of
+  an entry (title, abstract, and keywords), with their frequencies.
+  """
+  fields = u.get_fields(bib.content)
+  next(fields)
+  text = " ".join(value for key, value, nested in fields
+                  if key in ranked_fields)
+  return Counter(re.findall(r'\w+', text.lower()))
 
-    # Check pathed-pdf meta values:
-    for i,bib in enumerate(bibs):
-        if bib.pdf is not None and os.path.dirname(bib.pdf) != '':
-            filename = os.path.expanduser(bib.pdf)
-            if not os.path.isfile(filename):
-                bibs[i].pdf = None
-            else:
-                shutil.move(os.path.expanduser(filename),
-                    f"{u.BM_PDF()}{os.path.basename(filename)}")
-                bibs[i].pdf = os.path.basename(filename)
-    return sorted(bibs)
+
+def term_index_update(index, bibs=[], remove=[]):
+  """
+  Update a BM25 term-statistics index (in place), adding or replacing
+  the given entries and removing the entries of the given keys.  Each
+  entry gets a document id.  The index holds, for each term, the
+  document ids and term frequencies of the entries containing it
+  (NumPy arrays); the length (number of terms) of each document; the
+  total length; and the key and terms of each document.
+  """
+  postings = index['postings']
+  for key in list(remove) + [bib.key for bib in bibs]:
+      doc = index['docs'].pop(key, None)
+      if doc is None:
+          continue
+      del index['keys'][doc]
+      for term in index['terms'].pop(doc):
+          docs, freqs = postings[term]
+          keep = docs != doc
+          if np.any(keep):
+              postings[term] = docs[keep], freqs[keep]
+          else:
+              del postings[term]
+      index['total'] -= index['lengths'][doc]
+      index['lengths'][doc] = 0
+
+  added = {}
+  for bib in bibs:
+      if bib.key in index['docs']:
+          continue
+      counts = entry_terms(bib)
+      doc = index['ndocs']
+      index['ndocs'] += 1
+      if doc >= len(index['lengths']):
+          index['lengths'] = np.concatenate(
+              [index['lengths'], np.zeros(doc+1, int)])
+      index['docs'][bib.key] = doc
+      index['keys'][doc] = bib.key
+      index['terms'][doc] = tuple(counts)
+      index['lengths'][doc] = sum(counts.values())
+      index['total'] += index['lengths'][doc]
+      for term, freq in counts.items():
+          docs, freqs = added.setdefault(term, ([], []))
+          docs.append(doc)
+          freqs.append(freq)
+  for term, (docs, freqs) in added.items():
+      docs, freqs = np.array(docs), np.array(freqs)
+      if term in postings:
+          docs = np.concatenate([postings[term][0], docs])
+          freqs = np.concatenate([postings[term][1], freqs])
+      postings[term] = docs, freqs
+  return index
+
+
+def term_index(bibs):
+  """Create a BM25 term-statistics index of entries."""
+  return term_index_update(
+      {'postings':{}, 'docs':{}, 'keys':{}, 'terms':{},
+       'lengths':np.zeros(0, int), 'total':0, 'ndocs':0},
+      bibs)
+
+
+def bm25_scores(index, terms):
+  """
+  BM25 scores of the documents of a term-statistics index (see
+  term_index()) for a query, only computed for the documents
+  containing any of the query terms.
+
+  Returns
+  -------
+  scores: 1D float ndarray
+      Score of each document id (zero if not containing any term).
+  """
+  scores = np.zeros(index['ndocs'])
+  ndocs = len(index['docs'])
+  if ndocs == 0:
+      return scores
+  mean_length = index['total'] / ndocs
+  for term in set(terms):
+      if term not in index['postings']:
+          continue
+      docs, freqs = index['postings'][term]
+      idf = math.log(1.0 + (ndocs - len(docs) + 0.5) / (len(docs) + 0.5))
+      lengths = index['lengths'][docs] / mean_length
+      scores[docs] += idf * freqs * (bm25_k1 + 1) / (
+          freqs + bm25_k1 * (1 - bm25_b + bm25_b*lengths))
+  return scores
 
 
-def save(entries):
+def dedup(resolve=False, fields=dedup_fields, titles=False):
   """
-  Save list of Bib() entries into bibmanager pickle database.
+  Find clusters of duplicate entries in the bibmanager database:
+  entries sharing a doi, isbn, bibcode, eprint, or (normalized) title,
+  directly or through other entries of the cluster.
 
   Parameters
   ----------
-  entries: List of Bib() objects
-      bib files to store.
+  resolve: Bool
+      If True, keep only one entry per cluster (the first one with the
+      highest published() status), and remove the others from the
+      database.  The kept entry takes the PDF file of a removed entry
+      if it has none.  Clusters not linked through the identifiers
+      alone (doi, isbn, bibcode, or eprint) are left unresolved, since
+      different entries can share a generic title (see titles).
+  fields: List of strings
+      Fields to compare.
+  titles: Bool
+      If True, also resolve the clusters linked through their titles.
+
+  Returns
+  -------
+  clusters: List of lists of Bib() objects
+      The clusters of duplicate entries.  When resolving, the kept
+      entry is the first of each cluster (the entries of unresolved
+      clusters remain in the database).
 
   Examples
   --------
   >>> import bibmanager.bib_manager as bm
-  >>> # TBD: Load some entries
-  >>> bm.save(entries)
+  >>> for cluster in bm.dedup():
+  >>>     print([bib.key for bib in cluster])
   """
-  with open(u.BM_DATABASE(), 'wb') as handle:
-      pickle.dump(entries, handle, protocol=pickle.HIGHEST_PROTOCOL)
-      pickle.dump(__version__, handle, protocol=pickle.HIGHEST_PROTOCOL)
+  bibs = load()
+  clusters = [[bibs[i] for i in group]
+              for group in duplicate_groups(bibs, fields)]
+  if not resolve or len(clusters) == 0:
+      return clusters
+
+  identifiers = [field for field in fields if field != 'title']
+  removes = set()
+  for i,cluster in enumerate(clusters):
+      pubs = [bib.published() for bib in cluster]
+      cluster.insert(0, cluster.pop(pubs.index(max(pubs))))
+      clusters[i] = cluster
+      linked = duplicate_groups(cluster, identifiers)
+      if not titles and linked != [list(range(len(cluster)))]:
+          continue
+      keep = cluster[0]
+      if keep.pdf is None:
+          keep.pdf = next(
+              (bib.pdf for bib in cluster[1:] if bib.pdf is not None), None)
+      removes.update(id(bib) for bib in cluster[1:])
 
+  if len(removes) == 0:
+      return clusters
+  bibs = [bib for bib in bibs if id(bib) not in removes]
+  save(bibs)
+  export(bibs, meta=True)
+  return clusters
 
-def load(bm_database=None):
+
+def resolve(report):
   """
-  Load a Bibmanager database of BibTeX entries.
+  Resolve (interactively) the conflicts left unresolved by an
+  unattended merge (see merge()), and update the bibmanager database.
+  Conflicts whose database entry no longer exists are skipped.
 
   Parameters
   ----------
-  bm_database: String
-      A Bibmanager pickle database file.  If None, default's the
-      database in system.
+  report: String
+      Path to a JSON conflicts report written by merge().
 
   Returns
   -------
-  bibs: List Bib() instances
-      Return an empty list if there is no database file.
+  nresolved: Integer
+      Number of conflicts resolved.
 
   Examples
   --------
   >>> import bibmanager.bib_manager as bm
-  >>> bibs = bm.load()
+  >>> bm.merge('my_file.bib', take='ask', report='conflicts.json')
+  >>> bm.resolve('conflicts.json')
   """
-  if bm_database is None:
-      bm_database = u.BM_DATABASE()
+  with open(report, 'r') as f:
+      conflicts = json.load(f)['conflicts']
+
+  bibs = load()
+  bm_keys = {bib.key: bib for bib in bibs}
+  # Database entries by identifier (first one for each value):
+  identifiers = [field for field in dedup_fields if field != 'title']
+  bm_ids = {}
+  for field in identifiers:
+      for bib in bibs:
+          if field_value(bib, field) is not None:
+              bm_ids.setdefault((field, field_value(bib, field)), bib)
+  new = []
+  nresolved = 0
+  for conflict in conflicts:
+      entries = [next(iter_bibfile(text=text)) for text in conflict['new']]
+      if conflict['kind'] == 'duplicates':
+          # The first entry was merged (if it passed the other filters),
+          # find it by the shared identifiers (its key may be taken):
+          database = None
+          for field in conflict['field'].split('/'):
+              value = field_value(entries[0], field)
+              if database is None and (field, value) in bm_ids:
+                  database = bm_ids[field, value]
+          s = query_conflict('duplicates', None, entries, conflict['field'])
+          if s != "" and int(s) > 1:
+              bib = entries[int(s)-1]
+              if database is not None:
+                  database.update_content(bib)
+              elif bib.key not in bm_keys:
+                  new.append(bib)
+                  bm_keys[bib.key] = bib
+                  for field in identifiers:
+                      if field_value(bib, field) is not None:
+                          bm_ids.setdefault((field, field_value(bib, field)),
+                                            bib)
+          nresolved += 1
+          continue
 
-  try:
-      with open(bm_database, 'rb') as handle:
-          bibs = pickle.load(handle)
-  except:
-      return []
-  return bibs
+      if conflict['key'] not in bm_keys:
+          print(f"\nSkipping {conflict['kind']} conflict, entry "
+                f"'{conflict['key']}' is no longer in the database.")
+          continue
+      database, bib = bm_keys[conflict['key']], entries[0]
+      s = query_conflict(conflict['kind'], database, [bib], conflict['field'])
+      if conflict['kind'] == 'key' and s not in ["", "n"]:
+          if s in bm_keys:
+              print(f"Key '{s}' is already in the database, ignoring new.")
+          else:
+              bib.update_key(s)
+              new.append(bib)
+              bm_keys[s] = bib
+      elif conflict['kind'] in ['title', 'similar title'] and s == "a" \
+              and bib.key not in bm_keys:
+          new.append(bib)
+          bm_keys[bib.key] = bib
+      nresolved += 1
+
+  bibs = sort_bibs(bibs + new)
+  save(bibs)
+  export(bibs, meta=True)
+  return nresolved
 
 
 def find(key=None, bibcode=None, bibs=None):
     """
     Find an specific entry in the database.
 
+    When searching the Bibmanager database, look up the entry in an
+    index of keys and bibcodes, and take it from the exported database
+    bibfile (or by its indexed column under the SQLite storage), rather
+    than loading the whole database.
+
     Parameters
     ----------
     key: String
         Key of entry to find.
     bibcode: String
         Bibcode of entry to find (ignored if key is not None).
+        No need to worry about UTF-8 encoding.
     bibs: List of Bib() instances
         Database where to search.  If None, load the Bibmanager database.
 
@@ -641,8 +2580,38 @@ def find(key=None, bibcode=None, bibs=None):
     bib: a Bib() instance
         BibTex matching either key or bibcode.
     """
+    if key is None and bibcode is None:
+        raise ValueError("Either key or bibcode arguments must be specified.")
+    if bibcode is not None:
+        bibcode = urllib.parse.unquote(bibcode)
+
+    # Query by the indexed columns, rather than loading the database:
+    if bibs is None and is_sqlite_storage():
+        field = 'key' if key is not None else 'bibcode'
+        value = key if key is not None else bibcode
+        matches = sqlite_select(f"WHERE {field}=?", (value,))
+        return matches[0] if len(matches) > 0 else None
+
+    ids = read_index('ids') if bibs is None else None
+    if ids is not None:
+        if key is None:
+            keys = ids['bibcodes'].get(bibcode, [])
+            if len(keys) == 0:
+                return None
+            # Several entries share the bibcode, take the first one
+            # in the database (below):
+            key = keys[0] if len(keys) == 1 else None
+        if key is not None and key not in ids['keys']:
+            return None
+        # Take the entry from the exported database, if up to date:
+        with u.ignored(OSError, ValueError):
+            bib = None if key is None else exported_entry(ids, key)
+            if bib is not None and (bibcode is None or bib.bibcode == bibcode):
+                return bib
     if bibs is None:
         bibs = load()
+        if ids is None:
+            write_index('ids', entry_ids(bibs))
 
     if key is not None:
         for bib in bibs:
@@ -658,14 +2627,15 @@ def find(key=None, bibcode=None, bibs=None):
         else:
             return None
 
-    raise ValueError("Either key or bibcode arguments must be specified.")
-
 
 def get_version(bm_database=None):
   """
-  Get version of pickled database file.
+  Get version of pickled (or SQLite) database file.
   If database does not exists, return current bibmanager version.
   If database does not contain version, return '0.0.0'.
+  The version is read from the file header, without loading the
+  entries.  Old-layout (header-less) files are read as they are; they
+  get a header the next time the database is saved.
 
   Parameters
   ----------
@@ -689,18 +2659,47 @@ def get_version(bm_database=None):
   if not os.path.exists(bm_database):
       return __version__
 
+  if is_sqlite(bm_database):
+      with closing(sqlite_connect(bm_database)) as conn:
+          version = conn.execute(
+              "SELECT value FROM meta WHERE name='version'").fetchone()
+      return '0.0.0' if version is None else version[0]
+
   with open(bm_database, 'rb') as handle:
-      dummy = pickle.load(handle)
+      header = read_header(handle)
+      if header is not None:
+          return header.version
+      pickle.load(handle)
       try:
-          version = pickle.load(handle)
+          return pickle.load(handle)
       except EOFError:
-          version = '0.0.0'
-  return version
+          return '0.0.0'
+
+
+def read_export_index(bibfile):
+    """
+    Read the index of the last export into a bibfile: the size and
+    modification time of the file, and the hashes and offsets of its
+    chunks (the header and each entry).  Return None if there is no
+    index or if the bibfile changed since.
+    """
+    try:
+        with open(u.BM_BIBFILE_INDEX(), 'rb') as handle:
+            index = pickle.load(handle)
+        stat = os.stat(bibfile)
+    except:
+        return None
+    if (stat.st_size, stat.st_mtime_ns) != (index['size'], index['mtime']):
+        return None
+    return index
 
 
 def export(entries, bibfile=None, meta=False):
     """
     Export list of Bib() entries into a .bib file.
+    When exporting into the home bibfile, keep an index of the
+    entries' hashes and offsets, such that later exports only write
+    the entries that changed.
 
     Parameters
     ----------
@@ -711,6 +2710,12 @@ def export(entries, bibfile=None, meta=False):
     meta: Bool
         If True, include meta information before the entries on the
         output bib file.
+
+    Returns
+    -------
+    nbytes: Integer
+        Number of bytes written into bibfile (zero if the home bibfile
+        was already up to date).
     """
     if bibfile is None:
         bibfile = u.BM_BIBFILE()
@@ -726,16 +2731,136 @@ def export(entries, bibfile=None, meta=False):
             shutil.copy(bibfile, "".join(
                 [path, '/orig_', str(datetime.date.today()), '_', bfile]))
 
-    with open(bibfile, 'w') as f:
-        f.writelines(header)
-        for bib in entries:
-            if meta:
-                f.write(bib.meta())
-            f.write(bib.content)
-            f.write("\n\n")
+    chunks = ["".join(header).encode()]
+    for bib in entries:
+        chunk = bib.meta() + bib.content if meta else bib.content
+        chunks.append(f"{chunk}\n\n".encode())
+    hashes = [hashlib.blake2b(chunk, digest_size=16).digest()
+              for chunk in chunks]
+    offsets = [0]
+    for chunk in chunks:
+        offsets.append(offsets[-1] + len(chunk))
+
+    is_home = os.path.realpath(bibfile) == os.path.realpath(u.BM_BIBFILE())
+    index = read_export_index(bibfile) if is_home else None
+    if index is None:
+        with open(bibfile, 'wb') as f:
+            nbytes = f.write(b"".join(chunks))
+    else:
+        old_hashes, old_offsets = index['hashes'], index['offsets']
+        changed = [i for i,digest in enumerate(hashes)
+                   if i >= len(old_hashes) or digest != old_hashes[i]]
+        nbytes = 0
+        if changed == [] and len(hashes) == len(old_hashes):
+            return nbytes
+        with open(bibfile, 'r+b') as f:
+            # Same-size chunks, patch in place:
+            if len(hashes) == len(old_hashes) and all(
+                    offsets[i+1]-offsets[i] == old_offsets[i+1]-old_offsets[i]
+                    for i in changed):
+                for i in changed:
+                    f.seek(offsets[i])
+                    nbytes += f.write(chunks[i])
+            # Otherwise, rewrite from the first changed chunk on:
+            else:
+                first = changed[0] if changed != [] else len(hashes)
+                f.seek(offsets[first])
+                nbytes += f.write(b"".join(chunks[first:]))
+                f.truncate()
+
+    if is_home:
+        stat = os.stat(bibfile)
+        index = {'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                 'hashes': hashes, 'offsets': offsets,
+                 'keys': [None] + [bib.key for bib in entries]}
+        with open(u.BM_BIBFILE_INDEX(), 'wb') as handle:
+            pickle.dump(index, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    return nbytes
+
+
+def update_bibfile(entries):
+    """
+    Update entries (matched by key) in the home bibfile, through the
+    index of the last export (see export()), without loading the
+    database: only the entries' chunks are rendered, and the bytes
+    after them shifted.  The entries must keep their position in the
+    database (e.g., when only their meta information changed).
+
+    Parameters
+    ----------
+    entries: List of Bib() objects
+        Entries to update.
 
+    Returns
+    -------
+    updated: Bool
+        False if the bibfile could not be updated this way (there is
+        no up-to-date export index, or an entry is not in it), in
+        which case the bibfile must be exported entirely.
 
-def merge(bibfile=None, new=None, take="old", base=None):
+    Examples
+    --------
+    >>> import bibmanager.bib_manager as bm
+    >>> bib = bm.find(key='AASteamHendrickson2018aastex62')
+    >>> bib.pdf = 'AASteam2018.pdf'
+    >>> bm.upsert([bib])
+    >>> if not bm.update_bibfile([bib]):
+    >>>     bm.export(bm.load(), meta=True)
+    """
+    bibfile = u.BM_BIBFILE()
+    index = read_export_index(bibfile)
+    if index is None or 'keys' not in index:
+        return False
+    positions = {key: i for i,key in enumerate(index['keys'])}
+    if any(bib.key not in positions for bib in entries):
+        return False
+
+    hashes, offsets = index['hashes'], list(index['offsets'])
+    chunks = {}
+    for bib in entries:
+        chunk = f"{bib.meta()}{bib.content}\n\n".encode()
+        digest = hashlib.blake2b(chunk, digest_size=16).digest()
+        if digest != hashes[positions[bib.key]]:
+            chunks[positions[bib.key]] = chunk
+            hashes[positions[bib.key]] = digest
+    if len(chunks) == 0:
+        return True
+
+    first = min(chunks)
+    with open(bibfile, 'r+b') as f:
+        # Same-size chunks, patch in place:
+        if all(len(chunk) == offsets[i+1]-offsets[i]
+               for i,chunk in chunks.items()):
+            for i,chunk in chunks.items():
+                f.seek(offsets[i])
+                f.write(chunk)
+        # Otherwise, shift the bytes after the first changed chunk:
+        else:
+            f.seek(offsets[first])
+            tail = f.read()
+            data = []
+            for i in range(first, len(hashes)):
+                if i in chunks:
+                    data.append(chunks[i])
+                else:
+                    start = offsets[i] - offsets[first]
+                    data.append(tail[start:start+offsets[i+1]-offsets[i]])
+            f.seek(offsets[first])
+            f.write(b"".join(data))
+            f.truncate()
+            for i in range(first, len(hashes)):
+                offsets[i+1] = offsets[i] + len(data[i-first])
+
+    index['offsets'] = offsets
+    stat = os.stat(bibfile)
+    index['size'], index['mtime'] = stat.st_size, stat.st_mtime_ns
+    with open(u.BM_BIBFILE_INDEX(), 'wb') as handle:
+        pickle.dump(index, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    return True
+
+
+def merge(bibfile=None, new=None, take="old", base=None, workers=None,
+          report=None):
   """
   Merge entries from a new bibfile into the bibmanager database
   (or into an input database).
@@ -755,6 +2880,13 @@ def merge(bibfile=None, new=None, take="old", base=None):
   base: List of Bib() objects
       If None, merge new entries into the bibmanager database.
       If not None, merge new intries into base.
+  workers: Integer
+      Number of processes to parse bibfile in parallel (see loadfile()).
+  report: String
+      If not None, merge without querying the user: leave every
+      conflict unresolved (keep the database entry, ignore the new
+      one), and write the conflicts into this JSON file, to be
+      resolved later with resolve().
 
   Returns
   -------
@@ -769,70 +2901,121 @@ def merge(bibfile=None, new=None, take="old", base=None):
   >>> newbib = os.path.expanduser("~") + "/.bibmanager/examples/sample2.bib"
   >>> # Merge newbib into database:
   >>> bm.merge(newbib, take='old')
+  >>> # Unattended merge, resolve conflicts afterwards:
+  >>> bm.merge(newbib, take='ask', report='conflicts.json')
+  >>> bm.resolve('conflicts.json')
   """
+  conflicts = None if report is None else []
   if base is None:
       bibs = load()
+      # Snapshot of the database entries, to journal only the changes:
+      snapshot = {id(bib): (bib.key, repr(bib), bib.sort_key) for bib in bibs}
   else:
       bibs = base
 
   if bibfile is not None:
-      new = loadfile(bibfile)
+      new = loadfile(bibfile, workers=workers, conflicts=conflicts)
   if new is None:
       return
 
   # Filter duplicates by field:
-  filter_field(bibs, new, "doi",     take)
-  filter_field(bibs, new, "isbn",    take)
-  filter_field(bibs, new, "bibcode", take)
-  filter_field(bibs, new, "eprint",  take)
+  filter_field(bibs, new, "doi",     take, conflicts)
+  filter_field(bibs, new, "isbn",    take, conflicts)
+  filter_field(bibs, new, "bibcode", take, conflicts)
+  filter_field(bibs, new, "eprint",  take, conflicts)
 
   # Filter duplicate key:
   keep = np.zeros(len(new), bool)
-  bm_keys = [bib.key for bib in bibs]
+  reviewed = {}  # Database keys already compared to renamed new entries
+  bm_keys = {}
+  for i,bib in enumerate(bibs):
+      bm_keys.setdefault(bib.key, i)
   for i,bib in enumerate(new):
       if bib.key not in bm_keys:
           keep[i] = True
           continue
-      idx = bm_keys.index(bib.key)
+      idx = bm_keys[bib.key]
       if bib.content == bibs[idx].content:
           continue # Duplicate, do not take
+      elif conflicts is not None:
+          record_conflict(conflicts, 'key', bibs[idx], [bib])
       else:
-          display_bibs(["DATABASE:\n", "NEW:\n"], [bibs[idx], bib])
-          s = input("Duplicate key but content differ, []ignore new, "
-                    "take [n]ew, or\nrename key of new entry: ")
-          if s == "n":
-              bibs[idx].update_content(bib)
-          elif s != "":
+          s = query_conflict('key', bibs[idx], [bib])
+          if s not in ["", "n"]:
+              reviewed[id(bib)] = bib.key
               new[i].key = s
               new[i].content.replace(bib.key, s)
               keep[i] = True
   new = [bib for bib,keeper in zip(new,keep) if keeper]
 
-  # Different key, same title:
+  # Different key, same or similar title (by MinHash LSH):
+  index = read_index('titles') if base is None else None
+  if index is None:
+      index = lsh_index(bibs)
+  words = read_index('title_words') if base is None else None
+  positions = read_index('keys') if base is None else None
+  names = read_index('authors') if base is None else None
+  ids = read_index('ids') if base is None else None
+  years = read_index('years') if base is None else None
+  terms = read_index('terms') if base is None else None
   keep = np.zeros(len(new), bool)
-  bm_titles = [bib.title for bib in bibs]
+  bm_titles = {}
+  for i,bib in enumerate(bibs):
+      bm_titles.setdefault(bib.title, i)
   for i,bib in enumerate(new):
-      if bib.title not in bm_titles:
-          keep[i] = True
+      if bib.title in bm_titles:
+          idx = bm_titles[bib.title]
+          kind = 'title'
+      else:
+          similar = [key for key in near_duplicates(index, bib)
+                     if key in bm_keys and key != reviewed.get(id(bib))]
+          if len(similar) == 0:
+              keep[i] = True
+              continue
+          idx = bm_keys[similar[0]]
+          kind = 'similar title'
+      if conflicts is not None:
+          record_conflict(conflicts, kind, bibs[idx], [bib])
           continue
-      idx = bm_titles.index(bib.title)
-      display_bibs(["DATABASE:\n", "NEW:\n"], [bibs[idx], bib])
-      s = u.req_input("Possible duplicate, same title but keys differ, "
-                      "[]ignore new, [r]eplace database with new, "
-                      "or [a]dd new: ", options=["", "r", "a"])
-      if s == "r":
-          bibs[idx].update_content(bib)
-      elif s == "a":
+      if query_conflict(kind, bibs[idx], [bib]) == "a":
           keep[i] = True
   new = [bib for bib,keeper in zip(new,keep) if keeper]
 
-  # Add all new entries and sort:
-  bibs = sorted(bibs + new)
+  # Add all new entries and sort (insert a few into the sorted database):
+  if base is None and len(new) <= insort_max_entries and \
+          all(bib.sort_key == snapshot[id(bib)][2] for bib in bibs):
+      insort_bibs(bibs, new)
+  else:
+      bibs = sort_bibs(bibs + new)
   print(f"\nMerged {len(new)} new entries.")
 
   if base is None:
-      save(bibs)
+      changed = [bib for bib in bibs
+                 if snapshot.get(id(bib), (None,None,None))[1] != repr(bib)]
+      keys = {bib.key for bib in bibs}
+      removed = {key for key,content,sort_key in snapshot.values()
+                 if key not in keys}
+      upsert(changed, remove=list(removed))
       export(bibs, meta=True)
+      write_index('titles', lsh_update(index, changed, removed))
+      if words is not None:
+          write_index('title_words',
+                      title_index_update(words, changed, removed))
+      if positions is not None:
+          write_index('keys', key_positions(bibs))
+      if names is not None:
+          write_index('authors', author_index_update(names, changed, removed))
+      if ids is not None:
+          write_index('ids', entry_ids_update(ids, changed, removed))
+      if years is not None:
+          write_index('years', year_index(bibs))
+      if terms is not None:
+          write_index('terms', term_index_update(terms, changed, removed))
+
+  if report is not None:
+      with open(report, 'w') as f:
+          json.dump({'version':__version__, 'conflicts':conflicts}, f,
+                    indent=2)
 
   return bibs
 
@@ -876,9 +3059,15 @@ def init(bibfile=None, reset_db=True, reset_config=False):
 
   if reset_db:
       if bibfile is None:
-          for bm_file in [u.BM_DATABASE(), u.BM_BIBFILE()]:
+          bm_files = [u.BM_DATABASE(), u.BM_JOURNAL(),
+                      u.BM_BIBFILE(), u.BM_BIBFILE_INDEX(), u.BM_OFFSETS(),
+                      u.BM_PARSE_CACHE()]
+          for bm_file in bm_files:
               with u.ignored(OSError):
                   os.remove(bm_file)
+          shutil.rmtree(u.BM_INDICES(), ignore_errors=True)
+          loaded_indices.clear()
+          exported_chunks.clear()
       else:
           bibs = loadfile(bibfile)
           save(bibs)
@@ -940,14 +3129,18 @@ def edit():
         # Always delete the tmp file:
         os.remove(u.BM_TMP_BIB())
     # Update database if everything went fine:
-    with u.ignored(OSError):
-        os.remove(u.BM_DATABASE())
-    merge(new=new)
+    bibs = merge(new=new, base=[])
+    save(bibs)
+    export(bibs, meta=True)
 
 
 def search(authors=None, year=None, title=None, key=None, bibcode=None):
   """
   Search in bibmanager database by authors, year, or title keywords.
+  The filters are applied through indices of the database, the most
+  selective ones first.  Under the pickle storage, the matching
+  entries are taken from the exported database bibfile (if up to
+  date), rather than by loading the database.
 
   Parameters
   ----------
@@ -993,37 +3186,23 @@ def search(authors=None, year=None, title=None, key=None, bibcode=None):
   >>>                              "1957RvMP...29..547B",
   >>>                              "2017AJ....153....3C"])
   """
-  matches = load()
-  if year is not None:
-      try: # Assume year = [from_year, to_year]
-          matches = [bib for bib in matches if bib.year >= year[0]]
-          matches = [bib for bib in matches if bib.year <= year[1]]
-      except:
-          matches = [bib for bib in matches if bib.year == year]
-
   if authors is not None:
       if isinstance(authors, str):
           authors = [authors]
       elif not isinstance(authors, (list, tuple, np.ndarray)):
           raise ValueError("Invalid input format for 'authors'.")
-      for author in authors:
-          matches = [bib for bib in matches if author in bib]
 
   if title is not None:
       if isinstance(title, str):
           title = [title]
       elif not isinstance(title, (list, tuple, np.ndarray)):
           raise ValueError("Invalid input format for 'title'.")
-      for word in title:
-          matches = [bib for bib in matches
-                     if word.lower() in bib.title.lower()]
 
   if key is not None:
       if isinstance(key, str):
           key = [key]
       elif not isinstance(key, (list, tuple, np.ndarray)):
           raise ValueError("Invalid input format for 'key'.")
-      matches = [bib for bib in matches if bib.key in key]
 
   if bibcode is not None:
       if isinstance(bibcode, str):
@@ -1032,11 +3211,149 @@ def search(authors=None, year=None, title=None, key=None, bibcode=None):
           raise ValueError("Invalid input format for 'bibcode'.")
       # Take care of encoding:
       bibcode = [urllib.parse.unquote(b) for b in bibcode]
-      matches = [bib for bib in matches if bib.bibcode in bibcode]
+
+  # Empty lists of authors or title keywords do not filter:
+  if authors is not None and len(authors) == 0:
+      authors = None
+  if title is not None and len(title) == 0:
+      title = None
+
+  # Load the pickle database only to build outdated indices, or to
+  # take too many (or not exported) matches:
+  sqlite = is_sqlite_storage()
+  bibs = None
+  indices = [('ids', bibcode), ('years', year), ('authors', authors),
+             ('title_words', title)]
+  if not sqlite and any(read_index(name) is None
+                        for name,value in indices if value is not None):
+      bibs = load()
+
+  # Plan the query: each filter has an estimated number of matches,
+  # the keys of its matches (through its index), and a check of an
+  # entry.  Take the matches of the most selective filters, and only
+  # check the other filters once few candidates are left:
+  filters = []
+  if key is not None:
+      filters.append((len(key),
+          lambda: set(key),
+          lambda bib: bib.key in key))
+  if bibcode is not None:
+      ids = database_index('ids', entry_ids, bibs)
+      filters.append((len(bibcode),
+          lambda: {k for b in bibcode for k in ids['bibcodes'].get(b, [])},
+          lambda bib: bib.bibcode in bibcode))
+  if year is not None:
+      years = database_index('years', year_index, bibs)
+      first, last = year_bounds(years, year)
+      filters.append((last-first,
+          lambda: set(years['keys'][first:last]),
+          lambda bib: year_match(bib, year)))
+  if authors is not None:
+      names = database_index('authors', author_index, bibs)
+      filters.append((author_estimate(names, authors),
+          lambda: author_candidates(names, authors),
+          lambda bib: all(author in bib for author in authors)))
+  if title is not None:
+      words = database_index('title_words', title_index, bibs)
+      # Title matches are checked in any case (see below):
+      filters.append((len(words['titles']),
+          lambda: title_candidates(words, title),
+          lambda bib: True))
+
+  candidates = None
+  checks = []
+  for estimate, matches, check in sorted(filters, key=lambda f: f[0]):
+      if candidates is not None and len(candidates) <= search_check_max:
+          checks.append(check)
+          continue
+      keys = matches()
+      if keys is not None:
+          candidates = keys if candidates is None else candidates & keys
+
+  # Take the candidate entries:
+  if sqlite and candidates is not None and len(candidates)<=sqlite_max_keys:
+      matches = sqlite_select(
+          f"WHERE key IN ({', '.join('?'*len(candidates))})",
+          tuple(candidates))
+  elif sqlite and year is not None:
+      matches = sqlite_select("WHERE year>=? AND year<=?",
+                              tuple(int(y) for y in year_range(year)))
+  elif sqlite:
+      matches = load()
+  else:
+      matches = None
+      if bibs is None and candidates is not None \
+              and len(candidates) <= search_exported_max:
+          matches = exported_entries(candidates)
+      if matches is None:
+          if bibs is None:
+              bibs = load()
+          matches = bibs if candidates is None \
+              else select_keys(bibs, candidates)
+  if candidates is not None:
+      matches = [bib for bib in matches if bib.key in candidates]
+
+  for check in checks:
+      matches = [bib for bib in matches if check(bib)]
+  if title is not None:
+      for word in title:
+          matches = [bib for bib in matches
+                     if word.lower() in bib.title.lower()]
 
   return matches
 
 
+def ranked_search(query, nresults=None):
+  """
+  Search the bibmanager database by relevance: rank the entries by
+  their BM25 score for the words of a query, over the title, abstract,
+  and keywords fields, and take the best-ranked entries (selected
+  with a heap, only among the entries containing any query word).
+
+  Parameters
+  ----------
+  query: String
+      Words to search (ignore case).
+  nresults: Integer
+      Maximum number of entries to return (default: ranked_results).
+
+  Returns
+  -------
+  matches: List of Bib() objects
+      Entries matching any query word, from most to least relevant.
+
+  Examples
+  --------
+  >>> import bibmanager.bib_manager as bm
+  >>> matches = bm.ranked_search('exoplanet atmosphere retrieval', 5)
+  """
+  if nresults is None:
+      nresults = ranked_results
+  sqlite = is_sqlite_storage()
+  bibs = None
+  if not sqlite and read_index('terms') is None:
+      bibs = load()
+  index = database_index('terms', term_index, bibs)
+  scores = bm25_scores(index, re.findall(r'\w+', query.lower()))
+  docs = heapq.nlargest(
+      nresults, np.flatnonzero(scores), key=scores.__getitem__)
+  keys = [index['keys'][doc] for doc in docs]
+
+  # Take the ranked entries:
+  if sqlite:
+      entries = []
+      for i in range(0, len(keys), sqlite_max_keys):
+          chunk = keys[i:i+sqlite_max_keys]
+          entries += sqlite_select(
+              f"WHERE key IN ({', '.join('?'*len(chunk))})", tuple(chunk))
+  else:
+      entries = exported_entries(keys) if bibs is None else None
+      if entries is None:
+          entries = select_keys(load() if bibs is None else bibs, set(keys))
+  entries = {bib.key: bib for bib in entries}
+  return [entries[key] for key in keys if key in entries]
+
+
 def prompt_search(keywords, field, prompt_text):
     r"""
     Do an interactive prompt search in the Bibmanager database by
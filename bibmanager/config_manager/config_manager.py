@@ -73,6 +73,14 @@ def help(key):
       print(f"\nThe '{key}' parameter sets the home directory for the "
              "Bibmanager database.\n\n"
             f"The current directory is '{get(key)}'.")
+
+  elif key == 'storage':
+      print(f"\nThe '{key}' parameter sets the storage backend for the "
+             "Bibmanager database.\nAvailable options are 'pickle' (a single "
+             "pickle file, rewritten on each\nchange) or 'sqlite' (an "
+             "indexed SQLite database, with single-entry\nreads and "
+             "writes).\n\n"
+            f"The current storage backend is '{get(key)}'.")
   else:
       # Call get() to trigger exception:
       get(key)
@@ -102,6 +110,7 @@ def display(key=None):
   ads_token    None
   ads_display  20
   home         /home/user/.bibmanager/
+  storage      pickle
 
   >>> # Show an specific parameter:
   >>> cm.display('text_editor')
@@ -175,7 +184,8 @@ def set(key, value):
   >>> cm.set('styles', 'arduino')
   ValueError: 'styles' is not a valid bibmanager config parameter.
   The available parameters are:
-    ['style', 'text_editor', 'paper', 'ads_token', 'ads_display', 'home']
+    ['style', 'text_editor', 'paper', 'ads_token', 'ads_display', 'home',
+     'storage']
 
   >>> # Attempt to set an invalid style:
   >>> cm.set('style', 'fake_style')
@@ -213,6 +223,15 @@ def set(key, value):
   if key == 'ads_display' and (not value.isnumeric() or value=='0'):
       raise ValueError(f"The {key} value must be a positive integer.")
 
+  if key == 'storage' and value not in ['pickle', 'sqlite']:
+      raise ValueError(f"The {key} value must be either 'pickle' or "
+                        "'sqlite'.")
+
+  # Take the entries with the current backend, store them later:
+  if key == 'storage':
+      old_database = u.BM_DATABASE()
+      bibs = bm.load()
+
   if key == 'home':
       value = os.path.abspath(os.path.expanduser(value)) + '/'
       new_home = pathlib.Path(value)
@@ -230,7 +249,12 @@ def set(key, value):
       # Files to move (config has to stay at u.HOME):
       bm_files = [
           u.BM_DATABASE(),
+          u.BM_JOURNAL(),
           u.BM_BIBFILE(),
+          u.BM_BIBFILE_INDEX(),
+          u.BM_OFFSETS(),
+          u.BM_PARSE_CACHE(),
+          u.BM_INDICES(),
           u.BM_CACHE(),
           u.BM_HISTORY_SEARCH(),
           u.BM_HISTORY_ADS(),
@@ -251,12 +275,16 @@ def set(key, value):
           new_biblio = f'{new_home}/{os.path.basename(u.BM_BIBFILE())}'
           bm.merge(new=bm.loadfile(new_biblio), take='new')
 
-      # Move (overwrite) database files:
-      bm_files = [bm_file for bm_file in bm_files if os.path.isfile(bm_file)]
+      # Move (overwrite) database files (and the indices folder):
+      bm_files = [bm_file.rstrip('/') for bm_file in bm_files
+                  if os.path.exists(bm_file)]
       new_files = os.listdir(new_home)
       for bm_file in bm_files:
-          if os.path.basename(bm_file) in new_files:
-              os.remove(f'{new_home}/{os.path.basename(bm_file)}')
+          new_file = f'{new_home}/{os.path.basename(bm_file)}'
+          if os.path.isdir(new_file):
+              shutil.rmtree(new_file)
+          elif os.path.basename(bm_file) in new_files:
+              os.remove(new_file)
           shutil.move(bm_file, str(new_home))
 
       # Move (overwrite) PDF files:
@@ -270,6 +298,12 @@ def set(key, value):
   config.set('BIBMANAGER', key, value)
   with open(u.HOME+'config', 'w') as configfile:
       config.write(configfile)
+
+  # Move database into the new storage backend:
+  if key == 'storage' and u.BM_DATABASE() != old_database:
+      bm.save(bibs)
+      with u.ignored(OSError):
+          os.remove(old_database)
   print(f'{key} updated to: {value}.')
 
 
@@ -226,12 +226,10 @@ def set_pdf(bib, pdf=None, bin_pdf=None, filename=None,
     print(f"Saved PDF to: '{u.BM_PDF()}{filename}'.")
 
     # Update entry and database:
-    bibs = bm.load()
-    index = bibs.index(bib)
     bib.pdf = filename
-    bibs[index] = bib
-    bm.save(bibs)
-    bm.export(bibs, meta=True)
+    bm.upsert([bib])
+    if not bm.update_bibfile([bib]):
+        bm.export(bm.load(), meta=True)
 
 
 def request_ads(bibcode, source='journal'):
@@ -12,7 +12,12 @@ __all__ = [
     'ads_keywords',
     # Pseudo-constants:
     'BM_DATABASE',
+    'BM_JOURNAL',
     'BM_BIBFILE',
+    'BM_BIBFILE_INDEX',
+    'BM_OFFSETS',
+    'BM_PARSE_CACHE',
+    'BM_INDICES',
     'BM_TMP_BIB',
     'BM_CACHE',
     'BM_HISTORY_SEARCH',
@@ -31,6 +36,8 @@ __all__ = [
     'nest',
     'cond_split',
     'cond_next',
+    'set_name_cache',
+    'name_cache_info',
     'parse_name',
     'repr_author',
     'purify',
@@ -50,6 +57,7 @@ __all__ = [
 
 import os
 import re
+import functools
 from contextlib import contextmanager
 from collections import namedtuple
 
@@ -72,16 +80,54 @@ END  = '\033[0m'
 # A delimiter:
 BANNER = "\n" + ":"*70 + "\n"
 
+# Maximum number of memoized names for each of parse_name(), purify(),
+# and initials() (see set_name_cache()):
+name_cache_size = 65536
+name_caches = {}
+
+# LaTeX accents and special letters removed by purify(): a backslash
+# plus a ("^`.'~) accent; plus a (cuHvdbt) accent and a blank (or
+# before a brace); or just the backslash of the (o O l L i j aa AA
+# AE oe OE ss) letters:
+latex_accents = r"""\\(?:["^`.'~]|[cuHvdbt](?: |(?=\{))|(?=[oOlLij]|aa|A[AE]|ss))"""
+purify_regex = re.compile(latex_accents)
+# German umlauts (replaced by the vowel followed by an 'e'):
+purify_german_regex = re.compile(r'\\"([aou])|' + latex_accents)
+no_braces = str.maketrans('', '', '{}')
+
 
 # Pseudo-constants:
 def BM_DATABASE():
-    """The database of BibTex entries"""
+    """The database of BibTex entries (according to the storage backend)"""
+    with ignored(ValueError):
+        if cm.get('storage') == 'sqlite':
+            return cm.get('home') + 'bm_database.sqlite'
     return cm.get('home') + 'bm_database.pickle'
 
+def BM_JOURNAL():
+    """Journal of changes to the (pickle) database of BibTex entries"""
+    return cm.get('home') + 'bm_database.journal'
+
 def BM_BIBFILE():
     """Bibfile representation of the database"""
     return cm.get('home') + 'bm_bibliography.bib'
 
+def BM_BIBFILE_INDEX():
+    """Entry hashes and offsets of the bibfile representation"""
+    return cm.get('home') + 'bm_bibliography.index'
+
+def BM_OFFSETS():
+    """Entry-offset indices of loaded BibTeX files"""
+    return cm.get('home') + 'bm_offsets.pickle'
+
+def BM_PARSE_CACHE():
+    """Parsed BibTeX entries, indexed by the hash of their text"""
+    return cm.get('home') + 'bm_parse_cache.pickle'
+
+def BM_INDICES():
+    """Folder for the search indices of the bibmanager database"""
+    return cm.get('home') + 'bm_indices/'
+
 def BM_TMP_BIB():
     """Temporary bibfile database for editing"""
     return cm.get('home') + 'tmp_bibliography.bib'
@@ -306,14 +352,11 @@ def nest(text):
   {{P\'erez}, F. and {Granger}, B.~E.},
   0122222222111111111122222222111111110
   """
+  # One 32-bit code point per character (also for non-ASCII text):
+  codes = np.frombuffer(text.encode('utf-32-le'), np.uint32)[:-1]
   counts = np.zeros(len(text), int)
-  for i,s in enumerate(text[:-1]):
-      if s == "{":
-          counts[i+1] = counts[i] + 1
-      elif s == "}":
-          counts[i+1] = counts[i] - 1
-      else:
-          counts[i+1] = counts[i]
+  np.cumsum((codes == ord("{")).astype(int) - (codes == ord("}")),
+            out=counts[1:])
   return counts
 
 
@@ -431,7 +474,66 @@ def cond_next(text, pattern, nested, nlev=1):
   return len(text) - 1
 
 
-#@functools.lru_cache(maxsize=1024, typed=False)
+def name_cache(func):
+  """
+  Decorator to memoize a name-normalization function in a bounded
+  LRU cache.  Braces-nesting arrays are not part of the cache key
+  (they are not hashable, and the outputs depend only on the name).
+  """
+  name_caches[func.__name__] = functools.lru_cache(name_cache_size)(func)
+
+  @functools.wraps(func)
+  def cached_func(*args, **kwargs):
+      args = [arg for arg in args if not isinstance(arg, (list, np.ndarray))]
+      kwargs.pop('nested', None)
+      return name_caches[func.__name__](*args, **kwargs)
+  return cached_func
+
+
+def set_name_cache(maxsize=65536):
+  """
+  Set the maximum size of the caches of parse_name(), purify(), and
+  initials().  This also empties the caches.
+
+  Parameters
+  ----------
+  maxsize: Integer
+     Maximum number of memoized names for each function.  Set to zero
+     to disable the caches, or to None for unbounded caches.
+
+  Examples
+  --------
+  >>> from bibmanager.utils import set_name_cache
+  >>> set_name_cache(1024)
+  """
+  global name_cache_size
+  name_cache_size = maxsize
+  for name, cache in name_caches.items():
+      name_caches[name] = functools.lru_cache(maxsize)(cache.__wrapped__)
+
+
+def name_cache_info():
+  """
+  Get the hits, misses, maximum size, and current size of the caches
+  of parse_name(), purify(), and initials().
+
+  Returns
+  -------
+  info: Dictionary
+     Cache statistics (CacheInfo named tuples) for each function.
+
+  Examples
+  --------
+  >>> from bibmanager.utils import parse_name, name_cache_info
+  >>> author = parse_name('{Hunter}, J. D.')
+  >>> author = parse_name('{Hunter}, J. D.')
+  >>> print(name_cache_info()['parse_name'])
+  CacheInfo(hits=1, misses=1, maxsize=65536, currsize=1)
+  """
+  return {name: cache.cache_info() for name, cache in name_caches.items()}
+
+
+@name_cache
 def parse_name(name, nested=None):
   r"""
   Parse first, last, von, and jr parts from a name, following these rules:
@@ -443,7 +545,9 @@ def parse_name(name, nested=None):
   name: String
      A name following the BibTeX format.
   nested: 1D integer ndarray
-     Nested level of characters in name.
+     Nested level of characters in name.  Ignored: the nested level
+     is computed from name, such that parsed names can be memoized
+     (see set_name_cache()).
 
   Returns
   -------
@@ -561,7 +665,7 @@ def repr_author(Author):
   return name
 
 
-#@functools.lru_cache(maxsize=1024, typed=False)
+@name_cache
 def purify(name, german=False):
   r"""
   Replace accented characters closely following these rules:
@@ -605,24 +709,16 @@ def purify(name, german=False):
   'Knausg{\\aa}rd Sm{\\o}rrebr{\\o}d' : knausgaard smorrebrod
   'Schr{\\"o}dinger Be{\\ss}er'       : schrodinger besser
   """
-  # German umlaut replace:
   if german:
-      for pattern in ["a", "o", "u"]:
-          name = re.sub(fr'\\"{pattern}', pattern+"e", name)
-  # Remove special:
-  name = re.sub(r"\\(\"|\^|`|\.|'|~)", "", name)
-  # Remove special + white space:
-  name = re.sub(r"\\(c |u |H |v |d |b |t )", "",  name)
-  # Remove special + braces:
-  name = re.sub(r"\\(c{|u{|H{|v{|d{|b{|t{)", "{", name)
-  # Replace pattern:
-  for pattern in ["o", "O", "l", "L", "i", "j",
-                  "aa", "AA", "AE", "oe", "OE", "ss"]:
-      name = re.sub(fr"\\{pattern}", pattern, name)
+      name = purify_german_regex.sub(
+          lambda match: f"{match.group(1)}e" if match.group(1) else "", name)
+  else:
+      name = purify_regex.sub("", name)
   # Remove braces, clean up, and return:
-  return re.sub("({|})", "", name).strip().lower()
+  return name.translate(no_braces).strip().lower()
 
 
+@name_cache
 def initials(name):
   r"""
   Get initials from a name.
@@ -849,32 +945,59 @@ def get_fields(entry):
   year     : 2007
              1111
   """
+  nested = nest(entry)
+  # Positions at nested level one, and level-one quotes and commas:
+  level_one = np.flatnonzero(nested == 1)
+  codes = np.frombuffer(entry.encode('utf-32-le'), np.uint32)
+  delimiters = {
+      char: np.flatnonzero((codes == ord(char)) & (nested == 1))
+      for char in '",'}
+  if len(level_one) == 0:
+      raise ValueError("Mismatched braces in entry.")
+
   # First yield is the key:
-  nested = list(nest(entry))
-  start = nested.index(1)
+  start = level_one[0]
   loc   = entry.index(",")
   yield entry[start:loc]
   loc += 1
 
   # Next equal sign delimits key:
-  while entry[loc:].find("=") >= 0:
-      eq  = entry[loc:].find("=")
-      key = entry[loc:loc+eq].strip().lower()
+  blanks = re.compile(r"\s*")
+  eq = entry.find("=", loc)
+  while eq >= 0:
+      key = entry[loc:eq].strip().lower()
       # next non-blank character:
-      start = loc + eq + 1 + next_char(entry[loc+eq+1:])
+      start = blanks.match(entry, eq+1).end()
+      if start == len(entry):
+          start = eq + 1
 
       if entry[start] == "{":
-          end = start + nested[start+1:].index(1)
+          # Closing brace, right before nested level drops back to one:
+          i = np.searchsorted(level_one, start+1)
+          if i == len(level_one):
+              raise ValueError("Mismatched braces in entry.")
+          end = level_one[i] - 1
           start += 1
-      elif entry[start] == '"':
-          start += 1
-          end = start + cond_next(entry[start:], '"', nested[start:], nlev=1)
       else:
-          end = start + cond_next(entry[start:], ",", nested[start:], nlev=1)
-      start += next_char(entry[start:end])
-      end = start + last_char(entry[start:end])
-      loc = end + np.clip(entry[end:].find(","), 0, len(entry)) + 1
-      yield key, entry[start:end], nested[start:end]
+          if entry[start] == '"':
+              start += 1
+              positions = delimiters['"']
+          else:
+              positions = delimiters[',']
+          i = np.searchsorted(positions, start)
+          end = positions[i] if i < len(positions) else \
+                max(start, len(entry)-1)
+      # Trim blanks:
+      value = entry[start:end]
+      if value.strip() == "":
+          end = start
+      else:
+          start += len(value) - len(value.lstrip())
+          end = start + len(value.strip())
+      comma = entry.find(",", end)
+      loc = end + 1 if comma < 0 else comma + 1
+      yield key, entry[start:end], nested[start:end].tolist()
+      eq = entry.find("=", loc)
 
 
 def req_input(prompt, options):
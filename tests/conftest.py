@@ -10,6 +10,7 @@ import requests
 
 import bibmanager
 import bibmanager.bib_manager as bm
+import bibmanager.config_manager as cm
 import bibmanager.utils as u
 
 
@@ -75,6 +76,11 @@ def mock_init_sample(mock_home):
     bm.init(bibfile=u.ROOT+"examples/sample.bib")
 
 
+@pytest.fixture
+def mock_init_sqlite(mock_init_sample):
+    cm.set('storage', 'sqlite')
+
+
 @pytest.fixture(scope="session")
 def entries():
     jones_minimal = '''@Misc{JonesEtal2001scipy,
@@ -4,13 +4,20 @@
 import os
 import datetime
 import pickle
+import json
 import shutil
 import pathlib
+import random
+import sqlite3
+from contextlib import closing
+import itertools
 import pytest
+import numpy as np
 
 import bibmanager as bibm
 import bibmanager.utils as u
 import bibmanager.bib_manager as bm
+import bibmanager.bib_manager.bib_manager as bib_manager
 
 
 def test_Bib_minimal(entries):
@@ -91,6 +98,63 @@ def test_Bib_update_content(entries):
     assert bib1.freeze is True
 
 
+def test_Bib_lazy_authors(entries):
+    bib = bm.Bib(entries['jones_minimal'])
+    assert 'authors' not in bib.__dict__
+    assert bib.authors[2] == u.Author(
+        last='Peterson', first='Pearu', von='', jr='')
+    assert 'authors' in bib.__dict__
+    # Parsed authors are not pickled:
+    unpickled = pickle.loads(pickle.dumps(bib))
+    assert 'authors' not in unpickled.__dict__
+    assert unpickled.authors == bib.authors
+
+
+def test_Bib_first_author_only(monkeypatch):
+    e = """@Misc{AAS2020,
+      author = {{AAS and Astropy Teams} and {Hendrickson}, A. and
+                {P\\'erez}, F.},
+      title  = {A title},
+      year   = {2020},
+    }"""
+    # The author list is not split at initialization:
+    with monkeypatch.context() as m:
+        m.setattr(u, 'cond_split', None)
+        bib = bm.Bib(e)
+    assert bib.sort_author.last == 'aas and astropy teams'
+    assert [author.last for author in bib.authors] \
+        == ['{AAS and Astropy Teams}', '{Hendrickson}', "{P\\'erez}"]
+
+
+def test_Bib_update_content_lazy_authors(entries, bibs):
+    bib1 = bm.Bib(entries['jones_minimal'])
+    assert len(bib1.authors) == 3
+    bib1.update_content(bibs['stodden'])
+    assert bib1.authors == bm.Bib(bibs['stodden'].content).authors
+
+
+def test_Bib_authors_no_author_field(entries):
+    bib = bm.Bib(entries['jones_minimal'])
+    bib.content = bib.content.replace('author', 'editor', 1)
+    assert bib.authors == []
+
+
+def test_Bib_getattr_uninitialized():
+    # As while unpickling, before __dict__ is set:
+    bib = bm.Bib.__new__(bm.Bib)
+    with pytest.raises(AttributeError,
+            match="'Bib' object has no attribute 'authors'"):
+        bib.authors
+    assert not hasattr(bib, 'sort_key')
+
+
+def test_Bib_missing_attribute(entries):
+    bib = bm.Bib(entries['jones_minimal'])
+    with pytest.raises(AttributeError,
+            match="'Bib' object has no attribute 'editor'"):
+        bib.editor
+
+
 def test_Bib_year_raise(entries):
     # No year:
     with pytest.raises(ValueError, match="Bibtex entry 'JonesEtal2001scipy' is"
@@ -218,6 +282,94 @@ def test_Bib_meta():
     assert bib.meta() == 'freeze\npdf: file.pdf\n'
 
 
+def test_Bib_sort_key(entries):
+    bib = bm.Bib(entries['jones_minimal'])
+    assert bib.sort_key == ('jones', 'e', 'e', '', '', 2001, 13)
+    # Entries pickled without a sort key get it on first access:
+    del bib.sort_key
+    unpickled = pickle.loads(pickle.dumps(bib))
+    assert 'sort_key' not in unpickled.__dict__
+    assert unpickled.sort_key == ('jones', 'e', 'e', '', '', 2001, 13)
+
+
+def test_Bib_update_content_sort_key(entries, bibs):
+    bib = bm.Bib(entries['jones_minimal'])
+    bib.update_content(bibs['stodden'])
+    assert bib.sort_key == bibs['stodden'].sort_key
+
+
+def test_sort_bibs(bibs):
+    my_bibs = list(bibs.values())
+    assert bib_manager.sort_bibs(list(my_bibs)) == sorted(my_bibs)
+    sample = bm.loadfile(u.ROOT+'examples/sample.bib')
+    assert [bib.key for bib in bib_manager.sort_bibs(sample[::-1])] \
+        == [bib.key for bib in sample]
+
+
+def test_insort_bibs(bibs):
+    sample = bm.loadfile(u.ROOT+'examples/sample.bib')
+    new = [bibs['stodden'], bibs['no_oliphant'], bibs['beaulieu_apj']]
+    expected = bib_manager.sort_bibs(sample + new)
+    assert bib_manager.insort_bibs(sample, new) == expected
+    assert [bib.key for bib in sample] == [bib.key for bib in expected]
+
+
+def make_bib(key, author, year):
+    return bm.Bib(f"""@Misc{{{key},
+       author = {{{author}}},
+       title  = {{Title}},
+       year   = {{{year}}},
+    }}""")
+
+
+def test_sort_bibs_single_initial():
+    # A single initial matches any initials starting with it:
+    bibs = [make_bib('SmithJ2005', 'Smith, J.', 2005),
+            make_bib('SmithK2000', 'Smith, K.', 2000),
+            make_bib('SmithJD2001', 'Smith, J. D.', 2001)]
+    assert [bib.key for bib in bib_manager.sort_bibs(bibs)] \
+        == ['SmithJD2001', 'SmithJ2005', 'SmithK2000']
+    # Otherwise, sort by the initials:
+    bibs = [make_bib('SmithJE2000', 'Smith, J. E.', 2000),
+            make_bib('SmithJD2001', 'Smith, J. D.', 2001)]
+    assert [bib.key for bib in bib_manager.sort_bibs(bibs)] \
+        == ['SmithJD2001', 'SmithJE2000']
+
+
+def test_sort_bibs_mixed_initials():
+    # Mixed single- and multiple-initial entries, as sorted():
+    bibs = [make_bib('JonesJE2000a', 'Jones, J. E.', 2000),
+            make_bib('JonesJE2000b', 'Jones, J. E.', 2000),
+            make_bib('JonesJD2001', 'Jones, J. D.', 2001),
+            make_bib('JonesJ2002', 'Jones, J.', 2002),
+            make_bib('JonesK2002', 'Jones, K.', 2002)]
+    expected = ['JonesJD2001', 'JonesJE2000a', 'JonesJE2000b',
+                'JonesJ2002', 'JonesK2002']
+    assert [bib.key for bib in sorted(bibs)] == expected
+    assert [bib.key for bib in bib_manager.sort_bibs(list(bibs))] \
+        == expected
+
+
+def test_sort_bibs_matches_lt():
+    def inverted(bibs):
+        return any(bibs[j] < bibs[i]
+                   for i in range(len(bibs)) for j in range(i+1, len(bibs)))
+    names = ['Jones, J.', 'Jones, J. E.', 'Jones, J. D.', 'Jones, J. E. F.',
+             'Jones, K.', 'Jones, K. L.', 'de Jones, J.', 'Jones, Jr., J. E.',
+             'Smith, J.']
+    pool = [make_bib(f'Key{i}', name, year)
+            for i,(name,year) in enumerate(
+                itertools.product(names, [2000, 2001, 2002]))]
+    rng = random.Random(2020)
+    for _ in range(3000):
+        bibs = rng.choices(pool, k=rng.randint(2,8))
+        if inverted(sorted(bibs)):
+            # Bib.__lt__() is not a total order for this set:
+            continue
+        assert not inverted(bib_manager.sort_bibs(list(bibs)))
+        assert not inverted(bib_manager.insort_bibs([], bibs))
+
+
 def test_display_bibs(capfd, mock_init):
     e1 = '''@Misc{JonesEtal2001scipy,
        author = {Eric Jones},
@@ -278,6 +430,22 @@ def test_remove_duplicates_diff_published(bibs):
     assert my_bibs == [bibs["beaulieu_apj"]]
 
 
+def test_remove_duplicates_fields(bibs):
+    my_bibs = [bibs["beaulieu_apj"], bibs["stodden"], bibs["beaulieu_arxiv"],
+               bibs["beaulieu_apj"]]
+    bm.remove_duplicates(my_bibs, ["doi", "isbn", "bibcode", "eprint"])
+    assert my_bibs == [bibs["beaulieu_apj"], bibs["stodden"]]
+
+
+def test_remove_duplicates_transitive(bibs):
+    # apj and arxiv share the eprint, arxiv and copy share the bibcode:
+    copy = bm.Bib(bibs["beaulieu_arxiv"].content.replace(
+        "eprint = {1007.0324}", "eprint = {0000.0000}"))
+    my_bibs = [copy, bibs["beaulieu_arxiv"], bibs["beaulieu_apj"]]
+    bm.remove_duplicates(my_bibs, ["bibcode", "eprint"])
+    assert my_bibs == [bibs["beaulieu_apj"]]
+
+
 @pytest.mark.parametrize('mock_input', [['2']], indirect=True)
 def test_remove_duplicates_query(bibs, mock_input, mock_init):
     # Querry-solve duplicate:
@@ -328,6 +496,17 @@ def test_filter_field_take_new(bibs):
     assert new == []
 
 
+def test_filter_field_first_match(entries):
+    # Duplicated field in database, the first entry is updated:
+    my_bibs = [bm.Bib(entries["beaulieu_arxiv"]), bm.Bib(entries["stodden"]),
+               bm.Bib(entries["beaulieu_arxiv"])]
+    new     = [bm.Bib(entries["hunter"]), bm.Bib(entries["beaulieu_apj"])]
+    bm.filter_field(my_bibs, new, "eprint", "old")
+    assert my_bibs[0].content == entries["beaulieu_apj"]
+    assert my_bibs[2].content == entries["beaulieu_arxiv"]
+    assert [bib.key for bib in new] == ['Hunter2007ieeeMatplotlib']
+
+
 @pytest.mark.parametrize('mock_input', [['']], indirect=True)
 def test_filter_field_take_ask(bibs, mock_input, mock_init):
     # Ask, keep old:
@@ -362,6 +541,81 @@ def test_loadfile_text(mock_init):
     assert len(bibs) == 17
 
 
+def test_iter_bibfile(mock_init):
+    bibs = bm.iter_bibfile(u.ROOT+'examples/sample.bib')
+    assert next(bibs).key == 'AASteamHendrickson2018aastex62'
+    keys = [bib.key for bib in bibs]
+    assert len(keys) == 16
+    assert sorted(bm.loadfile(u.ROOT+'examples/sample.bib')) \
+        == sorted(bm.iter_bibfile(u.ROOT+'examples/sample.bib'))
+
+
+def test_iter_bibfile_stream(mock_init):
+    with open(u.ROOT+'examples/sample.bib') as f:
+        text = f.read()
+    # Iterate over lines of a file object:
+    with open(u.ROOT+'examples/sample.bib') as f:
+        bibs = list(bm.iter_bibfile(text=f))
+    assert [bib.content for bib in bibs] \
+        == [bib.content for bib in bm.iter_bibfile(text=text)]
+
+
+def test_iter_bibfile_meta(entries):
+    text = 'freeze\npdf: file.pdf\n' + entries['jones_minimal'] \
+           + '\n\n' + entries['hunter']
+    bibs = list(bm.iter_bibfile(text=text))
+    assert bibs[0].pdf == 'file.pdf'
+    assert bibs[0].freeze is True
+    assert bibs[1].pdf is None
+    assert bibs[1].freeze is None
+
+
+def test_iter_bibfile_raise(entries):
+    text = entries['jones_minimal'] + '\n@Misc{Broken,\n'
+    bibs = bm.iter_bibfile(text=text)
+    # Complete entries are yielded before the error:
+    assert next(bibs).key == 'JonesEtal2001scipy'
+    with pytest.raises(ValueError,
+            match="Invalid input, mistmatched braces at end of file."):
+        next(bibs)
+
+
+def test_loadfile_workers(mock_init, monkeypatch):
+    monkeypatch.setattr(bib_manager, 'parallel_min_entries', 0)
+    bibs = bm.loadfile(u.ROOT+'examples/sample.bib')
+    parallel_bibs = bm.loadfile(u.ROOT+'examples/sample.bib', workers=2)
+    assert [bib.content for bib in parallel_bibs] \
+        == [bib.content for bib in bibs]
+
+
+def test_loadfile_workers_raise(entries, monkeypatch):
+    monkeypatch.setattr(bib_manager, 'parallel_min_entries', 0)
+    text = entries['jones_minimal'] + '\n' + entries['jones_no_year']
+    with pytest.raises(ValueError, match="Bibtex entry 'JonesEtal2001scipy' is"
+                                         " missing author, title, or year."):
+        bm.loadfile(text=text, workers=2)
+
+
+def test_parse_entries_chunks(mock_init, monkeypatch):
+    monkeypatch.setattr(bib_manager, 'parse_chunk_entries', 5)
+    monkeypatch.setattr(bib_manager, 'parallel_min_entries', 0)
+    monkeypatch.setattr(bib_manager, 'parse_cache_min_entries', 1)
+    entries = list(bib_manager.iter_entries(u.ROOT+'examples/sample.bib'))
+    consumed = []
+    def reader():
+        for i,entry in enumerate(entries):
+            consumed.append(i)
+            yield entry
+    read = []
+    monkeypatch.setattr(bib_manager, 'new_bib',
+        lambda entry, meta:
+            read.append(len(consumed)) or bm.Bib(entry, **meta))
+    bibs = bib_manager.parse_entries(reader())
+    # The entries are read one chunk at a time:
+    assert read == [5]*5 + [10]*5 + [15]*5 + [17]*2
+    assert [bib.content for bib in bibs] == [entry for entry,meta in entries]
+
+
 def test_loadfile_meta():
     with open(u.ROOT+'examples/sample.bib') as f:
        text = f.read()
@@ -397,6 +651,198 @@ def test_loadfile_pdf_with_bad_path(tmp_path, mock_init):
     assert bibs[0].pdf is None
 
 
+def test_loadfile_bibfile_meta(tmp_path, mock_init):
+    with open(u.ROOT+'examples/sample.bib') as f:
+       text = f.read()
+    bibfile = f'{tmp_path}/meta.bib'
+    with open(bibfile, 'w') as f:
+        f.write('freeze\npdf: file.pdf\n' + text.replace('\n', '\r\n'))
+    bibs = bm.loadfile(bibfile)
+    assert [bib.content for bib in bibs] \
+        == [bib.content for bib in bm.loadfile(text=text)]
+    assert bibs[0].pdf == 'file.pdf'
+    assert bibs[0].freeze is True
+    assert bibs[1].pdf is None
+
+
+def test_loadfile_empty_bibfile(tmp_path, mock_init):
+    bibfile = f'{tmp_path}/empty.bib'
+    pathlib.Path(bibfile).touch()
+    assert bm.loadfile(bibfile) == []
+
+
+def test_loadfile_bibfile_raise(tmp_path, mock_init):
+    bibfile = f'{tmp_path}/broken.bib'
+    with open(bibfile, 'w') as f:
+        f.write('@Misc{Broken,\n  title = {Broken}}}\n')
+    with pytest.raises(ValueError,
+            match="Mismatched braces in line 1:\n'  title = {Broken}}}'"):
+        bm.loadfile(bibfile)
+
+
+def test_loadfile_offsets(tmp_path, mock_init):
+    bibfile = f'{tmp_path}/sample.bib'
+    shutil.copy(u.ROOT+'examples/sample.bib', bibfile)
+    bibs = bm.loadfile(bibfile)
+    offsets = bib_manager.read_offsets()[os.path.realpath(bibfile)][2]
+    assert len(offsets) == 17
+    assert sorted(offset.key for offset in offsets) \
+        == sorted(bib.key for bib in bibs)
+    with open(bibfile, 'rb') as f:
+        data = f.read()
+    for offset in offsets:
+        assert data[offset.start:offset.end].startswith(b'@')
+
+
+def test_loadfile_offsets_reuse(tmp_path, mock_init, monkeypatch):
+    bibfile = f'{tmp_path}/sample.bib'
+    shutil.copy(u.ROOT+'examples/sample.bib', bibfile)
+    bibs = bm.loadfile(bibfile)
+    # An unchanged file is not scanned again:
+    monkeypatch.setattr(bib_manager, 'scan_bibfile', None)
+    assert [bib.content for bib in bm.loadfile(bibfile)] \
+        == [bib.content for bib in bibs]
+
+
+def test_loadfile_offsets_touched(tmp_path, mock_init, monkeypatch):
+    bibfile = f'{tmp_path}/sample.bib'
+    shutil.copy(u.ROOT+'examples/sample.bib', bibfile)
+    bibs = bm.loadfile(bibfile)
+    offsets = bib_manager.read_offsets()
+    # Same content, new mtime: the persisted index is not rewritten:
+    os.utime(bibfile, ns=(0, 0))
+    monkeypatch.setattr(bib_manager, 'save_offsets', None)
+    assert bm.loadfile(bibfile) == bibs
+    assert bib_manager.read_offsets() == offsets
+
+
+def test_loadfile_carriage_returns(tmp_path, mock_init):
+    # Bare '\r' line breaks are not scanned, but read line by line:
+    with open(u.ROOT+'examples/sample.bib') as f:
+        text = f.read()
+    bibfile = f'{tmp_path}/sample.bib'
+    with open(bibfile, 'w', newline='') as f:
+        f.write(text.replace('\n', '\r'))
+    bibs = bm.loadfile(bibfile)
+    assert bibs == bm.loadfile(text=text)
+    assert os.path.realpath(bibfile) not in bib_manager.read_offsets()
+    bibs = bm.find_entries(bibfile, keys=['AASteamHendrickson2018aastex62'])
+    assert [bib.key for bib in bibs] == ['AASteamHendrickson2018aastex62']
+
+
+def test_find_entries(tmp_path, mock_init):
+    bibfile = f'{tmp_path}/sample.bib'
+    shutil.copy(u.ROOT+'examples/sample.bib', bibfile)
+    bibs = bm.find_entries(bibfile, keys=['AASteamHendrickson2018aastex62'],
+        bibcodes=['1913LowOB...2...56S'])
+    assert [bib.key for bib in bibs] == \
+        ['AASteamHendrickson2018aastex62',
+         'Slipher1913lobAndromedaRarialVelocity']
+    assert bm.find_entries(bibfile, keys=['NotAKey']) == []
+
+
+def test_find_entries_modified(tmp_path, mock_init, entries, monkeypatch):
+    bibfile = f'{tmp_path}/sample.bib'
+    shutil.copy(u.ROOT+'examples/sample.bib', bibfile)
+    bm.loadfile(bibfile)
+    with open(bibfile, 'a') as f:
+        f.write('\n' + entries['stodden'] + '\n')
+    # Only the appended entry is parsed to update the index:
+    parsed = []
+    monkeypatch.setattr(bib_manager, 'offset_bib',
+        lambda data, offset: parsed.append(offset.start)
+            or bib_manager.Bib(bib_manager.entry_text(
+                   data, offset.start, offset.end)))
+    bibs = bm.find_entries(bibfile, keys=['StoddenEtal2009ciseRRlegal'])
+    assert len(parsed) == 1
+    assert bibs[0].content == entries['stodden']
+    offsets = bib_manager.read_offsets()[os.path.realpath(bibfile)][2]
+    assert len(offsets) == 18
+    assert offsets[-1].key == 'StoddenEtal2009ciseRRlegal'
+
+
+def test_offsets_max_files(tmp_path, mock_init, monkeypatch):
+    monkeypatch.setattr(bib_manager, 'offsets_max_files', 2)
+    bibfiles = [f'{tmp_path}/sample{i}.bib' for i in range(3)]
+    for bibfile in bibfiles:
+        shutil.copy(u.ROOT+'examples/sample.bib', bibfile)
+        bm.find_entries(bibfile)
+    assert list(bib_manager.read_offsets()) \
+        == [os.path.realpath(bibfile) for bibfile in bibfiles[1:]]
+
+
+def test_loadfile_parse_cache(mock_init, monkeypatch):
+    monkeypatch.setattr(bib_manager, 'parse_cache_min_entries', 1)
+    with open(u.ROOT+'examples/sample.bib') as f:
+       text = f.read()
+    bibs = bm.loadfile(text=text)
+    assert len(bib_manager.read_parse_cache()) == 17
+    # Only the modified entry is parsed again:
+    parsed = []
+    monkeypatch.setattr(bib_manager, 'new_bib',
+        lambda entry, meta: parsed.append(entry) or bm.Bib(entry, **meta))
+    text = text.replace('{Synthesis of the Elements in Stars}',
+                        '{Synthesis of Elements}')
+    cached_bibs = bm.loadfile(text=text)
+    assert len(parsed) == 1
+    assert 'Synthesis of Elements' in parsed[0]
+    assert [bib.content for bib in cached_bibs] \
+        == [bib.content for bib in bm.loadfile(text=text)]
+    assert [bib.sort_author for bib in cached_bibs] \
+        == [bib.sort_author for bib in bibs]
+
+
+def test_loadfile_parse_cache_meta(mock_init, monkeypatch):
+    monkeypatch.setattr(bib_manager, 'parse_cache_min_entries', 1)
+    with open(u.ROOT+'examples/sample.bib') as f:
+       text = f.read()
+    bibs = bm.loadfile(text='freeze\npdf: file.pdf\n' + text)
+    assert bibs[0].pdf == 'file.pdf'
+    assert bibs[0].freeze is True
+    # Meta info comes from the file, not from the cache:
+    bibs = bm.loadfile(text=text)
+    assert bibs[0].pdf is None
+    assert bibs[0].freeze is None
+
+
+def test_parse_cache_format(mock_init, monkeypatch):
+    monkeypatch.setattr(bib_manager, 'parse_cache_min_entries', 1)
+    bm.loadfile(u.ROOT+'examples/sample.bib')
+    with open(u.BM_PARSE_CACHE(), 'rb') as handle:
+        cache_format, cache = pickle.load(handle)
+    assert len(bib_manager.read_parse_cache()) == 17
+    # Kept across bibmanager versions, not across formats:
+    monkeypatch.setattr(bib_manager, '__version__', '100.0.0')
+    assert len(bib_manager.read_parse_cache()) == 17
+    with open(u.BM_PARSE_CACHE(), 'wb') as handle:
+        pickle.dump((cache_format-1, cache), handle)
+    assert bib_manager.read_parse_cache() == {}
+
+
+def test_parse_cache_small_loads(entries, mock_init, monkeypatch):
+    monkeypatch.setattr(bib_manager, 'parse_cache_min_entries', 2)
+    bm.loadfile(text=entries['stodden'])
+    assert not os.path.exists(u.BM_PARSE_CACHE())
+    bm.loadfile(text=entries['stodden'] + '\n' + entries['hunter'])
+    assert len(bib_manager.read_parse_cache()) == 2
+    # Small loads do not rewrite the cache:
+    monkeypatch.setattr(bib_manager, 'read_parse_cache', None)
+    monkeypatch.setattr(bib_manager, 'write_parse_cache', None)
+    bibs = bm.loadfile(text=entries['beaulieu_apj'])
+    assert bibs[0].content == entries['beaulieu_apj']
+
+
+def test_parse_cache_size(mock_init, entries, monkeypatch):
+    monkeypatch.setattr(bib_manager, 'parse_cache_size', 2)
+    monkeypatch.setattr(bib_manager, 'parse_cache_min_entries', 1)
+    bm.loadfile(text=entries['jones_minimal'])
+    bm.loadfile(text=entries['hunter'] + '\n' + entries['stodden'])
+    cache = bib_manager.read_parse_cache()
+    bibs = [pickle.loads(bib) for bib in cache.values()]
+    assert [bib.key for bib in bibs] \
+        == ['Hunter2007ieeeMatplotlib', 'StoddenEtal2009ciseRRlegal']
+
+
 def test_save(bibs, mock_init):
     my_bibs = [bibs["beaulieu_apj"]]
     bm.save(my_bibs)
@@ -419,6 +865,252 @@ def test_load_filed(tmp_path, bibs, mock_init):
     assert loaded_bibs == my_bibs
 
 
+def test_save_sqlite(bibs, mock_init_sqlite):
+    my_bibs = [bibs["beaulieu_apj"]]
+    bm.save(my_bibs)
+    assert "bm_database.sqlite" in os.listdir(u.HOME)
+    with open(u.BM_DATABASE(), 'rb') as f:
+        assert f.read(16) == b'SQLite format 3\x00'
+    assert bm.load() == my_bibs
+
+
+def test_load_sqlite_filed(tmp_path, bibs, mock_init_sqlite):
+    my_bibs = [bibs["beaulieu_apj"], bibs["stodden"]]
+    bm.save(my_bibs)
+    db = f'{tmp_path}/bm_database.sqlite'
+    shutil.copy(u.BM_DATABASE(), db)
+    loaded_bibs = bm.load(db)
+    assert loaded_bibs == my_bibs
+    assert [bib.key for bib in loaded_bibs] == [bib.key for bib in my_bibs]
+
+
+def test_upsert_update(mock_init_sample):
+    bib = bm.find(key='AASteamHendrickson2018aastex62')
+    bib.pdf = 'AASteam2018.pdf'
+    bm.upsert([bib])
+    assert bm.find(key=bib.key).pdf == 'AASteam2018.pdf'
+    assert len(bm.load()) == 17
+
+
+def test_upsert_insert(bibs, mock_init_sample):
+    bm.upsert([bibs['beaulieu_apj']])
+    loaded = bm.load()
+    assert len(loaded) == 18
+    assert loaded == sorted(loaded)
+    assert bm.find(key=bibs['beaulieu_apj'].key) is not None
+
+
+def test_upsert_sqlite_update(mock_init_sqlite):
+    keys = [bib.key for bib in bm.load()]
+    bib = bm.find(key='AASteamHendrickson2018aastex62')
+    bib.pdf = 'AASteam2018.pdf'
+    bm.upsert([bib])
+    assert bm.find(key=bib.key).pdf == 'AASteam2018.pdf'
+    assert [bib.key for bib in bm.load()] == keys
+
+
+def test_upsert_sqlite_insert(bibs, mock_init_sqlite):
+    bm.upsert([bibs['beaulieu_apj']])
+    loaded = bm.load()
+    assert len(loaded) == 18
+    assert loaded == sorted(loaded)
+
+
+def test_merge_sqlite_no_save(bibs, mock_init_sqlite, monkeypatch):
+    expected = bib_manager.sort_bibs(bm.load() + [bibs['stodden']])
+    saves = []
+    monkeypatch.setattr(bib_manager, 'save', saves.append)
+    bm.merge(new=[bibs['stodden']])
+    # Inserted into its sort group, without rewriting the database:
+    assert saves == []
+    assert [bib.key for bib in bm.load()] == [bib.key for bib in expected]
+
+
+def test_upsert_sqlite_renumber(mock_init_sqlite):
+    bm.save([make_bib('A2000', 'A, B.', 2000), make_bib('B2000', 'B, B.', 2000),
+             make_bib('Z2000', 'Z, B.', 2000)])
+    # Each entry sorts right after 'B', halving the gap until renumbering:
+    new = [make_bib(f'M{i}', f'M{"a"*i}b, B.', 2000) for i in range(60)]
+    for bib in new:
+        bm.upsert([bib])
+    expected = ['A2000', 'B2000'] + [bib.key for bib in new[::-1]] + ['Z2000']
+    assert [bib.key for bib in bm.load()] == expected
+
+
+def test_upsert_sqlite_resort(mock_init_sqlite):
+    bib = bm.find(key='AASteamHendrickson2018aastex62')
+    bib.update_content(bm.Bib(bib.content.replace('AAS Journals Team',
+        'Zwicky, F.')))
+    bm.upsert([bib])
+    loaded = bm.load()
+    assert [b.key for b in loaded] == [
+        b.key for b in bib_manager.sort_bibs(list(loaded))]
+    assert loaded[-1].key == 'AASteamHendrickson2018aastex62'
+
+
+def test_upsert_sqlite_old_table(bibs, mock_init_sqlite):
+    # A table without the sort_group column:
+    loaded = bm.load()
+    os.remove(u.BM_DATABASE())
+    with closing(sqlite3.connect(u.BM_DATABASE())) as conn, conn:
+        conn.execute("CREATE TABLE entries (pos INTEGER, key TEXT, "
+            "bibcode TEXT, doi TEXT, eprint TEXT, isbn TEXT, year INTEGER, "
+            "bib BLOB)")
+        conn.executemany("INSERT INTO entries VALUES (?,?,?,?,?,?,?,?)",
+            [(pos, bib.key, bib.bibcode, bib.doi, bib.eprint, bib.isbn,
+              bib.year, pickle.dumps(bib)) for pos,bib in enumerate(loaded)])
+    bm.upsert([bibs['stodden']])
+    assert bm.load() == bib_manager.sort_bibs(loaded + [bibs['stodden']])
+
+
+def test_upsert_journal(mock_init_sample):
+    database = open(u.BM_DATABASE(), 'rb').read()
+    bib = bm.find(key='AASteamHendrickson2018aastex62')
+    bib.pdf = 'AASteam2018.pdf'
+    bm.upsert([bib])
+    # Database file untouched, change is in the journal:
+    assert open(u.BM_DATABASE(), 'rb').read() == database
+    assert os.path.isfile(u.BM_JOURNAL())
+    assert bm.find(key=bib.key).pdf == 'AASteam2018.pdf'
+
+
+def test_upsert_journal_base(mock_init_sample):
+    bm.upsert(bm.load()[0:1])
+    base_hash = bib_manager.database_hash(u.BM_DATABASE())
+    assert bib_manager.journal_base() == base_hash
+    bm.upsert(bm.load()[1:2])
+    assert bib_manager.read_journal()[0] == ('base', base_hash)
+    assert len(bib_manager.read_journal()) == 3
+
+
+def test_upsert_remove(mock_init_sample):
+    bm.upsert([], remove=['AASteamHendrickson2018aastex62'])
+    assert bm.find(key='AASteamHendrickson2018aastex62') is None
+    assert len(bm.load()) == 16
+
+
+def test_upsert_journal_compact_threshold(mock_init_sample, monkeypatch):
+    monkeypatch.setattr(bib_manager, 'journal_min_size', 0)
+    monkeypatch.setattr(bib_manager, 'journal_ratio', 0.0)
+    bib = bm.find(key='AASteamHendrickson2018aastex62')
+    bib.pdf = 'AASteam2018.pdf'
+    bm.upsert([bib])
+    assert not os.path.isfile(u.BM_JOURNAL())
+    assert bm.find(key=bib.key).pdf == 'AASteam2018.pdf'
+
+
+def test_load_journal_truncated(bibs, mock_init_sample):
+    bm.upsert([bibs['beaulieu_apj']])
+    bm.upsert([bibs['stodden']])
+    with open(u.BM_JOURNAL(), 'r+b') as handle:
+        handle.truncate(os.path.getsize(u.BM_JOURNAL()) - 10)
+    loaded = bm.load()
+    assert len(loaded) == 18
+    assert bibs['beaulieu_apj'] in loaded
+    assert bibs['stodden'] not in loaded
+
+
+def test_load_journal_stale(bibs, mock_init_sample):
+    bm.upsert([bibs['beaulieu_apj']])
+    journal = open(u.BM_JOURNAL(), 'rb').read()
+    bm.save(bm.load()[1:])
+    # A journal of a different database is not applied:
+    with open(u.BM_JOURNAL(), 'wb') as handle:
+        handle.write(journal)
+    assert len(bm.load()) == 17
+
+
+def test_save_removes_journal(bibs, mock_init_sample):
+    bm.upsert([bibs['beaulieu_apj']])
+    bm.save(bm.load())
+    assert not os.path.isfile(u.BM_JOURNAL())
+    assert len(bm.load()) == 18
+
+
+def test_compact(bibs, mock_init_sample):
+    bm.upsert([bibs['beaulieu_apj']])
+    loaded = bm.load()
+    bm.compact()
+    assert not os.path.isfile(u.BM_JOURNAL())
+    assert bm.load() == loaded
+
+
+def test_compact_sqlite(mock_init_sqlite):
+    loaded = bm.load()
+    bm.compact()
+    assert bm.load() == loaded
+
+
+def test_dedup_none(mock_init_sample):
+    assert bm.dedup() == []
+
+
+def test_dedup(entries, mock_init):
+    title = bm.Bib(entries['stodden'].replace(
+        "StoddenEtal2009ciseRRlegal", "Stodden2009").replace(
+        "The legal framework", "the Legal-Framework"))
+    my_bibs = [bm.Bib(entries[key])
+               for key in ['beaulieu_arxiv', 'beaulieu_apj', 'hunter', 'stodden']]
+    bm.save(bib_manager.sort_bibs(my_bibs + [title]))
+    clusters = bm.dedup()
+    assert [[bib.key for bib in cluster] for cluster in clusters] == [
+        ['BeaulieuEtal2010arxivGJ436b', 'BeaulieuEtal2011apjGJ436bMethane'],
+        ['StoddenEtal2009ciseRRlegal', 'Stodden2009']]
+    # Report only:
+    assert len(bm.load()) == 5
+
+
+def test_dedup_resolve(entries, mock_init):
+    my_bibs = [bm.Bib(entries[key])
+               for key in ['beaulieu_arxiv', 'beaulieu_apj', 'hunter']]
+    my_bibs[0].pdf = 'Beaulieu2010.pdf'
+    bm.save(bib_manager.sort_bibs(my_bibs))
+    clusters = bm.dedup(resolve=True)
+    assert [[bib.key for bib in cluster] for cluster in clusters] == [
+        ['BeaulieuEtal2011apjGJ436bMethane', 'BeaulieuEtal2010arxivGJ436b']]
+    loaded = bm.load()
+    assert [bib.key for bib in loaded] \
+        == ['BeaulieuEtal2011apjGJ436bMethane', 'Hunter2007ieeeMatplotlib']
+    # The kept entry takes the PDF of the removed one:
+    assert loaded[0].pdf == 'Beaulieu2010.pdf'
+    assert bm.loadfile(u.BM_BIBFILE()) == loaded
+
+
+def test_dedup_resolve_title_skip(entries, mock_init):
+    title = bm.Bib(entries['stodden'].replace(
+        "StoddenEtal2009ciseRRlegal", "Stodden2009"))
+    my_bibs = [bm.Bib(entries[key])
+               for key in ['beaulieu_arxiv', 'beaulieu_apj', 'stodden']]
+    bm.save(bib_manager.sort_bibs(my_bibs + [title]))
+    # The title-only cluster is left unresolved:
+    clusters = bm.dedup(resolve=True)
+    assert [[bib.key for bib in cluster] for cluster in clusters] == [
+        ['BeaulieuEtal2011apjGJ436bMethane', 'BeaulieuEtal2010arxivGJ436b'],
+        ['StoddenEtal2009ciseRRlegal', 'Stodden2009']]
+    assert [bib.key for bib in bm.load()] == [
+        'BeaulieuEtal2011apjGJ436bMethane', 'StoddenEtal2009ciseRRlegal',
+        'Stodden2009']
+
+
+def test_dedup_resolve_titles(entries, mock_init):
+    title = bm.Bib(entries['stodden'].replace(
+        "StoddenEtal2009ciseRRlegal", "Stodden2009"))
+    bm.save(bib_manager.sort_bibs([bm.Bib(entries['stodden']), title]))
+    clusters = bm.dedup(resolve=True, titles=True)
+    assert [[bib.key for bib in cluster] for cluster in clusters] == [
+        ['StoddenEtal2009ciseRRlegal', 'Stodden2009']]
+    assert [bib.key for bib in bm.load()] == ['StoddenEtal2009ciseRRlegal']
+
+
+def test_duplicate_groups_transitive(entries):
+    copy = bm.Bib(entries["beaulieu_arxiv"].replace(
+        "eprint = {1007.0324}", "eprint = {0000.0000}"))
+    my_bibs = [copy, bm.Bib(entries['hunter']), bm.Bib(entries["beaulieu_arxiv"]),
+               bm.Bib(entries["beaulieu_apj"])]
+    assert bib_manager.duplicate_groups(my_bibs, ['bibcode', 'eprint']) \
+        == [[0, 2, 3]]
+
+
 def test_find_key(mock_init_sample):
     key = 'AASteamHendrickson2018aastex62'
     bib = bm.find(key=key)
@@ -452,6 +1144,93 @@ def test_find_bibcode_not_found(mock_init_sample):
     assert bib is None
 
 
+def test_find_bibcode_utf8(mock_init_sample):
+    bib = bm.find(bibcode='2013A%26A...558A..33A')
+    assert bib.key == 'Astropycollab2013aaAstropy'
+
+
+def test_find_index(mock_init_sample, monkeypatch):
+    key = 'AASteamHendrickson2018aastex62'
+    assert bib_manager.read_index('ids') is None
+    bib = bm.find(key=key)
+    ids = bib_manager.read_index('ids')
+    assert key in ids['keys']
+    assert ids['bibcodes']['2013A&A...558A..33A'] \
+        == ['Astropycollab2013aaAstropy']
+    # Taken from the exported bibfile, without loading the database:
+    monkeypatch.setattr(bib_manager, 'load', None)
+    assert repr(bm.find(key=key)) == repr(bib)
+    assert bm.find(bibcode='2013A&A...558A..33A').key \
+        == 'Astropycollab2013aaAstropy'
+    assert bm.find(key='non_existing_key') is None
+
+
+def test_find_index_outdated_bibfile(mock_init_sample):
+    key = 'AASteamHendrickson2018aastex62'
+    bm.find(key=key)
+    # Database updated but not exported:
+    bib = bm.find(key=key)
+    bib.pdf = 'file.pdf'
+    bm.upsert([bib])
+    assert bm.find(key=key).pdf == 'file.pdf'
+
+
+def test_find_merge_after_export(entries, mock_init):
+    bm.merge(u.ROOT+'examples/sample.bib')
+    bib = bm.find(key='Oliphant2006numpy')
+    bib.pdf = 'file.pdf'
+    bm.upsert([bib])
+    assert bib_manager.update_bibfile([bib])
+    bm.export(bm.load(), meta=True)
+    bm.merge(new=[bm.Bib(entries['stodden'])])
+    assert bm.find(key='StoddenEtal2009ciseRRlegal').key \
+        == 'StoddenEtal2009ciseRRlegal'
+    assert bm.find(key='Oliphant2006numpy').pdf == 'file.pdf'
+
+
+def test_exported_entry_mismatch(mock_init_sample):
+    key = 'Oliphant2006numpy'
+    bm.export(bm.load(), meta=True)
+    index = bib_manager.read_export_index(u.BM_BIBFILE())
+    # A digest locating a chunk without entries (the header):
+    ids = {'keys': {key: (index['hashes'][0], None)}}
+    assert bib_manager.exported_entry(ids, key) is None
+    # A digest locating another entry:
+    ids = {'keys': {key: (index['hashes'][1], None)}}
+    assert bib_manager.exported_entry(ids, key) is None
+    # A digest not in the bibfile:
+    ids = {'keys': {key: (bytes(16), None)}}
+    assert bib_manager.exported_entry(ids, key) is None
+
+
+def test_find_pdf_with_spaces(mock_init_sample):
+    key = 'Oliphant2006numpy'
+    bib = bm.find(key=key)
+    bib.pdf = 'foo bar.pdf'
+    bm.upsert([bib])
+    bm.export(bm.load(), meta=True)
+    assert bm.find(key=key).pdf == 'foo bar.pdf'
+    # Now through the index of identifiers and the exported bibfile:
+    assert bib_manager.read_index('ids') is not None
+    assert bm.find(key=key).pdf == 'foo bar.pdf'
+
+
+def test_find_index_stale_spans(mock_init_sample):
+    bibs = bm.load()
+    bm.export(bibs, meta=True)
+    key = 'AASteamHendrickson2018aastex62'
+    bib = bm.find(key=key)
+    # Same-size rewrite of the bibfile, within the same modification time:
+    stats = [os.stat(path) for path in [u.BM_BIBFILE(), u.BM_BIBFILE_INDEX()]]
+    bm.export(bibs[::-1], meta=True)
+    for path,stat in zip([u.BM_BIBFILE(), u.BM_BIBFILE_INDEX()], stats):
+        assert os.path.getsize(path) == stat.st_size
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert repr(bm.find(key=key)) == repr(bib)
+    for bib in bibs:
+        assert bm.find(key=bib.key).key == bib.key
+
+
 def test_find_bibs(bibs):
     key = 'StoddenEtal2009ciseRRlegal'
     my_bibs = [bibs["beaulieu_apj"], bibs["stodden"]]
@@ -498,6 +1277,58 @@ def test_get_version_filed(tmp_path, mock_init):
     assert bm.get_version(db) == expected_version
 
 
+def test_get_version_header(bibs, mock_init):
+    bm.save([bibs["beaulieu_apj"], bibs["stodden"]])
+    with open(u.BM_DATABASE(), 'rb') as handle:
+        header = handle.read(66)
+    assert header.startswith(b'BIBMDB')
+    assert bibm.__version__.encode() in header
+    assert bm.get_version() == bibm.__version__
+
+
+def test_get_version_migrate(bibs, mock_init):
+    # Mock old-layout pickle DB file:
+    my_bibs = [bibs["beaulieu_apj"], bibs["stodden"]]
+    with open(u.BM_DATABASE(), 'wb') as handle:
+        pickle.dump(my_bibs, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump('1.0.0', handle, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(u.BM_DATABASE(), 'rb') as handle:
+        old_layout = handle.read()
+    assert bm.load() == my_bibs
+    assert bm.get_version() == '1.0.0'
+    # Reading does not modify the file:
+    with open(u.BM_DATABASE(), 'rb') as handle:
+        assert handle.read() == old_layout
+    # Saving does migrate it, the file now has a header:
+    bm.save(bm.load())
+    with open(u.BM_DATABASE(), 'rb') as handle:
+        assert handle.read(6) == b'BIBMDB'
+    assert bm.get_version() == bibm.__version__
+    assert bm.load() == my_bibs
+
+
+def test_save_long_version(bibs, mock_init):
+    version = '1.0.0.dev' + '0'*246
+    bib_manager.write_database(u.BM_DATABASE(), [bibs["stodden"]], version)
+    assert bm.get_version() == version
+    with pytest.raises(ValueError, match="it must be at most 255 bytes long"):
+        bib_manager.write_database(
+            u.BM_DATABASE(), [bibs["stodden"]], version+'0')
+
+
+def test_load_corrupted(bibs, mock_init):
+    bm.save([bibs["beaulieu_apj"], bibs["stodden"]])
+    with open(u.BM_DATABASE(), 'r+b') as handle:
+        handle.seek(-10, os.SEEK_END)
+        handle.write(b'corrupted!')
+    with pytest.raises(ValueError, match="Corrupted bibmanager database file"):
+        bm.load()
+
+
+def test_get_version_sqlite(mock_init_sqlite):
+    assert bm.get_version() == bibm.__version__
+
+
 def test_export_home(bibs, mock_init):
     my_bibs = [bibs["stodden"], bibs["beaulieu_apj"]]
     bm.export(my_bibs, u.BM_BIBFILE())
@@ -537,6 +1368,65 @@ def test_export_no_meta(mock_init_sample):
     assert "pdf: Slipher1913.pdf\n" not in lines
 
 
+def test_export_incremental_no_changes(mock_init_sample):
+    bibs = bm.load()
+    content = open(u.BM_BIBFILE(), 'rb').read()
+    assert bm.export(bibs, meta=True) == 0
+    assert open(u.BM_BIBFILE(), 'rb').read() == content
+
+
+def test_export_incremental_patch(mock_init_sample):
+    bibs = bm.load()
+    bibs[3].content = bibs[3].content.replace('title', 'TITLE', 1)
+    nbytes = bm.export(bibs, meta=True)
+    assert nbytes == len(f'{bibs[3].meta()}{bibs[3].content}\n\n'.encode())
+    bm_export = u.HOME+'tmp_bm.bib'
+    bm.export(bibs, bm_export, meta=True)
+    assert open(u.BM_BIBFILE()).read() == open(bm_export).read()
+
+
+def test_export_incremental_tail(bibs, mock_init_sample):
+    new = sorted(bm.load() + [bibs['stodden']])
+    nbytes = bm.export(new, meta=True)
+    assert 0 < nbytes < os.path.getsize(u.BM_BIBFILE())
+    assert bm.loadfile(u.BM_BIBFILE()) == new
+    # Remove last entries:
+    nbytes = bm.export(new[:-2], meta=True)
+    assert nbytes == 0
+    assert bm.loadfile(u.BM_BIBFILE()) == new[:-2]
+
+
+def test_export_incremental_modified_file(mock_init_sample):
+    bibs = bm.load()
+    with open(u.BM_BIBFILE(), 'a') as f:
+        f.write('user edit')
+    nbytes = bm.export(bibs, meta=True)
+    assert nbytes == os.path.getsize(u.BM_BIBFILE())
+    assert bm.loadfile(u.BM_BIBFILE()) == bibs
+
+
+def test_update_bibfile(mock_init_sample):
+    bibs = bm.load()
+    bibs[3].pdf = 'file.pdf'
+    assert bm.update_bibfile([bibs[3]]) is True
+    bm_export = u.HOME+'tmp_bm.bib'
+    bm.export(bibs, bm_export, meta=True)
+    assert open(u.BM_BIBFILE()).read() == open(bm_export).read()
+    # The export index is up to date:
+    assert bm.export(bibs, meta=True) == 0
+    # Same-size chunk, patched in place:
+    bibs[5].content = bibs[5].content.replace('title', 'TITLE', 1)
+    assert bm.update_bibfile([bibs[5]]) is True
+    assert bm.export(bibs, meta=True) == 0
+    assert bm.loadfile(u.BM_BIBFILE()) == bibs
+
+
+def test_update_bibfile_unindexed(bibs, mock_init_sample):
+    assert bm.update_bibfile([bibs['stodden']]) is False
+    os.remove(u.BM_BIBFILE_INDEX())
+    assert bm.update_bibfile(bm.load()[0:1]) is False
+
+
 def test_merge_bibfile(capfd, mock_init):
     bm.merge(u.HOME + "examples/sample.bib")
     captured = capfd.readouterr()
@@ -556,6 +1446,34 @@ def test_merge_no_new(capfd, bibs, mock_init_sample):
     assert captured.out == "\nMerged 0 new entries.\n"
 
 
+def test_merge_journal(capfd, bibs, mock_init_sample):
+    database = open(u.BM_DATABASE(), 'rb').read()
+    bm.merge(new=[bibs['beaulieu_apj'], bibs['hunter']])
+    assert open(u.BM_DATABASE(), 'rb').read() == database
+    # The arXiv entry got updated by the published version:
+    records = bib_manager.read_journal()[1:]
+    assert records == [
+        ('delete', 'BeaulieuEtal2010arxivGJ436b'),
+        ('upsert', bibs['beaulieu_apj'])]
+    assert len(bm.load()) == 17
+
+
+def test_merge_insort(bibs, mock_init_sample, monkeypatch):
+    sort_calls = []
+    monkeypatch.setattr(bib_manager, 'sort_bibs',
+        lambda bibs, sort_bibs=bib_manager.sort_bibs:
+            sort_calls.append(len(bibs)) or sort_bibs(bibs))
+    new = [bibs['stodden'], make_bib('CubillosP2005', 'Cubillos, P.', 2005)]
+    merged = bm.merge(new=new)
+    # Only the last-name/first-initial groups of new entries are sorted:
+    assert max(sort_calls) < 17
+    assert [bib.key for bib in merged] \
+        == [bib.key for bib in bib_manager.sort_bibs(bm.load())]
+    assert [bib.key for bib in merged] \
+        == [bib.key for bib in sorted(bm.loadfile(u.ROOT+'examples/sample.bib')
+                                      + new)]
+
+
 def test_merge_base(bibs):
     merged = bm.merge(new=[bibs['hunter']], base=[bibs['stodden']])
     assert len(merged) == 2
@@ -595,6 +1513,173 @@ def test_merge_duplicate_title_add(bibs, mock_init_sample, mock_input):
     assert bibs['no_oliphant'] in loaded_bibs
 
 
+@pytest.mark.parametrize('mock_input', [['']], indirect=True)
+def test_merge_similar_title_ignore(capfd, entries, mock_init_sample,
+                                    mock_input):
+    similar = bm.Bib(entries['oliphant_dup'].replace(
+        'Oliphant2006numpy', 'Oliphant2006numpyGuide'))
+    bm.merge(new=[similar])
+    captured = capfd.readouterr()
+    assert "Possible duplicate, similar title but keys differ" in captured.out
+    assert 'Oliphant2006numpyGuide' not in [bib.key for bib in bm.load()]
+
+
+@pytest.mark.parametrize('mock_input', [['a']], indirect=True)
+def test_merge_similar_title_add(entries, mock_init_sample, mock_input):
+    similar = bm.Bib(entries['oliphant_dup'].replace(
+        'Oliphant2006numpy', 'Oliphant2006numpyGuide'))
+    bm.merge(new=[similar])
+    assert 'Oliphant2006numpyGuide' in [bib.key for bib in bm.load()]
+
+
+def test_merge_titles_index(entries, mock_init_sample):
+    assert bib_manager.read_index('titles') is None
+    bm.merge(new=[bm.Bib(entries['stodden'])])
+    index = bib_manager.read_index('titles')
+    assert len(index['signatures']) == 18
+    assert 'StoddenEtal2009ciseRRlegal' in index['signatures']
+    # The index is outdated once the database changes:
+    bm.save(bm.load()[1:])
+    assert bib_manager.read_index('titles') is None
+
+
+def test_read_index_same_size_rewrite(mock_init_sample):
+    bibs = bm.load()
+    bm.save(bibs)
+    bib_manager.write_index('keys', {'Oliphant2006numpy': 0})
+    assert bib_manager.read_index('keys') == {'Oliphant2006numpy': 0}
+    # Same size and modification time, different content:
+    stat = os.stat(u.BM_DATABASE())
+    oliphant = [bib.key for bib in bibs].index('Oliphant2006numpy')
+    bibs[oliphant].update_key('Oliphant2006numpz')
+    bm.save(bibs)
+    os.utime(u.BM_DATABASE(), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.path.getsize(u.BM_DATABASE()) == stat.st_size
+    assert bib_manager.read_index('keys') is None
+
+
+def test_write_index_separate_files(mock_init_sample):
+    bib_manager.write_index('keys', {})
+    bib_manager.write_index('years', {})
+    assert set(os.listdir(u.BM_INDICES())) == {'keys.pickle', 'years.pickle'}
+    mtime = os.stat(u.BM_INDICES() + 'years.pickle').st_mtime_ns
+    bib_manager.write_index('keys', {'Oliphant2006numpy': 0})
+    assert os.stat(u.BM_INDICES() + 'years.pickle').st_mtime_ns == mtime
+    bib_manager.loaded_indices.clear()
+    assert bib_manager.read_index('keys') == {'Oliphant2006numpy': 0}
+    assert bib_manager.read_index('years') == {}
+
+
+def test_merge_report(entries, mock_init_sample):
+    report = u.HOME + 'conflicts.json'
+    new = [bm.Bib(entries['oliphant_dup']), bm.Bib(entries['no_oliphant']),
+           bm.Bib(entries['stodden'])]
+    # No prompt, conflicts are left unresolved:
+    bm.merge(new=new, take='ask', report=report)
+    loaded_bibs = bm.load()
+    assert len(loaded_bibs) == 18
+    assert 'StoddenEtal2009ciseRRlegal' in [bib.key for bib in loaded_bibs]
+    with open(report) as f:
+        content = json.load(f)
+    assert content['version'] == bibm.__version__
+    conflicts = content['conflicts']
+    assert [conflict['kind'] for conflict in conflicts] == ['key', 'title']
+    assert conflicts[0]['key'] == 'Oliphant2006numpy'
+    assert conflicts[0]['new'] == [entries['oliphant_dup']]
+    assert conflicts[1]['new'] == [entries['no_oliphant']]
+
+
+def test_merge_report_duplicates(entries, mock_init_sample):
+    report = u.HOME + 'conflicts.json'
+    bibfile = u.HOME + 'new.bib'
+    with open(bibfile, 'w') as f:
+        f.write(entries['beaulieu_apj'] + '\n\n'
+                + entries['beaulieu_apj'].replace('BeaulieuEtal2011', 'B2011'))
+    bm.merge(bibfile, report=report)
+    with open(report) as f:
+        conflicts = json.load(f)['conflicts']
+    assert [conflict['kind'] for conflict in conflicts] == ['duplicates']
+    assert conflicts[0]['field'] == 'doi/bibcode/eprint'
+    assert len(conflicts[0]['new']) == 2
+
+
+@pytest.mark.parametrize('mock_input', [['a', 'Oliphant2006numpyb']],
+    indirect=True)
+def test_resolve(entries, mock_init_sample, mock_input):
+    report = u.HOME + 'conflicts.json'
+    new = [bm.Bib(entries['oliphant_dup']), bm.Bib(entries['no_oliphant'])]
+    bm.merge(new=new, take='ask', report=report)
+    assert len(bm.load()) == 17
+    assert bm.resolve(report) == 2
+    keys = [bib.key for bib in bm.load()]
+    assert len(keys) == 19
+    assert 'Oliphant2006numpyb' in keys
+    assert 'NoOliphant2020' in keys
+
+
+@pytest.mark.parametrize('mock_input', [['', '2']], indirect=True)
+def test_resolve_duplicates_taken_key(entries, mock_init_sample, mock_input):
+    # The first duplicate takes the key of an unrelated database entry:
+    report = u.HOME + 'conflicts.json'
+    bibfile = u.HOME + 'new.bib'
+    key = 'StoddenEtal2009ciseRRlegal'
+    stodden = entries['stodden'].replace(
+        "publisher={AIP Publishing}",
+        "publisher={AIP Publishing},\n  doi = {10.1109/MCSE.2009.19}")
+    with open(bibfile, 'w') as f:
+        f.write(stodden.replace(key, 'Oliphant2006numpy') + '\n\n'
+                + stodden.replace(key, 'ZStodden2009'))
+    bm.merge(bibfile, take='ask', report=report)
+    oliphant = repr(bm.find(key='Oliphant2006numpy'))
+    assert bm.resolve(report) == 2
+    # Take the second duplicate, ignore the key conflict:
+    assert repr(bm.find(key='Oliphant2006numpy')) == oliphant
+    assert bm.find(key='ZStodden2009') is not None
+    assert len(bm.load()) == 18
+
+
+def test_resolve_skip(capfd, entries, mock_init_sample):
+    report = u.HOME + 'conflicts.json'
+    bm.merge(new=[bm.Bib(entries['oliphant_dup'])], take='ask', report=report)
+    bm.save([bib for bib in bm.load() if bib.key != 'Oliphant2006numpy'])
+    assert bm.resolve(report) == 0
+    captured = capfd.readouterr()
+    assert "Skipping key conflict, entry 'Oliphant2006numpy' is no longer " \
+           "in the database." in captured.out
+    assert len(bm.load()) == 16
+
+
+def test_near_duplicates(entries):
+    bibs = bm.loadfile(u.ROOT+'examples/sample.bib')
+    index = bib_manager.lsh_index(bibs)
+    # Same title in different case and punctuation, plus a part:
+    similar = bm.Bib(entries['oliphant_dup'].replace(
+        'Oliphant2006numpy', 'Oliphant2006numpyGuide'))
+    assert bib_manager.near_duplicates(index, similar) == ['Oliphant2006numpy']
+    assert bib_manager.near_duplicates(index, bm.Bib(entries['stodden'])) == []
+    # The entry itself is not a near duplicate:
+    assert bib_manager.near_duplicates(index, bibs[0]) == []
+
+
+def test_lsh_update(entries):
+    bibs = bm.loadfile(u.ROOT+'examples/sample.bib')
+    index = bib_manager.lsh_index(bibs)
+    # Update an entry and remove another, buckets drop the old keys:
+    renamed = bm.Bib(entries['oliphant_dup'].replace(
+        'Oliphant2006numpy', 'Oliphant2006numpyGuide').replace(
+        '{Numpy}: A guide to {NumPy}', 'The {NumPy} array'))
+    bib_manager.lsh_update(index, [renamed], ['Oliphant2006numpy'])
+    expected = bib_manager.lsh_index(
+        [bib for bib in bibs if bib.key != 'Oliphant2006numpy'] + [renamed])
+    assert index['buckets'] == expected['buckets']
+    assert index['signatures'].keys() == expected['signatures'].keys()
+    assert not any('Oliphant2006numpy' in keys
+                   for keys in index['buckets'].values())
+    # Removing all entries empties the index:
+    bib_manager.lsh_update(index, remove=list(index['signatures']))
+    assert index == {'signatures':{}, 'buckets':{}}
+
+
 def test_init_from_scratch(mock_home):
     shutil.rmtree(u.HOME, ignore_errors=True)
     bm.init(bibfile=None)
@@ -670,6 +1755,36 @@ def test_search_author_first(mock_init_sample):
     assert 'Oliphant2006numpy'  in keys
 
 
+def test_search_author_index(entries, mock_init_sample):
+    assert bib_manager.read_index('authors') is None
+    assert bm.search(authors="Stodden") == []
+    index = bib_manager.read_index('authors')
+    assert 'cubillos' in index['authors']
+    # Updated on merge:
+    bm.merge(new=[bm.Bib(entries['stodden'])])
+    index = bib_manager.read_index('authors')
+    assert list(index['first_authors']['stodden']) \
+        == ['StoddenEtal2009ciseRRlegal']
+    matches = bm.search(authors="^Stodden, V")
+    assert [m.key for m in matches] == ['StoddenEtal2009ciseRRlegal']
+
+
+def test_author_candidates(bibs):
+    index = bib_manager.author_index([bibs['beaulieu_apj'], bibs['hunter']])
+    assert bib_manager.author_candidates(index, ['Tinetti']) \
+        == {'BeaulieuEtal2011apjGJ436bMethane'}
+    assert bib_manager.author_candidates(index, ['^Tinetti']) == set()
+    assert bib_manager.author_candidates(index, ['Tinetti, G']) \
+        == {'BeaulieuEtal2011apjGJ436bMethane'}
+    assert bib_manager.author_candidates(index, ['Tinetti, K']) == set()
+    assert bib_manager.author_candidates(index, ['^hunter', 'J. D. Hunter']) \
+        == {'Hunter2007ieeeMatplotlib'}
+    # Removed entries:
+    bib_manager.author_index_update(index, remove=['Hunter2007ieeeMatplotlib'])
+    assert 'hunter' not in index['authors']
+    assert bib_manager.author_candidates(index, ['Hunter']) == set()
+
+
 def test_search_author_multiple(mock_init_sample):
     # Multiple-author querries act with AND logic:
     matches = bm.search(authors=["oliphant, t", "jones, e"])
@@ -694,6 +1809,47 @@ def test_search_title_multiple(mock_init_sample):
     assert 'ShowmanEtal2009apjRadGCM' in keys
 
 
+def test_search_title_partial_words(mock_init_sample):
+    # Keywords match anywhere in the title, not only whole words:
+    matches = bm.search(title=['D 2094', 'circul'])
+    assert [m.key for m in matches] == ['ShowmanEtal2009apjRadGCM']
+    assert bm.search(title='HD 209458bx') == []
+
+
+def test_search_title_index(entries, mock_init_sample):
+    assert bib_manager.read_index('title_words') is None
+    matches = bm.search(title='legal')
+    assert matches == []
+    index = bib_manager.read_index('title_words')
+    assert 'numpy' in index['words']
+    # Updated on merge:
+    bm.merge(new=[bm.Bib(entries['stodden'])])
+    index = bib_manager.read_index('title_words')
+    assert index['words']['legal'] == {'StoddenEtal2009ciseRRlegal'}
+    matches = bm.search(title='legal')
+    assert [m.key for m in matches] == ['StoddenEtal2009ciseRRlegal']
+
+
+def test_search_title_sqlite(mock_init_sqlite):
+    matches = bm.search(title=['HD 209458b', 'atmospheric circulation'])
+    assert [m.key for m in matches] == ['ShowmanEtal2009apjRadGCM']
+    matches = bm.search(title='HD 209458b', year=2010)
+    assert matches == []
+
+
+def test_title_candidates():
+    bibs = bm.loadfile(u.ROOT+'examples/sample.bib')
+    index = bib_manager.title_index(bibs)
+    # Inner words match whole title words, outer words parts of them:
+    candidates = bib_manager.title_candidates(index, ['HD 209458b'])
+    assert 'ShowmanEtal2009apjRadGCM' in candidates
+    assert bib_manager.title_candidates(index, ['HD 209458 b']) == set()
+    assert bib_manager.title_candidates(index, ['numpy', 'guide']) \
+        == {'Oliphant2006numpy'}
+    # No words, no filtering:
+    assert bib_manager.title_candidates(index, [': ']) is None
+
+
 def test_search_year_specific(mock_init_sample):
     matches = bm.search(authors="cubillos, p", year=2016)
     assert len(matches) == 1
@@ -701,6 +1857,15 @@ def test_search_year_specific(mock_init_sample):
     assert 'Cubillos2016phdThesis' in keys
 
 
+def test_year_range():
+    assert bib_manager.year_range(2010) == (2010, 2010)
+    assert bib_manager.year_range((2010, 2012)) == (2010, 2012)
+    assert bib_manager.year_range([2010, 2012]) == (2010, 2012)
+    assert bib_manager.year_range(np.array([2010, 2012])) == (2010, 2012)
+    # Not a sequence of years:
+    assert bib_manager.year_range('2010') == ('2010', '2010')
+
+
 def test_search_year_range(mock_init_sample):
     matches = bm.search(authors="cubillos, p", year=[2013,2016])
     assert len(matches) == 2
@@ -709,6 +1874,123 @@ def test_search_year_range(mock_init_sample):
     assert 'Cubillos2016phdThesis' in keys
 
 
+def test_search_year_index(entries, mock_init_sample):
+    matches = bm.search(year=[2009, 2009])
+    years = bib_manager.read_index('years')
+    assert list(years['years']) == sorted(years['years'])
+    # Updated on merge:
+    bm.merge(new=[bm.Bib(entries['stodden'])])
+    keys = [m.key for m in bm.search(year=2009)]
+    assert keys == [m.key for m in matches] + ['StoddenEtal2009ciseRRlegal']
+    years = bib_manager.read_index('years')
+    assert 'StoddenEtal2009ciseRRlegal' in years['keys']
+
+
+def test_year_bounds(bibs):
+    index = bib_manager.year_index(
+        [bibs['beaulieu_apj'], bibs['hunter'], bibs['stodden']])
+    assert list(index['years']) == [2007, 2009, 2011]
+    assert list(index['keys']) == ['Hunter2007ieeeMatplotlib',
+        'StoddenEtal2009ciseRRlegal', 'BeaulieuEtal2011apjGJ436bMethane']
+    assert bib_manager.year_bounds(index, 2009) == (1, 2)
+    assert bib_manager.year_bounds(index, [2008, 2011]) == (1, 3)
+    assert bib_manager.year_bounds(index, [2012, 2020]) == (3, 3)
+
+
+def test_search_plan(mock_init_sample, monkeypatch):
+    # Few candidates by key, the title keywords are checked directly:
+    def title_candidates(index, keywords):
+        raise AssertionError('title index used')
+    monkeypatch.setattr(bib_manager, 'title_candidates', title_candidates)
+    matches = bm.search(key='ShowmanEtal2009apjRadGCM', year=2009,
+        title='HD 209458b', authors='Showman')
+    assert [m.key for m in matches] == ['ShowmanEtal2009apjRadGCM']
+    assert bm.search(key='ShowmanEtal2009apjRadGCM', title='Spitzer') == []
+
+
+def test_search_no_load(mock_init_sample, monkeypatch):
+    queries = [dict(authors='Cubillos'), dict(year=[2010, 2012]),
+        dict(title='Spitzer', year=2013), dict(key=['Oliphant2006numpy',
+        'non_existing_key']), dict(bibcode='2013A&A...558A..33A')]
+    bm.find(key='Oliphant2006numpy')
+    matches = [bm.search(**query) for query in queries]
+    # Indices are up to date, matches taken from the exported bibfile:
+    monkeypatch.setattr(bib_manager, 'load', None)
+    for query, expected in zip(queries, matches):
+        assert len(expected) > 0
+        assert [repr(bib) for bib in bm.search(**query)] \
+            == [repr(bib) for bib in expected]
+
+
+def test_search_no_load_outdated_bibfile(mock_init_sample):
+    bm.search(authors='Cubillos')
+    bib = bm.find(key='CubillosEtal2017apjRednoise')
+    bib.pdf = 'file.pdf'
+    bm.upsert([bib])
+    matches = bm.search(authors='Cubillos')
+    assert [m.pdf for m in matches if m.key == bib.key] == ['file.pdf']
+
+
+def test_search_empty_lists(mock_init_sample):
+    assert len(bm.search(authors=[], title=[])) == 17
+    assert bm.search(key=[]) == []
+
+
+def test_ranked_search(mock_init_sample):
+    matches = bm.ranked_search('NumPy')
+    assert [m.key for m in matches] == \
+        ['Oliphant2006numpy', 'vanderWaltEtal2011numpy']
+    matches = bm.ranked_search('numpy', nresults=1)
+    assert [m.key for m in matches] == ['Oliphant2006numpy']
+    assert bm.ranked_search('hot jupiter')[0].key == \
+        'BeaulieuEtal2010arxivGJ436b'
+    assert bm.ranked_search('unlisted') == []
+    assert bm.ranked_search(': ') == []
+
+
+def test_ranked_search_index(entries, mock_init_sample):
+    assert bib_manager.read_index('terms') is None
+    assert bm.ranked_search('legal') == []
+    index = bib_manager.read_index('terms')
+    assert 'numpy' in index['postings']
+    # Updated on merge:
+    bm.merge(new=[bm.Bib(entries['stodden'])])
+    index = bib_manager.read_index('terms')
+    assert index['total'] == sum(index['lengths'])
+    matches = bm.ranked_search('legal')
+    assert [m.key for m in matches] == ['StoddenEtal2009ciseRRlegal']
+
+
+def test_ranked_search_no_load(mock_init_sample, monkeypatch):
+    bm.find(key='Oliphant2006numpy')
+    matches = bm.ranked_search('numpy')
+    monkeypatch.setattr(bib_manager, 'load', None)
+    assert [repr(bib) for bib in bm.ranked_search('numpy')] \
+        == [repr(bib) for bib in matches]
+
+
+def test_ranked_search_sqlite(mock_init_sqlite):
+    matches = bm.ranked_search('atmospheric circulation')
+    assert [m.key for m in matches] == ['ShowmanEtal2009apjRadGCM']
+
+
+def test_term_index_update(entries):
+    oliphant = bm.Bib(entries['oliphant_dup'])
+    index = bib_manager.term_index([oliphant, bm.Bib(entries['hunter'])])
+    assert set(index['docs']) == \
+        {'Oliphant2006numpy', 'Hunter2007ieeeMatplotlib'}
+    total = index['total']
+    index = bib_manager.term_index_update(index, remove=['Oliphant2006numpy'])
+    assert 'numpy' not in index['postings']
+    assert list(index['docs']) == ['Hunter2007ieeeMatplotlib']
+    assert index['total'] == sum(index['lengths']) < total
+    index = bib_manager.term_index_update(index, [oliphant])
+    assert index['total'] == total
+    scores = bib_manager.bm25_scores(index, ['numpy'])
+    assert [doc for doc, score in enumerate(scores) if score > 0] == \
+        [index['docs']['Oliphant2006numpy']]
+
+
 def test_search_bibcode(mock_init_sample):
     matches = bm.search(bibcode="2013A&A...558A..33A")
     assert len(matches) == 1
@@ -733,6 +2015,37 @@ def test_search_bibcode_multiple(mock_init_sample):
     assert 'BurbidgeEtal1957rvmpStellarElementSynthesis' in keys
 
 
+def test_search_bibcode_shared(mock_init_sample):
+    bibcode = '2013A&A...558A..33A'
+    astropy = bm.find(bibcode=bibcode)
+    copy = bm.Bib(astropy.content.replace(astropy.key, 'Astropy2013copy'))
+    bibs = bib_manager.sort_bibs(bm.load() + [copy])
+    bm.save(bibs)
+    matches = bm.search(bibcode=bibcode)
+    assert sorted(m.key for m in matches) \
+        == ['Astropy2013copy', 'Astropycollab2013aaAstropy']
+    ids = bib_manager.read_index('ids')
+    assert sorted(ids['bibcodes'][bibcode]) \
+        == ['Astropy2013copy', 'Astropycollab2013aaAstropy']
+    # The first entry in the database:
+    first = [bib.key for bib in bibs if bib.bibcode == bibcode][0]
+    assert bm.find(bibcode=bibcode).key == first
+
+
+def test_entry_ids_update_shared_bibcode(mock_init_sample):
+    bibcode = '2013A&A...558A..33A'
+    astropy = bm.find(bibcode=bibcode)
+    copy = bm.Bib(astropy.content.replace(astropy.key, 'Astropy2013copy'))
+    ids = bib_manager.entry_ids([astropy, copy])
+    assert ids['bibcodes'][bibcode] == [astropy.key, 'Astropy2013copy']
+    bib_manager.entry_ids_update(ids, remove=[astropy.key])
+    assert ids['bibcodes'][bibcode] == ['Astropy2013copy']
+    bib_manager.entry_ids_update(ids, [copy])
+    assert ids['bibcodes'][bibcode] == ['Astropy2013copy']
+    bib_manager.entry_ids_update(ids, remove=['Astropy2013copy'])
+    assert ids == {'keys':{}, 'bibcodes':{}}
+
+
 def test_search_key(mock_init_sample):
     matches = bm.search(key="BurbidgeEtal1957rvmpStellarElementSynthesis")
     assert len(matches) == 1
@@ -750,6 +2063,24 @@ def test_search_key_multiple(mock_init_sample):
     assert 'BurbidgeEtal1957rvmpStellarElementSynthesis' in keys
 
 
+def test_find_sqlite(mock_init_sqlite):
+    bib = bm.find(key='AASteamHendrickson2018aastex62')
+    assert bib.key == 'AASteamHendrickson2018aastex62'
+    bib = bm.find(bibcode='2013A&A...558A..33A')
+    assert bib.key == 'Astropycollab2013aaAstropy'
+    assert bm.find(key='non_existing_key') is None
+
+
+def test_search_sqlite(mock_init_sqlite):
+    matches = bm.search(authors="cubillos, p", year=[2013,2016])
+    keys = [m.key for m in matches]
+    assert keys == ['CubillosEtal2013apjWASP8b', 'Cubillos2016phdThesis']
+    matches = bm.search(authors="cubillos, p", year=2016)
+    assert [m.key for m in matches] == ['Cubillos2016phdThesis']
+    matches = bm.search(bibcode="2013A%26A...558A..33A")
+    assert [m.key for m in matches] == ['Astropycollab2013aaAstropy']
+
+
 @pytest.mark.parametrize('mock_prompt_session',
      [['key: BurbidgeEtal1957rvmpStellarElementSynthesis']], indirect=True)
 def test_prompt_search_kw1(capsys, mock_init_sample, mock_prompt_session):
@@ -90,6 +90,8 @@ def test_cli_reset_config(capsys, mock_init_sample):
     assert set(os.listdir(u.HOME)) == set([
         "bm_database.pickle",
         "bm_bibliography.bib",
+        "bm_bibliography.index",
+        "bm_offsets.pickle",
         "config",
         "examples",
         "pdf",
@@ -107,6 +109,8 @@ def test_cli_reset_keep_database(capsys, mock_init_sample):
     assert set(os.listdir(u.HOME)) == set([
         "bm_database.pickle",
         "bm_bibliography.bib",
+        "bm_bibliography.index",
+        "bm_offsets.pickle",
         "config",
         "examples",
         "pdf",
@@ -134,6 +138,16 @@ def test_cli_merge_default(capsys, mock_init):
                   f"Merged BibTeX file '{bibfile}' into bibmanager database.\n"
 
 
+def test_cli_merge_jobs(capsys, mock_init):
+    bibfile = u.HOME+"examples/sample.bib"
+    sys.argv = f"bibm merge {bibfile} --jobs 2".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out  == "\nMerged 17 new entries.\n\n" \
+                  f"Merged BibTeX file '{bibfile}' into bibmanager database.\n"
+    assert len(bm.load()) == 17
+
+
 def test_cli_merge_error(capsys, mock_init):
     # Simulate user input:
     sys.argv = f"bibm merge fake_file.bib".split()
@@ -143,6 +157,39 @@ def test_cli_merge_error(capsys, mock_init):
            == "\nError: Input BibTeX file 'fake_file.bib' does not exist.\n"
 
 
+def test_cli_merge_report(capsys, entries, mock_init_sample):
+    bibfile = u.HOME + "new.bib"
+    report = u.HOME + "conflicts.json"
+    with open(bibfile, 'w') as f:
+        f.write(entries['oliphant_dup'] + '\n\n' + entries['stodden'])
+    sys.argv = f"bibm merge {bibfile} ask --report {report}".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out  == "\nMerged 1 new entries.\n\n" \
+        f"Merged BibTeX file '{bibfile}' into bibmanager database.\n" \
+        f"Reported 1 unresolved conflict into '{report}'.\n"
+    assert len(bm.load()) == 18
+
+
+@pytest.mark.parametrize('mock_input', [['n']], indirect=True)
+def test_cli_resolve(capsys, entries, mock_init_sample, mock_input):
+    report = u.HOME + "conflicts.json"
+    bm.merge(new=[bm.Bib(entries['oliphant_dup'])], take='ask', report=report)
+    sys.argv = f"bibm resolve {report}".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out.endswith(f"\nResolved 1 conflict from '{report}'.\n")
+    assert bm.Bib(entries['oliphant_dup']) in bm.load()
+
+
+def test_cli_resolve_error(capsys, mock_init):
+    sys.argv = "bibm resolve fake_report.json".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out \
+           == "\nError: Input report file 'fake_report.json' does not exist.\n"
+
+
 # cli_edit() and cli_add() are direct, calls (no need for testing).
 
 @pytest.mark.parametrize('mock_prompt_session', [['']], indirect=True)
@@ -167,6 +214,31 @@ def test_cli_search_year(capsys, mock_init_sample, mock_prompt_session):
     assert captured.out == "(Press 'tab' for autocomplete)\n\n"
 
 
+@pytest.mark.parametrize('mock_prompt_session',
+    [['numpy']], indirect=True)
+def test_cli_search_ranked(capsys, mock_init_sample, mock_prompt_session):
+    sys.argv = "bibm search -r".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out == """(Enter words to rank entries by relevance)\n\n
+Title: Numpy: A guide to NumPy, 2006
+Authors: Oliphant, Travis
+key: Oliphant2006numpy
+
+Title: The NumPy Array: A Structure for Efficient Numerical Computation, 2011
+Authors: van der Walt, St{\\'{e}}fan; et al.
+key: vanderWaltEtal2011numpy\n"""
+
+
+@pytest.mark.parametrize('mock_prompt_session',
+    [['']], indirect=True)
+def test_cli_search_ranked_null(capsys, mock_init_sample, mock_prompt_session):
+    sys.argv = "bibm search -r".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out == "(Enter words to rank entries by relevance)\n\n"
+
+
 @pytest.mark.parametrize('mock_prompt_session',
     [['year:1984a']], indirect=True)
 def test_cli_search_year_invalid(capsys, mock_init_sample, mock_prompt_session):
@@ -432,6 +504,80 @@ def test_cli_export_invalid_extension(capsys, mock_init_sample):
         "\nError: Invalid file extension ('.tex'), must be '.bib' or '.bbl'.\n"
 
 
+def test_cli_compact(capsys, bibs, mock_init_sample):
+    bm.upsert([bibs['beaulieu_apj']])
+    sys.argv = "bibm compact".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out == "Compacted the bibmanager database.\n"
+    assert not os.path.isfile(u.BM_JOURNAL())
+    assert len(bm.load()) == 18
+
+
+def test_cli_dedup_none(capsys, mock_init_sample):
+    sys.argv = "bibm dedup".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out \
+        == "No duplicate entries found in the bibmanager database.\n"
+
+
+def test_cli_dedup(capsys, entries, mock_init):
+    bm.save([bm.Bib(entries[key])
+             for key in ['beaulieu_arxiv', 'beaulieu_apj', 'hunter']])
+    sys.argv = "bibm dedup".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out == (
+        "Found 1 cluster of duplicate entries:\n\n"
+        "Cluster 1:\n"
+        "  BeaulieuEtal2010arxivGJ436b\n"
+        "  BeaulieuEtal2011apjGJ436bMethane\n")
+    assert len(bm.load()) == 3
+
+
+def test_cli_dedup_resolve(capsys, entries, mock_init):
+    bm.save([bm.Bib(entries[key])
+             for key in ['beaulieu_arxiv', 'beaulieu_apj', 'hunter']])
+    sys.argv = "bibm dedup --resolve".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out == (
+        "Found 1 cluster of duplicate entries:\n\n"
+        "Cluster 1:\n"
+        "  BeaulieuEtal2011apjGJ436bMethane  (kept)\n"
+        "  BeaulieuEtal2010arxivGJ436b\n"
+        "\nRemoved 1 duplicate entry.\n")
+    assert len(bm.load()) == 2
+
+
+def test_cli_dedup_resolve_titles(capsys, entries, mock_init):
+    title = bm.Bib(entries['stodden'].replace(
+        "StoddenEtal2009ciseRRlegal", "Stodden2009"))
+    bm.save([bm.Bib(entries['stodden']), title])
+    sys.argv = "bibm dedup --resolve".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out == (
+        "Found 1 cluster of duplicate entries:\n\n"
+        "Cluster 1:\n"
+        "  StoddenEtal2009ciseRRlegal\n"
+        "  Stodden2009\n"
+        "  (unresolved, linked only through the titles)\n"
+        "\nRemoved 0 duplicate entries.\n")
+    assert len(bm.load()) == 2
+    sys.argv = "bibm dedup --resolve --titles".split()
+    cli.main()
+    captured = capsys.readouterr()
+    assert captured.out == (
+        "Found 1 cluster of duplicate entries:\n\n"
+        "Cluster 1:\n"
+        "  StoddenEtal2009ciseRRlegal  (kept)\n"
+        "  Stodden2009\n"
+        "\nRemoved 1 duplicate entry.\n")
+    assert len(bm.load()) == 1
+
+
 def test_cli_config_display(capsys, mock_init_sample):
     sys.argv = "bibm config".split()
     cli.main()
@@ -445,7 +591,8 @@ def test_cli_config_display(capsys, mock_init_sample):
         "paper        letter\n"
         "ads_token    None\n"
         "ads_display  20\n"
-       f"home         {u.HOME}\n")
+       f"home         {u.HOME}\n"
+        "storage      pickle\n")
 
 def test_cli_config_help(capsys, mock_init_sample):
     sys.argv = "bibm config paper".split()
@@ -472,7 +619,7 @@ def test_cli_config_invalid_param(capsys, mock_init_sample):
     assert captured.out == """
 Error: 'invalid_param' is not a valid bibmanager config parameter.
 The available parameters are:
-  ['style', 'text_editor', 'paper', 'ads_token', 'ads_display', 'home']\n"""
+  ['style', 'text_editor', 'paper', 'ads_token', 'ads_display', 'home', 'storage']\n"""
 
 
 def test_cli_config_invalid_value(capsys, mock_init_sample):
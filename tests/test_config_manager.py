@@ -86,6 +86,18 @@ The 'home' parameter sets the home directory for the Bibmanager database.
 The current directory is '{u.HOME}'.\n"""
 
 
+def test_help_storage(capsys, mock_init):
+    cm.help("storage")
+    captured = capsys.readouterr()
+    assert captured.out == """
+The 'storage' parameter sets the storage backend for the Bibmanager database.
+Available options are 'pickle' (a single pickle file, rewritten on each
+change) or 'sqlite' (an indexed SQLite database, with single-entry
+reads and writes).
+
+The current storage backend is 'pickle'.\n"""
+
+
 def test_help_raise(mock_init):
     # Note that match only matches until the linebreak character.
     with pytest.raises(ValueError,
@@ -105,7 +117,8 @@ def test_display_all(capsys, mock_init):
         "paper        letter\n"
         "ads_token    None\n"
         "ads_display  20\n"
-       f"home         {u.HOME}\n")
+       f"home         {u.HOME}\n"
+        "storage      pickle\n")
 
 
 def test_display_each(capsys, mock_init):
@@ -214,7 +227,12 @@ def test_set_home_success(capsys, tmp_path, mock_init_sample):
     assert cm.get('home') == new_home + '/'
     # 'constants' now point to new home:
     assert u.BM_DATABASE() == f'{new_home}/bm_database.pickle'
+    assert u.BM_JOURNAL() == f'{new_home}/bm_database.journal'
     assert u.BM_BIBFILE() == f'{new_home}/bm_bibliography.bib'
+    assert u.BM_BIBFILE_INDEX() == f'{new_home}/bm_bibliography.index'
+    assert u.BM_OFFSETS() == f'{new_home}/bm_offsets.pickle'
+    assert u.BM_PARSE_CACHE() == f'{new_home}/bm_parse_cache.pickle'
+    assert u.BM_INDICES() == f'{new_home}/bm_indices/'
     assert u.BM_TMP_BIB() == f'{new_home}/tmp_bibliography.bib'
     assert u.BM_CACHE() == f'{new_home}/cached_ads_query.pickle'
     assert u.BM_HISTORY_SEARCH() == f'{new_home}/history_search'
@@ -226,7 +244,8 @@ def test_set_home_success(capsys, tmp_path, mock_init_sample):
     assert set(os.listdir(u.HOME)) == set(["config", "examples", "pdf"])
     # These files have been moved/created:
     assert set(os.listdir(str(new_home))) == \
-        set(['pdf', 'bm_bibliography.bib', 'bm_database.pickle'])
+        set(['pdf', 'bm_bibliography.bib', 'bm_bibliography.index',
+             'bm_offsets.pickle', 'bm_database.pickle'])
 
 
 def test_set_home_pdf_success(tmp_path, mock_init_sample):
@@ -304,7 +323,29 @@ def test_set_home_and_edit(tmp_path, mock_init, bibs, reqs):
     assert set(os.listdir(u.HOME)) == set(["config", "examples", "pdf"])
     # These files have been moved/created:
     assert set(os.listdir(str(new_home))) == \
-        set(['pdf', 'bm_bibliography.bib', 'bm_database.pickle'])
+        set(['pdf', 'bm_bibliography.bib', 'bm_bibliography.index',
+             'bm_database.pickle', 'bm_database.journal',
+             'bm_indices'])
+
+
+def test_set_storage_sqlite(mock_init_sample):
+    bibs = bm.load()
+    cm.set('storage', 'sqlite')
+    assert cm.get('storage') == 'sqlite'
+    assert u.BM_DATABASE() == u.HOME + 'bm_database.sqlite'
+    assert 'bm_database.sqlite' in os.listdir(u.HOME)
+    assert 'bm_database.pickle' not in os.listdir(u.HOME)
+    assert bm.load() == bibs
+    # And back:
+    cm.set('storage', 'pickle')
+    assert 'bm_database.sqlite' not in os.listdir(u.HOME)
+    assert bm.load() == bibs
+
+
+def test_set_storage_raises(mock_init):
+    with pytest.raises(ValueError,
+            match="The storage value must be either 'pickle' or 'sqlite'."):
+        cm.set('storage', 'json')
 
 
 def test_set_home_no_parent(mock_init_sample):
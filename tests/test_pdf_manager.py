@@ -144,6 +144,7 @@ def test_set_pdf_out_new(mock_init_sample, name):
     assert filename in os.listdir(u.BM_PDF())
     bib = bm.find(key=bib.key)
     assert bib.pdf == filename
+    assert bm.loadfile(u.BM_BIBFILE()) == bm.load()
 
 
 @pytest.mark.parametrize('name', ['new.pdf', 'file.pdf', None])
@@ -1,10 +1,27 @@
 # Copyright (c) 2018-2020 Patricio Cubillos.
 # bibmanager is open-source software under the MIT license (see LICENSE).
 
+import re
 import numpy as np
 import pytest
 
 import bibmanager.utils as u
+import bibmanager.bib_manager as bm
+
+
+def legacy_purify(name, german=False):
+    # purify() implementation before the single-pass regex (reference,
+    # also timed by benchmarks/bench_purify.py):
+    if german:
+        for pattern in ["a", "o", "u"]:
+            name = re.sub(fr'\\"{pattern}', pattern+"e", name)
+    name = re.sub(r"\\(\"|\^|`|\.|'|~)", "", name)
+    name = re.sub(r"\\(c |u |H |v |d |b |t )", "",  name)
+    name = re.sub(r"\\(c{|u{|H{|v{|d{|b{|t{)", "{", name)
+    for pattern in ["o", "O", "l", "L", "i", "j",
+                    "aa", "AA", "AE", "oe", "OE", "ss"]:
+        name = re.sub(fr"\\{pattern}", pattern, name)
+    return re.sub("({|})", "", name).strip().lower()
 
 
 def test_ordinal():
@@ -35,6 +52,42 @@ def test_nest():
                   2,2,2,1,1,1,1,1,1,1,1,0]))
 
 
+def test_nest_unicode():
+    np.testing.assert_array_equal(u.nest("{Pérez}, {Ñ}ü}"),
+        np.array([0,1,1,1,1,1,1,0,0,0,1,1,0,0]))
+    np.testing.assert_array_equal(u.nest("{\u00e9\U0001f600}{"),
+        np.array([0,1,1,1,0]))
+
+
+def test_parse_name_nested():
+    name = "{Hunter}, J. D."
+    assert u.parse_name(name, u.nest(name)+2) == u.parse_name(name)
+    assert u.parse_name(name, nested=list(u.nest(name))) == u.parse_name(name)
+
+
+def test_name_cache_info():
+    u.set_name_cache(16)
+    u.purify('Schr{\\"o}dinger')
+    u.purify('Schr{\\"o}dinger')
+    u.purify('Schr{\\"o}dinger', german=True)
+    info = u.name_cache_info()
+    assert info['purify'].hits == 1
+    assert info['purify'].misses == 2
+    assert info['purify'].maxsize == 16
+    assert set(info) == {'parse_name', 'purify', 'initials'}
+    u.set_name_cache()
+
+
+def test_set_name_cache_disabled():
+    u.set_name_cache(0)
+    assert u.initials('Phill Henry Scott') == 'phs'
+    assert u.initials('Phill Henry Scott') == 'phs'
+    info = u.name_cache_info()['initials']
+    assert info.hits == 0
+    assert info.currsize == 0
+    u.set_name_cache()
+
+
 def test_cond_split1():
     assert u.cond_split("", ",") == [""]
     assert u.cond_split("abcd",      ",") == ["abcd"]
@@ -309,6 +362,25 @@ def test_purify():
     assert u.purify('Schr{\\"o}dinger', german=True) == 'schroedinger'
 
 
+@pytest.mark.parametrize('german', [False, True])
+def test_purify_golden(bibs, german):
+    # Every name part of every author in the sample and test entries,
+    # plus every accent/special-letter rule:
+    entries = bm.loadfile(u.ROOT+'examples/sample.bib') + list(bibs.values())
+    names = [name for bib in entries for author in bib.authors
+             for name in author]
+    for accent in '"^`.\'~cuHvdbt':
+        names += [f"{{\\{accent} a}}b", f"{{\\{accent}{{a}}}}b",
+                  f"\\{accent}a", f" {{\\{accent}o}} "]
+    for letter in ['o', 'O', 'l', 'L', 'i', 'j',
+                   'aa', 'AA', 'AE', 'oe', 'OE', 'ss']:
+        names += [f"X{{\\{letter}}}y", f"\\{letter}x", f"\\{letter} x"]
+    names += ['Schr{\\"o}dinger', 'M{\\"u}ller', 'Sch{\\"a}fer',
+              '\\"Ozel', '{\\ch}', '\\c', '\\', 'Nu\\~{n}ez', '']
+    for name in names:
+        assert u.purify(name, german=german) == legacy_purify(name, german)
+
+
 def test_initials():
     assert u.initials('')                  == ''
     assert u.initials('D.')                == 'd'